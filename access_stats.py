@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from log_retention import load_retention_config, open_access_log_groups, partitions_since
+
+# The detectors log 'Unknown Person'; older rows and tools used 'Unknown'
+UNKNOWN_NAMES = ('Unknown', 'Unknown Person')
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+class AccessStats:
+    """All dashboard aggregates from one indexed pass over a shared read-only connection
+
+    Results are cached for ``ttl_seconds`` per window, so any number of
+    dashboards polling at once cost the writer's database one query per
+    window per TTL.
+    """
+
+    def __init__(self, config=None, ttl_seconds=2.0):
+        self.config = config or load_retention_config()
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conns = []
+        self.attached = None
+        self.cache = {}
+        self.queries = 0
+        self.cache_hits = 0
+
+    def _connections(self, since):
+        """Reuse the read-only connections unless the set of partitions to attach changed"""
+        partitions = [path for _, path in partitions_since(since, self.config)]
+        if not self.conns or partitions != self.attached:
+            for conn in self.conns:
+                conn.close()
+            # More archived months than SQLite can attach at once are split over several connections
+            self.conns = open_access_log_groups(since, self.config)
+            self.attached = partitions
+        return self.conns
+
+    def _cached(self, key, compute):
+        now = time.monotonic()
+        with self.lock:
+            hit = self.cache.get(key)
+            if hit is not None and now - hit[0] < self.ttl_seconds:
+                self.cache_hits += 1
+                return hit[1]
+            if not os.path.exists(self.config["log_db_path"]):
+                return None
+            value = compute()
+            self.queries += 1
+            self.cache[key] = (now, value)
+            return value
+
+    def window(self, since, until=None):
+        """Totals, successes, unknowns, average confidence and per-user breakdown for a time range"""
+        until = until or datetime.max
+        key = ("window", since.strftime(TIME_FORMAT), until.strftime(TIME_FORMAT))
+        stats = self._cached(key, lambda: self._aggregate(since, until))
+        return stats or self._aggregate_rows([])
+
+    def last_hours(self, hours=24):
+        # Keyed by the window length, not its moving start, so repeated calls share the cache
+        key = ("hours", hours)
+        since = datetime.now() - timedelta(hours=hours)
+        stats = self._cached(key, lambda: self._aggregate(since, datetime.max))
+        return stats or self._aggregate_rows([])
+
+    def today(self):
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.window(start, start + timedelta(days=1))
+
+    def recent_activity(self, limit=10):
+        since = datetime.now() - timedelta(days=1)
+        def recent():
+            rows = []
+            for conn in self._connections(since):
+                rows += conn.execute('''
+                    SELECT user_name, success, confidence, access_time
+                    FROM all_access_logs
+                    ORDER BY access_time DESC
+                    LIMIT ?
+                ''', (limit,)).fetchall()
+            return sorted(rows, key=lambda r: r[3], reverse=True)[:limit]
+        rows = self._cached(("recent", limit), recent)
+        return rows or []
+
+    def _aggregate(self, since, until):
+        # One range scan on the access_time index; every aggregate is derived from the grouped rows
+        merged = {}
+        for conn in self._connections(since):
+            for name, count, successes, confidence in conn.execute('''
+                SELECT user_name, COUNT(*), SUM(success), SUM(confidence)
+                FROM all_access_logs
+                WHERE access_time > ? AND access_time < ?
+                GROUP BY user_name
+            ''', (since.strftime(TIME_FORMAT), until.strftime(TIME_FORMAT))):
+                total = merged.setdefault(name, [name, 0, 0, 0.0])
+                total[1] += count
+                total[2] += successes or 0
+                total[3] += confidence or 0
+        return self._aggregate_rows(list(merged.values()))
+
+    @staticmethod
+    def _aggregate_rows(rows):
+        total = sum(r[1] for r in rows)
+        successful = sum(r[2] or 0 for r in rows)
+        confidence_sum = sum(r[3] or 0 for r in rows)
+        return {
+            'total_attempts': total,
+            'successful_attempts': successful,
+            'failed_attempts': total - successful,
+            'unknown_faces': sum(r[1] for r in rows if r[0] in UNKNOWN_NAMES),
+            'success_rate': (successful / total * 100) if total else 0,
+            'avg_confidence': (confidence_sum / total) if total else 0,
+            'per_user': {
+                r[0]: {
+                    'attempts': r[1],
+                    'successful': r[2] or 0,
+                    'avg_confidence': (r[3] or 0) / r[1]
+                }
+                for r in rows
+            }
+        }
+
+    def close(self):
+        with self.lock:
+            for conn in self.conns:
+                conn.close()
+            self.conns = []
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_stats_engine(config=None):
+    """Shared engine per database file, so every caller in a process reuses one connection and cache"""
+    config = config or load_retention_config()
+    with _engines_lock:
+        engine = _engines.get(config["log_db_path"])
+        if engine is None:
+            engine = _engines[config["log_db_path"]] = AccessStats(config)
+        return engine
@@ -0,0 +1,236 @@
+import numpy as np
+import os
+import csv
+import json
+import time
+import argparse
+from gallery import load_gallery_data
+
+MAX_DISTANCE = 1.5   # face_recognition distances between 128-d unit-scale encodings stay below this
+BINS = 3000          # histogram resolution: 0.0005 distance units
+TOLERANCE_RANGE = (0.2, 0.8)  # recommendations outside this are clamped; confidence = 1 - distance
+
+def pairwise_distance_stats(encodings, labels, block_rows=2048, bins=BINS, progress=True):
+    """Genuine/impostor distance histograms plus per-row neighbour statistics
+
+    Distances are computed block by block over the upper triangle, so
+    memory stays around ``block_rows**2 * 4`` bytes per temporary however
+    large the gallery is. Only histograms and per-row aggregates are kept,
+    never the N*N distance matrix.
+    """
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+    labels = np.asarray(labels)
+    n = len(encodings)
+    norms = np.einsum("ij,ij->i", encodings, encodings)
+    scale = bins / MAX_DISTANCE
+
+    genuine_hist = np.zeros(bins, dtype=np.int64)
+    impostor_hist = np.zeros(bins, dtype=np.int64)
+    genuine_sum = np.zeros(n, dtype=np.float64)
+    genuine_count = np.zeros(n, dtype=np.int64)
+    nearest_impostor = np.full(n, np.inf, dtype=np.float32)
+    nearest_impostor_row = np.full(n, -1, dtype=np.int64)
+    upper = np.triu(np.ones((block_rows, block_rows), dtype=bool), 1)
+
+    blocks = list(range(0, n, block_rows))
+    total = len(blocks) * (len(blocks) + 1) // 2
+    done = 0
+    last_report = time.perf_counter()
+    for i in blocks:
+        a = encodings[i:i + block_rows]
+        for j in blocks[blocks.index(i):]:
+            b = encodings[j:j + block_rows]
+            squared = norms[i:i + len(a), None] + norms[None, j:j + len(b)] - 2.0 * (a @ b.T)
+            distances = np.sqrt(np.maximum(squared, 0, out=squared), out=squared)
+            same = labels[i:i + len(a), None] == labels[None, j:j + len(b)]
+            # Each unordered pair once: the diagonal block keeps its strict upper triangle
+            pairs = upper[:len(a), :len(b)] if i == j else np.ones_like(same)
+
+            bin_index = np.minimum((distances * scale).astype(np.int32), bins - 1)
+            genuine_hist += np.bincount(bin_index[same & pairs], minlength=bins)
+            impostor_hist += np.bincount(bin_index[~same & pairs], minlength=bins)
+
+            # Per-row aggregates, from both sides of the pair
+            genuine = same & pairs
+            genuine_distances = np.where(genuine, distances, 0)
+            impostor = np.where(same, np.inf, distances)
+            for rows, offset, axis in ((slice(i, i + len(a)), j, 1), (slice(j, j + len(b)), i, 0)):
+                genuine_sum[rows] += genuine_distances.sum(axis=axis)
+                genuine_count[rows] += genuine.sum(axis=axis)
+                best = impostor.argmin(axis=axis)
+                best_dist = impostor.min(axis=axis)
+                closer = best_dist < nearest_impostor[rows]
+                nearest_impostor[rows] = np.where(closer, best_dist, nearest_impostor[rows])
+                nearest_impostor_row[rows] = np.where(closer, best + offset, nearest_impostor_row[rows])
+
+            done += 1
+            if progress and time.perf_counter() - last_report > 10:
+                print(f"[INFO] {done}/{total} blocks ({done / total * 100:.0f}%)")
+                last_report = time.perf_counter()
+
+    return {
+        'genuine_hist': genuine_hist,
+        'impostor_hist': impostor_hist,
+        'genuine_mean': np.divide(genuine_sum, genuine_count, out=np.full(n, np.nan), where=genuine_count > 0),
+        'genuine_count': genuine_count,
+        'nearest_impostor': nearest_impostor,
+        'nearest_impostor_row': nearest_impostor_row
+    }
+
+def roc_curve(genuine_hist, impostor_hist):
+    """(thresholds, FAR, FRR) for accepting every pair at or below each bin's upper edge"""
+    thresholds = (np.arange(len(genuine_hist)) + 1) * (MAX_DISTANCE / len(genuine_hist))
+    accepted_genuine = np.cumsum(genuine_hist)
+    accepted_impostor = np.cumsum(impostor_hist)
+    far = accepted_impostor / max(1, impostor_hist.sum())
+    frr = 1.0 - accepted_genuine / max(1, genuine_hist.sum())
+    return thresholds, far, frr
+
+def recommend_threshold(thresholds, far, frr, target_far=1e-3, tolerance_range=TOLERANCE_RANGE):
+    """Largest threshold in tolerance_range whose false-accept rate stays at or below target_far, plus the EER point
+
+    'met' is False when no threshold in range reaches target_far; the
+    smallest one in range is reported then.
+    """
+    low, high = tolerance_range
+    in_range = (thresholds >= low) & (thresholds <= high)
+    allowed = np.nonzero(in_range & (far <= target_far))[0]
+    met = len(allowed) > 0
+    index = allowed[-1] if met else int(np.argmax(in_range))
+    eer_index = int(np.argmin(np.abs(far - frr)))
+    return {
+        'threshold': float(thresholds[index]),
+        'met': bool(met),
+        'far': float(far[index]),
+        'frr': float(frr[index]),
+        'eer': float((far[eer_index] + frr[eer_index]) / 2),
+        'eer_threshold': float(thresholds[eer_index])
+    }
+
+def flag_enrollments(names, paths, stats, threshold, outlier_factor=1.0):
+    """Rows that do not match their own person: mislabeled if they match someone else, else outliers
+
+    Judging a row by its mean distance to its own person, rather than by its
+    single nearest impostor, keeps one bad row from also flagging the good
+    rows of the person it really shows.
+    """
+    flags = []
+    for row in range(len(names)):
+        own = stats['genuine_mean'][row]
+        impostor = float(stats['nearest_impostor'][row])
+        other = stats['nearest_impostor_row'][row]
+        where = paths[row] if paths and paths[row] else f"encoding #{row}"
+        matches_own = not np.isnan(own) and own <= threshold * outlier_factor
+        if other >= 0 and impostor <= threshold and not matches_own:
+            flags.append(('mislabel?', names[row], where,
+                          f"matches {names[other]} at {impostor:.3f} (own mean {own:.3f})"))
+        elif not np.isnan(own) and not matches_own:
+            flags.append(('outlier', names[row], where,
+                          f"mean distance to own images {own:.3f} > {threshold * outlier_factor:.3f}"))
+    return flags
+
+def write_roc_csv(path, thresholds, far, frr, genuine_hist, impostor_hist, step=10):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["threshold", "far", "frr", "genuine_pairs", "impostor_pairs"])
+        for k in range(step - 1, len(thresholds), step):
+            writer.writerow([f"{thresholds[k]:.4f}", f"{far[k]:.8f}", f"{frr[k]:.8f}",
+                             int(genuine_hist[k - step + 1:k + 1].sum()), int(impostor_hist[k - step + 1:k + 1].sum())])
+
+def update_config(config_path, threshold):
+    """Store the calibrated distance and the matching confidence threshold (confidence = 1 - distance)"""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    config["recognition_tolerance"] = round(threshold, 4)
+    config["confidence_threshold"] = round((1.0 - threshold) * 100, 1)
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=4)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-e", "--encodings", default="encodings.pickle",
+                   help="path to serialized db of facial encodings")
+    ap.add_argument("--target-far", type=float, default=1e-3,
+                   help="false-accept rate the recommended threshold must not exceed")
+    ap.add_argument("--block-rows", type=int, default=2048,
+                   help="rows per distance block; memory per block is about 4 * rows^2 bytes times a few")
+    ap.add_argument("--csv", default=None, help="write the full ROC table to this CSV file")
+    ap.add_argument("--max-flags", type=int, default=25, help="flagged enrollments to print")
+    ap.add_argument("--update-config", action="store_true",
+                   help="write the recommended threshold to config.json")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.encodings):
+        print(f"[ERROR] Encodings file '{args.encodings}' does not exist")
+        return
+
+    data = load_gallery_data(args.encodings)
+    names = list(data["names"])
+    if len(set(names)) < 2:
+        print("[ERROR] Calibration needs encodings of at least two persons")
+        return
+    encodings = np.asarray(data["encodings"], dtype=np.float32).reshape(len(names), -1)
+    _, labels = np.unique(names, return_inverse=True)
+    print(f"[INFO] Calibrating on {len(names)} encodings of {len(set(names))} persons "
+          f"({len(names) * (len(names) - 1) // 2} pairs)")
+
+    start = time.perf_counter()
+    stats = pairwise_distance_stats(encodings, labels, args.block_rows)
+    print(f"[INFO] Pairwise distances computed in {time.perf_counter() - start:.1f} s")
+
+    genuine_hist, impostor_hist = stats['genuine_hist'], stats['impostor_hist']
+    if genuine_hist.sum() == 0:
+        print("[ERROR] No person has two or more encodings; genuine distances are undefined")
+        return
+    thresholds, far, frr = roc_curve(genuine_hist, impostor_hist)
+    best = recommend_threshold(thresholds, far, frr, args.target_far)
+
+    centers = thresholds - MAX_DISTANCE / len(thresholds) / 2
+    print("\n=== DISTANCES ===")
+    print(f"Genuine pairs: {genuine_hist.sum()}, mean {np.average(centers, weights=genuine_hist):.3f}")
+    print(f"Impostor pairs: {impostor_hist.sum()}, mean {np.average(centers, weights=impostor_hist):.3f}")
+
+    print("\n=== ROC ===")
+    print(f"{'Threshold':>9} {'FAR':>10} {'FRR':>8}")
+    for t in np.arange(0.30, 0.81, 0.05):
+        k = min(len(thresholds) - 1, int(round(t / (MAX_DISTANCE / len(thresholds)))) - 1)
+        print(f"{thresholds[k]:>9.3f} {far[k]:>10.6f} {frr[k] * 100:>7.2f}%")
+    for target in (1e-2, 1e-3, 1e-4, 1e-5):
+        point = recommend_threshold(thresholds, far, frr, target)
+        if point['met']:
+            print(f"FAR <= {target:g}: threshold {point['threshold']:.3f}, FRR {point['frr'] * 100:.2f}%")
+        else:
+            print(f"FAR <= {target:g}: not reached in {TOLERANCE_RANGE[0]}-{TOLERANCE_RANGE[1]}")
+    print(f"Equal error rate: {best['eer'] * 100:.2f}% at {best['eer_threshold']:.3f}")
+
+    print("\n=== RECOMMENDATION ===")
+    print(f"recognition_tolerance: {best['threshold']:.3f} (FAR {best['far']:.6f}, FRR {best['frr'] * 100:.2f}%)")
+    print(f"confidence_threshold: {(1.0 - best['threshold']) * 100:.1f} (confidence is 1 - distance)")
+    if not best['met']:
+        print(f"[WARNING] No threshold between {TOLERANCE_RANGE[0]} and {TOLERANCE_RANGE[1]} reaches "
+              f"FAR <= {args.target_far:g}; the gallery's persons are too close to tell apart")
+    if impostor_hist.sum() < 1 / args.target_far:
+        print(f"[WARNING] Only {impostor_hist.sum()} impostor pairs; FAR below {1 / impostor_hist.sum():.1e} "
+              f"cannot be measured on this gallery")
+
+    flags = flag_enrollments(names, data.get("paths"), stats, best['threshold'])
+    singletons = int(np.sum(np.bincount(labels) == 1))
+    print("\n=== ENROLLMENT CHECK ===")
+    print(f"Flagged: {len(flags)} of {len(names)} encodings; persons with a single encoding: {singletons}")
+    for kind, name, where, reason in flags[:args.max_flags]:
+        print(f"[{kind}] {name}: {where} - {reason}")
+    if len(flags) > args.max_flags:
+        print(f"... {len(flags) - args.max_flags} more")
+
+    if args.csv:
+        write_roc_csv(args.csv, thresholds, far, frr, genuine_hist, impostor_hist)
+        print(f"[INFO] ROC table written to {args.csv}")
+    if args.update_config:
+        if not best['met']:
+            print("[ERROR] Target FAR not met; config.json was not updated")
+            return
+        update_config("config.json", best['threshold'])
+        print("[SUCCESS] Updated recognition_tolerance and confidence_threshold in config.json")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,414 @@
+import cv2
+import os
+import signal
+import sqlite3
+import time
+import argparse
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from datetime import datetime
+from gallery import Gallery, GalleryReloader, SharedGallery
+from notifications import WebhookDispatcher
+from headless_face_detection import HeadlessFaceAccessControl, face_recognition
+
+def load_cameras(config):
+    """Camera entries from config["cameras"], or a single one built from camera_index"""
+    cameras = config.get("cameras") or [{"name": "camera_0", "source": config.get("camera_index", 0)}]
+    names = set()
+    for i, camera in enumerate(cameras):
+        camera.setdefault("name", f"camera_{i}")
+        if camera["name"] in names:
+            raise ValueError(f"duplicate camera name {camera['name']!r}")
+        names.add(camera["name"])
+    return cameras
+
+def camera_config(config, camera):
+    """Worker config: the shared settings, with any other keys of the camera entry as overrides"""
+    merged = dict(config)
+    merged.update({k: v for k, v in camera.items() if k not in ("name", "source")})
+    merged["camera_index"] = camera["source"]
+    merged["gallery_hot_reload"] = False  # the supervisor reloads and republishes the gallery
+    if "clip_dir" not in camera:
+        merged["clip_dir"] = os.path.join(config.get("clip_dir", "clips"), camera["name"])
+    merged.pop("cameras", None)
+    return merged
+
+def _camera_worker(config, gallery_spec, conn):
+    """Capture and detection loop for one camera, reporting to the supervisor over ``conn``
+
+    Access decisions and a status heartbeat go up the pipe; the supervisor
+    sends down newly published galleries, or None to stop. Ctrl+C reaches
+    the whole process group, so workers ignore SIGINT and wait for that None.
+    Clips, when enabled, are recorded here under ``clip_dir/<camera name>``.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cv2.setNumThreads(1)
+    gallery = None
+    while gallery_spec:
+        try:
+            gallery = Gallery.from_shared(gallery_spec)
+            break
+        except FileNotFoundError:
+            # Republished while this worker was starting; the new spec is already in the pipe
+            message = conn.recv()
+            if message is None:
+                conn.close()
+                return
+            gallery_spec = message[1]
+    system = HeadlessFaceAccessControl(config=config, use_database=False, gallery=gallery, record_clips=True)
+    recorder = system.clip_recorder
+    heartbeat = config.get("supervisor_heartbeat_interval", 1.0)
+    status = {"state": "connecting", "frames": 0, "processed": 0, "faces": 0, "fps": 0.0,
+              "reconnects": 0, "last_error": None}
+    cap = None
+    last_report = time.monotonic()
+    frames_at_report = 0
+
+    try:
+        while True:
+            now = time.monotonic()
+            if now - last_report >= heartbeat:
+                status["fps"] = (status["frames"] - frames_at_report) / (now - last_report)
+                frames_at_report, last_report = status["frames"], now
+                conn.send(("status", status))
+
+            while conn.poll():
+                message = conn.recv()
+                if message is None:
+                    return
+                try:
+                    gallery = Gallery.from_shared(message[1])
+                except FileNotFoundError:
+                    continue  # already replaced by a newer gallery further down the pipe
+                previous = system.gallery
+                system.use_gallery(gallery)
+                if previous is not None:
+                    previous.close()
+
+            if cap is None:
+                cap = system.open_source()
+                if not cap.isOpened():
+                    cap = None
+                    status.update(state="reconnecting", last_error="cannot open source")
+                    status["reconnects"] += 1
+                    time.sleep(config.get("supervisor_reconnect_delay", 2.0))
+                    continue
+                status["state"] = "running"
+
+            # Frames that are not analyzed are grabbed but never decoded, unless a clip needs them
+            due = status["frames"] % config["process_interval"] == 0
+            if due or recorder is not None:
+                ok, frame = cap.read()
+            else:
+                ok = cap.grab()
+            if not ok:
+                live = cap.live
+                cap.release()
+                cap = None
+                if not live:
+                    status["state"] = "finished"
+                    conn.send(("status", status))
+                    return
+                status.update(state="reconnecting", last_error="frame read failed")
+                status["reconnects"] += 1
+                continue
+
+            status["frames"] += 1
+            if recorder is not None:
+                recorder.add_frame(frame)
+            if due:
+                decisions = system.evaluate_faces(frame)
+                status["processed"] += 1
+                status["faces"] += len(decisions)
+                for name, success, confidence, bbox, image_path in decisions:
+                    if recorder is not None and not success:
+                        image_path = image_path or recorder.trigger(name)
+                    conn.send(("access", (name, success, confidence, image_path)))
+
+    finally:
+        if cap is not None:
+            cap.release()
+        if recorder is not None:
+            recorder.close()
+        conn.close()
+
+class CameraSupervisor:
+    """Run one capture worker process per camera with shared models and a single log writer
+
+    Workers are forked from a forkserver that has already imported OpenCV
+    and face_recognition, so the dlib models are shared copy-on-write
+    instead of loaded per camera. The gallery is published once in shared
+    memory (``SharedGallery``) and republished on hot reload. All access
+    events come back over per-worker pipes to one writer thread holding
+    the only SQLite connection. A worker that crashes or stops sending
+    heartbeats is restarted with exponential backoff; the others keep
+    running, and a hung worker can only ever break its own pipe.
+    """
+
+    def __init__(self, config, cameras):
+        self.config = config
+        methods = multiprocessing.get_all_start_methods()
+        self.mp = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            self.mp.set_forkserver_preload(["headless_face_detection"])
+
+        HeadlessFaceAccessControl.init_database()
+        self.db = sqlite3.connect('access_logs.db', check_same_thread=False)
+        self.notifier = None
+        if config.get("webhook_url"):
+            self.notifier = WebhookDispatcher(
+                config["webhook_url"],
+                window_seconds=config.get("webhook_window_seconds", 1.0),
+                max_queue=config.get("webhook_max_queue", 1000),
+                overflow=config.get("webhook_overflow", "drop_oldest")
+            )
+
+        self.workers = {
+            camera["name"]: {"camera": camera, "process": None, "conn": None, "next_start": 0.0,
+                             "started": 0.0, "last_seen": 0.0, "crashes": 0, "restarts": 0,
+                             "accesses": 0, "done": False, "status": {"state": "starting"}}
+            for camera in cameras
+        }
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+
+        self.gallery = None
+        self.shared_gallery = None
+        self.reloader = None
+        self.load_gallery()
+
+    def build_gallery(self, encodings_path):
+        return Gallery.from_file(
+            encodings_path,
+            precision=self.config.get("gallery_precision", "float32"),
+            rerank_k=self.config.get("gallery_rerank_k", 8)
+        )
+
+    def load_gallery(self):
+        encodings_path = self.config.get("encodings_path", "encodings.pickle")
+        if face_recognition is None:
+            return
+        if os.path.exists(encodings_path):
+            self.gallery = self.build_gallery(encodings_path)
+            self.publish(self.gallery)
+        if self.config.get("gallery_hot_reload", True):
+            self.reloader = GalleryReloader(
+                encodings_path, self.build_gallery, self.gallery,
+                poll_interval=self.config.get("gallery_reload_interval", 2.0)
+            )
+
+    def publish(self, gallery):
+        """Move a gallery into shared memory and point every running worker at it"""
+        previous = self.shared_gallery
+        self.shared_gallery = SharedGallery(gallery)
+        print(f"[INFO] Published gallery: {len(gallery)} encodings, "
+              f"{self.shared_gallery.nbytes / 1024:.0f} KB shared by all cameras")
+        with self.lock:
+            conns = [w["conn"] for w in self.workers.values() if w["conn"] is not None]
+        for conn in conns:
+            try:
+                conn.send(("gallery", self.shared_gallery.spec))
+            except OSError:
+                pass  # worker is gone; it gets the new spec when restarted
+        if previous is not None:
+            # Workers already attached keep their mapping until they switch; one
+            # still starting with the old spec waits for the new one in its pipe
+            previous.close()
+
+    def start_worker(self, name):
+        worker = self.workers[name]
+        parent_conn, child_conn = self.mp.Pipe()
+        spec = self.shared_gallery.spec if self.shared_gallery else None
+        process = self.mp.Process(target=_camera_worker, name=f"camera-{name}", daemon=True,
+                                  args=(camera_config(self.config, worker["camera"]), spec, child_conn))
+        process.start()
+        child_conn.close()
+        now = time.monotonic()
+        with self.lock:
+            worker.update(process=process, conn=parent_conn, started=now, last_seen=now,
+                          status={"state": "starting"})
+        print(f"[INFO] Started camera {name} (source {worker['camera']['source']!r}, pid {process.pid})")
+
+    def _write_loop(self):
+        while not self.stopping.is_set():
+            self.drain(timeout=0.5)
+
+    def drain(self, timeout=0.0):
+        """Read every worker pipe once and insert all access events in one transaction"""
+        with self.lock:
+            conns = {w["conn"]: name for name, w in self.workers.items() if w["conn"] is not None}
+        if not conns:
+            time.sleep(timeout)
+            return
+
+        rows = []
+        for conn in wait(list(conns), timeout=timeout):
+            name = conns[conn]
+            worker = self.workers[name]
+            try:
+                while conn.poll():
+                    kind, payload = conn.recv()
+                    worker["last_seen"] = time.monotonic()
+                    if kind == "status":
+                        worker["status"] = payload
+                        continue
+                    user_name, success, confidence, image_path = payload
+                    rows.append(payload)
+                    worker["accesses"] += 1
+                    if self.notifier is not None:
+                        self.notifier.notify({"user_name": user_name, "success": bool(success),
+                                              "confidence": float(confidence), "image_path": image_path,
+                                              "camera": name})
+                    status = "GRANTED" if success else "DENIED"
+                    timestamp = datetime.now().strftime("%H:%M:%S")
+                    print(f"[{timestamp}] [{name}] ACCESS {status} - {user_name} (confidence: {confidence:.2f})")
+            except (EOFError, OSError):
+                # Worker exited; stop polling its pipe until it is restarted
+                with self.lock:
+                    if worker["conn"] is conn:
+                        worker["conn"] = None
+
+        if rows:
+            with self.db:
+                self.db.executemany(
+                    'INSERT INTO access_logs (user_name, success, confidence, image_path) VALUES (?, ?, ?, ?)',
+                    rows
+                )
+
+    def check_workers(self):
+        """Restart crashed or silent workers, with per-camera exponential backoff"""
+        now = time.monotonic()
+        for name, worker in self.workers.items():
+            process = worker["process"]
+            if worker["done"]:
+                continue
+            if process is None:
+                if now >= worker["next_start"]:
+                    self.start_worker(name)
+                continue
+
+            if process.is_alive():
+                silent = now - worker["last_seen"]
+                if silent <= self.config.get("supervisor_heartbeat_timeout", 30.0):
+                    continue
+                print(f"[WARNING] Camera {name}: no heartbeat for {silent:.0f}s, restarting worker")
+                process.terminate()
+                process.join(2)
+                if process.is_alive():
+                    process.kill()  # SIGTERM stays pending on a stopped process
+            process.join()
+
+            with self.lock:
+                worker["process"] = None
+                worker["conn"] = None
+            if process.exitcode == 0:
+                worker["done"] = True
+                print(f"[INFO] Camera {name} finished")
+                continue
+
+            if now - worker["started"] > self.config.get("supervisor_stable_after", 60.0):
+                worker["crashes"] = 0
+            delay = min(self.config.get("supervisor_restart_backoff", 1.0) * 2 ** worker["crashes"],
+                        self.config.get("supervisor_restart_backoff_max", 60.0))
+            worker["crashes"] += 1
+            worker["restarts"] += 1
+            worker["next_start"] = now + delay
+            worker["status"] = dict(worker["status"], state="restarting")
+            print(f"[WARNING] Camera {name} worker exited with code {process.exitcode}; restarting in {delay:.0f}s")
+
+    def refresh_gallery(self):
+        if self.reloader is None:
+            return
+        gallery = self.reloader.swap()
+        if gallery is not self.gallery:
+            self.gallery = gallery
+            self.publish(gallery)
+
+    def report(self):
+        now = time.monotonic()
+        print(f"\n=== CAMERAS [{datetime.now().strftime('%H:%M:%S')}] ===")
+        print(f"{'Camera':<16} {'State':<13} {'FPS':>6} {'Processed':>10} {'Faces':>7} {'Logged':>7} "
+              f"{'Restarts':>9} {'Silent':>7}  Last error")
+        for name, worker in self.workers.items():
+            status = worker["status"]
+            silent = now - worker["last_seen"] if worker["process"] is not None else 0
+            print(f"{name:<16} {status.get('state', '?'):<13} {status.get('fps', 0):>6.1f} "
+                  f"{status.get('processed', 0):>10} {status.get('faces', 0):>7} {worker['accesses']:>7} "
+                  f"{worker['restarts']:>9} {silent:>6.0f}s  {status.get('last_error') or '-'}")
+        print("=" * 20)
+
+    def run(self):
+        print(f"[INFO] Starting camera supervisor for {len(self.workers)} cameras")
+        print("[INFO] Press Ctrl+C to stop the system")
+        self.writer.start()
+        for name in self.workers:
+            self.start_worker(name)
+
+        last_stat_time = time.time()
+        stat_interval = self.config.get("supervisor_stats_interval", 30)
+
+        try:
+            while not all(w["done"] for w in self.workers.values()):
+                time.sleep(1)
+                self.refresh_gallery()
+                self.check_workers()
+
+                current_time = time.time()
+                if current_time - last_stat_time > stat_interval:
+                    self.report()
+                    last_stat_time = current_time
+
+        except KeyboardInterrupt:
+            print("\n[INFO] Stopping supervisor...")
+
+        finally:
+            self.stop()
+
+    def stop(self):
+        with self.lock:
+            running = [w for w in self.workers.values() if w["process"] is not None]
+        for worker in running:
+            try:
+                worker["conn"].send(None)
+            except (OSError, AttributeError):
+                pass
+        for worker in running:
+            worker["process"].join(timeout=5)
+            if worker["process"].is_alive():
+                worker["process"].kill()
+                worker["process"].join()
+
+        self.stopping.set()
+        self.writer.join()
+        self.drain()  # whatever the workers sent before exiting
+        self.report()
+        self.db.close()
+        if self.reloader is not None:
+            self.reloader.stop()
+        if self.notifier is not None:
+            self.notifier.close()
+        if self.shared_gallery is not None:
+            self.shared_gallery.close()
+        print(f"[INFO] Supervisor stopped. Logged {sum(w['accesses'] for w in self.workers.values())} access attempts.")
+
+def parse_camera(value):
+    """NAME=SOURCE, where a numeric source is a camera index"""
+    name, _, source = value.partition("=")
+    if not source:
+        raise argparse.ArgumentTypeError(f"expected NAME=SOURCE, got {value!r}")
+    return {"name": name, "source": int(source) if source.isdigit() else source}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--camera", action="append", type=parse_camera, default=[], metavar="NAME=SOURCE",
+                   help="camera to run (repeatable); replaces the cameras list in config.json")
+    args = ap.parse_args()
+
+    config = HeadlessFaceAccessControl.load_config()
+    cameras = args.camera or load_cameras(config)
+    CameraSupervisor(config, cameras).run()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,149 @@
+import cv2
+import numpy as np
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+class ClipRecorder:
+    """Event-triggered video clips from an in-memory, JPEG-compressed pre-roll buffer
+
+    Every frame offered to ``add_frame()`` is downscaled, JPEG-encoded and
+    kept in a ring holding at most ``pre_roll`` seconds and
+    ``max_memory_mb`` of data. ``trigger()`` starts a clip from the buffered
+    pre-roll; frames keep being added until ``post_roll`` seconds after the
+    last trigger (events close together share one clip, up to
+    ``max_clip_seconds``). Finished clips are written by a background
+    thread, so disk I/O scales with events, not frames.
+    """
+
+    def __init__(self, output_dir="clips", pre_roll=5.0, post_roll=3.0, fps=10.0, max_memory_mb=64,
+                 jpeg_quality=80, max_width=1280, max_clip_seconds=30.0, max_pending=8, codec="mp4v"):
+        self.output_dir = output_dir
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.max_width = max_width
+        self.max_clip_seconds = max_clip_seconds
+        self.codec = codec
+
+        self.ring = deque()       # (monotonic time, jpeg bytes)
+        self.ring_bytes = 0
+        self.next_due = 0.0
+        self.clip = None          # the clip currently collecting post-roll
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.metrics = {"frames": 0, "encode_seconds": 0.0, "events": 0, "clips": 0,
+                        "written": 0, "dropped": 0, "failed": 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add_frame(self, frame, now=None):
+        """Offer a frame; it is kept at most every 1/fps seconds"""
+        now = time.monotonic() if now is None else now
+        if now < self.next_due:
+            self._maybe_finish(now)
+            return
+        # Advance on a fixed schedule so a 30 fps source sampled at 10 fps keeps every 3rd frame
+        self.next_due = max(self.next_due + self.frame_interval, now)
+
+        start = time.perf_counter()
+        if self.max_width and frame.shape[1] > self.max_width:
+            ratio = self.max_width / frame.shape[1]
+            frame = cv2.resize(frame, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode(".jpg", frame, self.encode_params)
+        self.metrics["encode_seconds"] += time.perf_counter() - start
+        if not ok:
+            return
+        jpeg = jpeg.tobytes()
+        self.metrics["frames"] += 1
+
+        self.ring.append((now, jpeg))
+        self.ring_bytes += len(jpeg)
+        while self.ring and (now - self.ring[0][0] > self.pre_roll or self.ring_bytes > self.max_bytes):
+            self.ring_bytes -= len(self.ring.popleft()[1])
+
+        if self.clip is not None:
+            self.clip["frames"].append((now, jpeg))
+        self._maybe_finish(now)
+
+    def trigger(self, label, now=None):
+        """Record a clip around this moment; returns the path the clip will be written to"""
+        now = time.monotonic() if now is None else now
+        self.metrics["events"] += 1
+        if self.clip is not None and now - self.clip["start"] < self.max_clip_seconds:
+            self.clip["end"] = now + self.post_roll
+            self.clip["labels"].add(label)
+            return self.clip["path"]
+        if self.clip is not None:
+            self._finish()
+
+        safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)
+        path = os.path.join(self.output_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{safe_label}.mp4")
+        frames = list(self.ring)
+        self.clip = {"path": path, "frames": frames, "start": frames[0][0] if frames else now,
+                     "end": now + self.post_roll, "labels": {label}}
+        return path
+
+    def _maybe_finish(self, now):
+        if self.clip is not None and now >= self.clip["end"]:
+            self._finish()
+
+    def _finish(self):
+        clip, self.clip = self.clip, None
+        self.metrics["clips"] += 1
+        try:
+            self.pending.put_nowait(clip)
+        except queue.Full:
+            # The writer is behind; losing a clip beats stalling the frame loop
+            self.metrics["dropped"] += 1
+
+    def _run(self):
+        while True:
+            clip = self.pending.get()
+            if clip is None:
+                break
+            if self._write(clip):
+                self.metrics["written"] += 1
+            else:
+                self.metrics["failed"] += 1
+
+    def _write(self, clip):
+        frames = clip["frames"]
+        if not frames:
+            return False
+        os.makedirs(self.output_dir, exist_ok=True)
+        first = cv2.imdecode(np.frombuffer(frames[0][1], dtype=np.uint8), cv2.IMREAD_COLOR)
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else 1.0 / (self.frame_interval or 0.1)
+        writer = cv2.VideoWriter(clip["path"], cv2.VideoWriter_fourcc(*self.codec), fps,
+                                 (first.shape[1], first.shape[0]))
+        if not writer.isOpened():
+            print(f"[ERROR] Could not open clip writer for {clip['path']}")
+            return False
+        writer.write(first)
+        for _, jpeg in frames[1:]:
+            writer.write(cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR))
+        writer.release()
+        print(f"[INFO] Saved {duration:.1f}s clip ({', '.join(sorted(clip['labels']))}): {clip['path']}")
+        return True
+
+    def stats(self):
+        stats = dict(self.metrics)
+        stats.update({
+            'buffered_frames': len(self.ring),
+            'buffered_bytes': self.ring_bytes,
+            'recording': self.clip is not None,
+            'encode_ms': self.metrics["encode_seconds"] / self.metrics["frames"] * 1000 if self.metrics["frames"] else 0
+        })
+        return stats
+
+    def close(self):
+        """Write the clip in progress, if any, and wait for pending writes"""
+        if self.clip is not None:
+            self._finish()
+        self.pending.put(None)
+        self.thread.join()
\ No newline at end of file
@@ -0,0 +1,149 @@
+import cv2
+import numpy as np
+import time
+from collections import OrderedDict
+
+ENTRY_OVERHEAD_BYTES = 256  # dict/tuple/key bookkeeping per cached face, roughly
+
+def crop_fingerprint(face_img):
+    """64-bit average hash of a face crop; near-identical crops differ in few bits"""
+    if face_img.ndim == 3:
+        face_img = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(face_img, (8, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small > small.mean())
+    return int.from_bytes(bits.tobytes(), "big")
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class FaceTracker:
+    """Assign stable track IDs to boxes by IoU with the previous frame"""
+
+    def __init__(self, min_iou=0.3):
+        self.min_iou = min_iou
+        self.tracks = {}
+        self.next_id = 0
+
+    def reset(self):
+        """Forget the previous frame's boxes; ids keep counting so old cache entries never match"""
+        self.tracks = {}
+
+    @staticmethod
+    def iou(a, b):
+        ax, ay, aw, ah = a
+        bx, by, bw, bh = b
+        ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+        iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+        inter = ix * iy
+        union = aw * ah + bw * bh - inter
+        return inter / union if union else 0.0
+
+    def assign(self, boxes):
+        track_ids = []
+        tracks = {}
+        unused = dict(self.tracks)
+        for box in boxes:
+            box = tuple(int(v) for v in box)
+            best_id, best_iou = None, self.min_iou
+            for track_id, previous in unused.items():
+                overlap = self.iou(box, previous)
+                if overlap >= best_iou:
+                    best_id, best_iou = track_id, overlap
+            if best_id is None:
+                best_id = self.next_id
+                self.next_id += 1
+            else:
+                del unused[best_id]
+            tracks[best_id] = box
+            track_ids.append(best_id)
+        self.tracks = tracks
+        return track_ids
+
+class CacheEntry:
+    __slots__ = ("encoding", "match", "fingerprint", "created", "nbytes")
+
+    def __init__(self, encoding, match, fingerprint, created):
+        self.encoding = encoding
+        self.match = match
+        self.fingerprint = fingerprint
+        self.created = created
+        self.nbytes = encoding.nbytes + ENTRY_OVERHEAD_BYTES
+
+class EmbeddingCache:
+    """LRU + TTL cache of face encodings and match results per track"""
+
+    def __init__(self, max_memory_mb=16, ttl_seconds=2.0, max_hamming=6, max_per_track=4):
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_seconds
+        self.max_hamming = max_hamming
+        self.max_per_track = max_per_track
+        self.entries = OrderedDict()  # (track_id, fingerprint) -> CacheEntry, oldest first
+        self.by_track = {}
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def lookup(self, track_id, fingerprint, now=None):
+        """Return the cached entry for a near-identical crop of this track, or None"""
+        now = time.time() if now is None else now
+        for key in list(self.by_track.get(track_id, ())):
+            entry = self.entries[key]
+            if now - entry.created > self.ttl_seconds:
+                self._remove(key)
+                self.expirations += 1
+                continue
+            if hamming_distance(entry.fingerprint, fingerprint) <= self.max_hamming:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def store(self, track_id, fingerprint, encoding, match, now=None):
+        now = time.time() if now is None else now
+        key = (track_id, fingerprint)
+        if key in self.entries:
+            self._remove(key)
+        entry = CacheEntry(encoding, match, fingerprint, now)
+        self.entries[key] = entry
+        keys = self.by_track.setdefault(track_id, [])
+        keys.append(key)
+        self.memory_bytes += entry.nbytes
+
+        # Keep only the freshest few looks per track, then enforce the memory cap
+        while len(keys) > self.max_per_track:
+            self._remove(keys[0])
+            self.evictions += 1
+        while self.memory_bytes > self.max_bytes and self.entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+        return entry
+
+    def clear(self):
+        """Forget all entries, e.g. after the gallery changed and cached matches are stale"""
+        self.entries.clear()
+        self.by_track.clear()
+        self.memory_bytes = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.memory_bytes -= entry.nbytes
+        keys = self.by_track[key[0]]
+        keys.remove(key)
+        if not keys:
+            del self.by_track[key[0]]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups * 100) if lookups else 0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'memory_bytes': self.memory_bytes,
+            'max_bytes': self.max_bytes
+        }
@@ -1,9 +1,18 @@
 import cv2
 import os
-import pickle
+import time
 import face_recognition
 from imutils import paths
+from PIL import Image
 import argparse
+import multiprocessing
+from gallery import compact_gallery, save_gallery_data
+
+# JPEG decoders can scale by 1/2, 1/4 or 1/8 in the DCT domain, far cheaper than resizing
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2), (1, cv2.IMREAD_COLOR))
+ENCODING_FACE_SIZE = 150          # dlib aligns faces to 150x150 chips before encoding
+MAX_DECODE_PIXELS = 12_000_000    # largest decode ever held per worker (~36 MB BGR)
 
 def create_dataset_structure():
     """Create the necessary folder structure"""
@@ -12,7 +21,82 @@ def create_dataset_structure():
     os.makedirs("output", exist_ok=True)
     print("[INFO] Created directory structure")
 
-def encode_faces(dataset_path, encodings_path, detection_method="hog"):
+def image_size(image_path):
+    """(width, height) from the file header, without decoding pixels"""
+    try:
+        with Image.open(image_path) as image:
+            return image.size
+    except (OSError, ValueError):
+        return None
+
+def reduction_flag(size, min_side):
+    """Strongest imread reduction keeping the longer side at least min_side, within MAX_DECODE_PIXELS"""
+    if not size:
+        return cv2.IMREAD_COLOR
+    allowed = [(f, flag) for f, flag in REDUCED_FLAGS if size[0] * size[1] / f ** 2 <= MAX_DECODE_PIXELS]
+    allowed = allowed or REDUCED_FLAGS[:1]
+    return next((flag for f, flag in allowed if max(size) / f >= min_side), allowed[-1][1])
+
+def read_reduced(image_path, flag, size=None):
+    """Decode with an imread flag; returns (image, scale from decoded to original pixels)"""
+    image = cv2.imread(image_path, flag)
+    if image is None:
+        return None, 1.0
+    full_side = max(size) if size else max(image.shape[:2])
+    return image, full_side / max(image.shape[:2])
+
+def encode_image(image_path, detection_method="hog", max_side=1024):
+    """Encodings of every face in an image, detected at reduced resolution
+
+    Detection runs on a decode of at most max_side pixels. Each face is then
+    encoded from that same image if it is already ENCODING_FACE_SIZE pixels
+    or larger there, otherwise from a sharper image cropped around it: the
+    decode from before the max_side resize when that is enough, else a
+    sharper decode. Returns None if the image cannot be read.
+    """
+    size = image_size(image_path)
+    flag = reduction_flag(size, max_side)
+    image, scale = read_reduced(image_path, flag, size)
+    if image is None:
+        return None
+    # Faces needing the same decode share it; the first decode is kept from before any resize
+    sharper = {flag: (image, scale)}
+    if max(image.shape[:2]) > max_side:
+        # The DCT reduction only comes in powers of two; finish with a cheap resize
+        ratio = max_side / max(image.shape[:2])
+        image = cv2.resize(image, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+        scale /= ratio
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    boxes = face_recognition.face_locations(rgb, model=detection_method)
+    
+    encodings = []
+    for top, right, bottom, left in boxes:
+        face_side = bottom - top
+        full = None
+        if face_side < ENCODING_FACE_SIZE and scale > 1.0:
+            sharp_flag = reduction_flag(size, max(image.shape[:2]) * ENCODING_FACE_SIZE / max(1, face_side))
+            if sharp_flag not in sharper:
+                sharper[sharp_flag] = read_reduced(image_path, sharp_flag, size)
+            full, full_scale = sharper[sharp_flag]
+        if full is None or full_scale >= scale:
+            # Nothing sharper than the detection image itself
+            encodings.extend(face_recognition.face_encodings(rgb, [(top, right, bottom, left)]))
+            continue
+        
+        ratio = scale / full_scale  # detection pixels -> sharper pixels
+        t, r, b, l = (int(round(v * ratio)) for v in (top, right, bottom, left))
+        margin = (b - t) // 2
+        y0, x0 = max(0, t - margin), max(0, l - margin)
+        y1, x1 = min(full.shape[0], b + margin), min(full.shape[1], r + margin)
+        crop = cv2.cvtColor(full[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        encodings.extend(face_recognition.face_encodings(crop, [(t - y0, r - x0, b - y0, l - x0)]))
+    return encodings
+
+def _encode_job(job):
+    image_path, detection_method, max_side = job
+    return encode_image(image_path, detection_method, max_side)
+
+def encode_faces(dataset_path, encodings_path, detection_method="hog", prototypes=0, workers=1, max_side=1024):
     """
     Encode faces from the dataset directory
     """
@@ -34,37 +118,43 @@ def encode_faces(dataset_path, encodings_path, detection_method="hog"):
     
     known_encodings = []
     known_names = []
+    known_paths = []
     
-    # Loop over the image paths
-    for (i, image_path) in enumerate(image_paths):
-        print(f"[INFO] Processing image {i + 1}/{len(image_paths)}: {image_path}")
-        
-        # Extract the person name from the image path
-        name = image_path.split(os.path.sep)[-2]
-        
-        # Load the image
-        image = cv2.imread(image_path)
-        if image is None:
-            print(f"[WARNING] Could not load image: {image_path}")
-            continue
+    # Images are decoded and detected at reduced resolution, optionally in a worker pool
+    jobs = [(image_path, detection_method, max_side) for image_path in image_paths]
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    results = pool.imap(_encode_job, jobs, chunksize=4) if pool else map(_encode_job, jobs)
+    start = time.perf_counter()
+    
+    try:
+        # Loop over the image paths
+        for (i, (image_path, encodings)) in enumerate(zip(image_paths, results)):
+            print(f"[INFO] Processing image {i + 1}/{len(image_paths)}: {image_path}")
             
-        # Convert BGR to RGB
-        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Detect face locations
-        boxes = face_recognition.face_locations(rgb, model=detection_method)
-        
-        if not boxes:
-            print(f"[WARNING] No faces detected in {image_path}")
-            continue
+            # Extract the person name from the image path
+            name = image_path.split(os.path.sep)[-2]
             
-        # Compute facial embeddings
-        encodings = face_recognition.face_encodings(rgb, boxes)
-        
-        # Loop over the encodings
-        for encoding in encodings:
-            known_encodings.append(encoding)
-            known_names.append(name)
+            if encodings is None:
+                print(f"[WARNING] Could not load image: {image_path}")
+                continue
+            
+            if not encodings:
+                print(f"[WARNING] No faces detected in {image_path}")
+                continue
+            
+            # Loop over the encodings
+            for encoding in encodings:
+                known_encodings.append(encoding)
+                known_names.append(name)
+                known_paths.append(image_path)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] Encoded {len(image_paths)} images in {elapsed:.1f} s "
+          f"({elapsed / len(image_paths) * 1000:.0f} ms per image, detection at {max_side} px)")
     
     if not known_encodings:
         print("[ERROR] No face encodings were generated. Check your dataset.")
@@ -72,10 +162,15 @@ def encode_faces(dataset_path, encodings_path, detection_method="hog"):
     
     # Save the encodings to disk
     print("[INFO] Serializing encodings...")
-    data = {"encodings": known_encodings, "names": known_names}
+    data = {"encodings": known_encodings, "names": known_names, "paths": known_paths}
+    
+    if prototypes:
+        # Enrollment photos are near-duplicates; keep representative prototypes
+        data = compact_gallery(known_encodings, known_names, prototypes)
+        print(f"[INFO] Compacted {len(known_encodings)} encodings to {len(data['names'])} prototypes")
     
-    with open(encodings_path, "wb") as f:
-        f.write(pickle.dumps(data))
+    # Atomic replace, so running systems never reload a half-written file
+    save_gallery_data(encodings_path, data)
     
     print(f"[SUCCESS] Encoded {len(known_encodings)} faces from {len(set(known_names))} persons")
     print(f"[INFO] Encodings saved to: {encodings_path}")
@@ -90,6 +185,12 @@ def main():
                    help="path to serialized db of facial encodings")
     ap.add_argument("-d", "--detection-method", type=str, default="hog", 
                    help="face detection model to use: either `hog` or `cnn`")
+    ap.add_argument("-k", "--prototypes", type=int, default=0,
+                   help="compact each person to this many prototype encodings plus outliers (0 keeps all)")
+    ap.add_argument("-w", "--workers", type=int, default=1,
+                   help="encode images in this many processes")
+    ap.add_argument("--max-side", type=int, default=1024,
+                   help="longest image side used for face detection; photos are decoded down to it")
     
     args = vars(ap.parse_args())
     
@@ -97,7 +198,8 @@ def main():
     create_dataset_structure()
     
     # Encode faces
-    success = encode_faces(args["dataset"], args["encodings"], args["detection_method"])
+    success = encode_faces(args["dataset"], args["encodings"], args["detection_method"], args["prototypes"],
+                           args["workers"], args["max_side"])
     
     if success:
         print("\n[INFO] Next step: Run 'python face_detection.py' to start recognition")
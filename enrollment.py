@@ -0,0 +1,207 @@
+import cv2
+import numpy as np
+import os
+import queue
+import threading
+import time
+from face_quality import score_faces, QUALITY_DEFAULTS
+from gallery import append_to_gallery
+
+try:
+    import face_recognition
+except ImportError:  # only needed for direct enrollment into the gallery
+    face_recognition = None
+
+DESCRIPTOR_SIZE = 16
+
+class AsyncImageWriter:
+    """Write images from a background thread so capture never waits on disk"""
+
+    def __init__(self, max_pending=64):
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, path, image):
+        # Copy so the crop does not pin (or race with) the whole capture frame
+        try:
+            self.pending.put_nowait((path, image.copy()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            path, image = item
+            if cv2.imwrite(path, image):
+                self.written += 1
+
+    def close(self):
+        """Flush pending writes and stop the thread"""
+        self.pending.put(None)
+        self.thread.join()
+
+class DiversitySelector:
+    """Keep an enrollment sample only if it adds pose, lighting or sharpness diversity
+
+    Each sample is summarised by a small contrast-normalised thumbnail (pose
+    and expression), its mean brightness (lighting) and its sharpness. A new
+    face is kept when its thumbnail is far from every kept one or it falls in
+    a brightness band not covered yet. A near-duplicate that is clearly
+    sharper replaces the sample it duplicates.
+
+    A session ends when it is full, or once it has at least one sample and
+    nothing new has turned up for ``idle_timeout`` seconds; ``min_samples``
+    is only the count below which callers warn that coverage is thin.
+    """
+
+    def __init__(self, max_samples=20, min_samples=8, idle_timeout=3.0, min_novelty=0.35, brightness_band=25.0, sharper_factor=1.5,
+                 min_sharpness=QUALITY_DEFAULTS["quality_min_sharpness"],
+                 min_size=QUALITY_DEFAULTS["quality_min_size"]):
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.idle_timeout = idle_timeout
+        self.last_new_time = time.time()
+        self.min_novelty = min_novelty
+        self.brightness_band = brightness_band
+        self.sharper_factor = sharper_factor
+        self.min_sharpness = min_sharpness
+        self.min_size = min_size
+        self.descriptors = []
+        self.brightness = []
+        self.sharpness = []
+
+    @staticmethod
+    def describe(gray_face):
+        thumb = cv2.resize(gray_face, (DESCRIPTOR_SIZE, DESCRIPTOR_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+        thumb -= thumb.mean()
+        return thumb.ravel() / max(float(np.linalg.norm(thumb)), 1e-6)
+
+    @property
+    def full(self):
+        return len(self.descriptors) >= self.max_samples
+
+    @property
+    def idle(self):
+        """True once a sample was kept and nothing new has been since idle_timeout"""
+        return bool(self.descriptors) and time.time() - self.last_new_time > self.idle_timeout
+
+    @property
+    def enough(self):
+        return len(self.descriptors) >= self.min_samples
+
+    def consider(self, gray, box):
+        """Return ("add", index), ("replace", index) or (None, None) for one face box"""
+        scores = score_faces(gray, [box])
+        sharpness = float(scores["sharpness"][0])
+        brightness = float(scores["brightness"][0])
+        if scores["size"][0] < self.min_size or sharpness < self.min_sharpness:
+            return None, None
+
+        x, y, w, h = box
+        descriptor = self.describe(gray[y:y+h, x:x+w])
+        if self.descriptors:
+            distances = np.linalg.norm(np.array(self.descriptors) - descriptor, axis=1)
+            nearest = int(np.argmin(distances))
+            new_lighting = min(abs(b - brightness) for b in self.brightness) > self.brightness_band
+            if distances[nearest] < self.min_novelty and not new_lighting:
+                if sharpness > self.sharpness[nearest] * self.sharper_factor:
+                    self._set(nearest, descriptor, brightness, sharpness)
+                    return "replace", nearest
+                return None, None
+
+        if self.full:
+            return None, None
+        self.last_new_time = time.time()
+        self.descriptors.append(descriptor)
+        self.brightness.append(brightness)
+        self.sharpness.append(sharpness)
+        return "add", len(self.descriptors) - 1
+
+    def _set(self, index, descriptor, brightness, sharpness):
+        self.last_new_time = time.time()
+        self.descriptors[index] = descriptor
+        self.brightness[index] = brightness
+        self.sharpness[index] = sharpness
+
+def stream_enroll(person_name, camera_index=0, encodings_path="encodings.pickle", archive_dir=None,
+                  max_samples=20, min_samples=8, idle_timeout=3.0):
+    """Encode faces straight from the camera and append them to the gallery
+
+    Each diverse face is encoded from the frame already in memory, so there
+    is no JPEG round trip and no second detection pass. The person's
+    encodings are appended to the encodings file in one transaction when
+    the session ends; saving JPEGs to ``archive_dir`` is optional.
+    """
+    if face_recognition is None:
+        print("[ERROR] face_recognition is not installed; direct enrollment needs it")
+        return False
+
+    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    cap = cv2.VideoCapture(camera_index)
+    if not cap.isOpened():
+        print("[ERROR] Cannot open camera")
+        return False
+
+    selector = DiversitySelector(max_samples=max_samples, min_samples=min_samples, idle_timeout=idle_timeout)
+    writer = None
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        writer = AsyncImageWriter()
+    encodings = []
+
+    print(f"[INFO] Enrolling {person_name} directly into {encodings_path}")
+    print("[INFO] Move your head slightly; press Ctrl+C to stop early")
+    try:
+        while not selector.full:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if selector.idle:
+                print("[INFO] No new poses or lighting for a while, finishing")
+                break
+
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+            if len(faces) == 0:
+                continue
+
+            x, y, w, h = (int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+            action, index = selector.consider(gray, (x, y, w, h))
+            if action is None:
+                continue
+
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            encoding = face_recognition.face_encodings(rgb, [(y, x + w, y + h, x)])[0]
+            if action == "add":
+                encodings.append(encoding)
+            else:
+                encodings[index] = encoding
+            if writer is not None:
+                writer.write(os.path.join(archive_dir, f"face_{index:03d}.jpg"), frame[y:y+h, x:x+w])
+            print(f"[INFO] Encoded sample {index + 1} ({action})")
+
+    except KeyboardInterrupt:
+        print("\n[INFO] Stopping enrollment...")
+
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.close()
+
+    if not encodings:
+        print("[ERROR] No usable face samples were captured")
+        return False
+
+    if not selector.enough:
+        print(f"[WARNING] Only {len(encodings)} samples (at least {min_samples} recommended); "
+              "enroll again under other lighting if recognition is unreliable")
+    total = append_to_gallery(encodings_path, encodings, [person_name] * len(encodings))
+    print(f"[SUCCESS] Added {len(encodings)} encodings for {person_name} ({total} in gallery)")
+    return True
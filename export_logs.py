@@ -0,0 +1,287 @@
+import sqlite3
+import numpy as np
+import os
+import json
+import glob
+import time
+import argparse
+from datetime import datetime
+from log_retention import list_partitions, load_retention_config, _readable_partition, _read_only_uri
+
+# Column name -> dtype in the exported files; user_name is stored as codes into the manifest dictionary
+EXPORT_COLUMNS = {
+    "id": np.int64,
+    "access_time": "datetime64[s]",
+    "user_code": np.int32,
+    "success": np.bool_,
+    "confidence": np.float32,
+    "image_path": np.str_
+}
+
+def _part_name(first_id, last_id):
+    return f"part_{first_id:012d}_{last_id:012d}.npz"
+
+def _part_range(path):
+    stem = os.path.basename(path)[len("part_"):-len(".npz")]
+    first, last = stem.split("_")
+    return int(first), int(last)
+
+class LogExporter:
+    """Stream access_logs into compressed columnar files, one directory per day
+
+    Rows are read in id order, ``chunk_rows`` at a time, over read-only
+    connections, so the live writer is never blocked for longer than one
+    small read. Each day gets ``part_<first id>_<last id>.npz`` files
+    holding one array per column; user names become int32 codes into a
+    dictionary kept in ``manifest.json`` together with the export's id
+    high-water mark. Only rows above that mark are read on the next run.
+    The manifest is written last, so parts from an interrupted run are
+    discarded and re-exported.
+    """
+
+    def __init__(self, export_dir="log_export", chunk_rows=50000):
+        self.export_dir = export_dir
+        self.chunk_rows = chunk_rows
+        self.manifest_path = os.path.join(export_dir, "manifest.json")
+        self.manifest = {"high_water": 0, "names": [], "rows": 0, "updated": None}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        self.codes = {name: code for code, name in enumerate(self.manifest["names"])}
+        self.pending = {}  # day -> list of column dicts not yet written
+
+    def _code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.manifest["names"])
+            self.manifest["names"].append(name)
+        return code
+
+    def _discard_incomplete(self):
+        """Remove parts written after the last manifest, by an interrupted run"""
+        removed = 0
+        for path in glob.glob(os.path.join(self.export_dir, "*", "part_*.npz")):
+            if _part_range(path)[1] > self.manifest["high_water"]:
+                os.remove(path)
+                removed += 1
+        if removed:
+            print(f"[WARNING] Removed {removed} parts left by an interrupted export")
+
+    def _sources(self, db_path, archive_dir):
+        """Databases holding rows above the mark: archived partitions only when the live DB no longer has them"""
+        conn = sqlite3.connect(_read_only_uri(db_path), uri=True)
+        try:
+            oldest = conn.execute('SELECT MIN(id) FROM access_logs').fetchone()[0]
+        finally:
+            conn.close()
+        sources = []
+        if oldest is None or oldest > self.manifest["high_water"] + 1:
+            cache_dir = os.path.join(archive_dir, ".cache")
+            sources += [_readable_partition(path, cache_dir)
+                        for _, path in sorted(list_partitions(archive_dir).items())]
+        return sources + [db_path]
+
+    def _chunks(self, path, after):
+        conn = sqlite3.connect(_read_only_uri(path), uri=True)
+        try:
+            while True:
+                rows = conn.execute(
+                    'SELECT id, access_time, user_name, success, confidence, image_path FROM access_logs '
+                    'WHERE id > ? ORDER BY id LIMIT ?', (after, self.chunk_rows)
+                ).fetchall()
+                if not rows:
+                    return
+                yield rows
+                after = rows[-1][0]
+        finally:
+            conn.close()
+
+    def _columns(self, rows):
+        ids, times, names, success, confidence, paths = zip(*rows)
+        # SQLite timestamps are 'YYYY-MM-DD HH:MM:SS'; NumPy wants the ISO 'T'
+        stamps = np.array([t[:19].replace(" ", "T") for t in times], dtype="datetime64[s]")
+        return {
+            "id": np.array(ids, dtype=np.int64),
+            "access_time": stamps,
+            "user_code": np.array([self._code(name) for name in names], dtype=np.int32),
+            "success": np.array([bool(s) for s in success], dtype=np.bool_),
+            "confidence": np.array([c or 0.0 for c in confidence], dtype=np.float32),
+            "image_path": np.array([p or "" for p in paths], dtype=np.str_)
+        }
+
+    def _add(self, columns):
+        days = columns["access_time"].astype("datetime64[D]")
+        for day in np.unique(days):
+            mask = days == day
+            self.pending.setdefault(str(day), []).append({k: v[mask] for k, v in columns.items()})
+
+    def _flush(self, before=None):
+        """Write pending days older than ``before`` (all days if None) as one part each"""
+        written = 0
+        for day in sorted(self.pending):
+            if before is not None and day >= before:
+                continue
+            chunks = self.pending.pop(day)
+            columns = {k: np.concatenate([c[k] for c in chunks]) for k in EXPORT_COLUMNS}
+            day_dir = os.path.join(self.export_dir, day)
+            os.makedirs(day_dir, exist_ok=True)
+            path = os.path.join(day_dir, _part_name(int(columns["id"][0]), int(columns["id"][-1])))
+            write_part(path, columns)
+            written += len(columns["id"])
+        return written
+
+    def export(self, db_path="access_logs.db", archive_dir="log_archive"):
+        """Export rows above the high-water mark; returns the number of rows written"""
+        os.makedirs(self.export_dir, exist_ok=True)
+        self._discard_incomplete()
+        after = self.manifest["high_water"]
+        exported = 0
+        for source in self._sources(db_path, archive_dir):
+            for rows in self._chunks(source, after):
+                columns = self._columns(rows)
+                self._add(columns)
+                after = int(columns["id"][-1])
+                # Ids grow with time, so days before this chunk's last day are complete
+                exported += self._flush(before=str(columns["access_time"][-1].astype("datetime64[D]")))
+        exported += self._flush()
+
+        self.manifest.update(high_water=after, rows=self.manifest["rows"] + exported,
+                             updated=datetime.now().isoformat(timespec="seconds"))
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(temp_path, self.manifest_path)
+        return exported
+
+    def compact(self, before=None):
+        """Merge each finished day's parts into one; incremental runs leave several per day"""
+        before = before or str(np.datetime64("today"))
+        merged = 0
+        for day in LogReader(self.export_dir).days():
+            parts = _day_parts(os.path.join(self.export_dir, day))
+            if day >= before or len(parts) < 2:
+                continue
+            columns = _load_parts(parts, EXPORT_COLUMNS)
+            path = os.path.join(self.export_dir, day, _part_name(int(columns["id"][0]), int(columns["id"][-1])))
+            write_part(path, columns)
+            for part in parts:
+                if part != path:
+                    os.remove(part)
+            merged += 1
+        return merged
+
+def write_part(path, columns):
+    temp_path = path + ".tmp.npz"
+    np.savez_compressed(temp_path, **columns)
+    os.replace(temp_path, path)
+
+def _day_parts(day_dir):
+    """Part files of a day in id order, skipping any whose ids another part already covers"""
+    parts = sorted(glob.glob(os.path.join(day_dir, "part_*.npz")), key=lambda p: (_part_range(p)[0], -_part_range(p)[1]))
+    kept = []
+    for path in parts:
+        first, last = _part_range(path)
+        if kept and last <= _part_range(kept[-1])[1]:
+            continue  # left behind by a compaction that was interrupted before cleanup
+        kept.append(path)
+    return kept
+
+def _load_parts(parts, columns):
+    loaded = {k: [] for k in columns}
+    for path in parts:
+        with np.load(path) as part:
+            for k in columns:
+                loaded[k].append(part[k])
+    return {k: np.concatenate(v) if v else np.zeros(0, dtype=EXPORT_COLUMNS[k]) for k, v in loaded.items()}
+
+class LogReader:
+    """Vectorized access to an export; never opens access_logs.db
+
+    >>> reader = LogReader("log_export")
+    >>> data = reader.load("2024-05-01", "2024-05-31", ["user_code", "success"])
+    >>> attempts = np.bincount(data["user_code"], minlength=len(reader.names))
+    """
+
+    def __init__(self, export_dir="log_export"):
+        self.export_dir = export_dir
+        manifest_path = os.path.join(export_dir, "manifest.json")
+        self.manifest = {"high_water": 0, "names": [], "rows": 0}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        self.names = np.array(self.manifest["names"], dtype=np.str_)
+
+    def days(self):
+        if not os.path.isdir(self.export_dir):
+            return []
+        return sorted(d for d in os.listdir(self.export_dir)
+                      if os.path.isdir(os.path.join(self.export_dir, d)) and len(d) == 10)
+
+    def load(self, start=None, end=None, columns=None):
+        """Concatenated column arrays for the days from start to end (inclusive, 'YYYY-MM-DD')"""
+        columns = list(columns or EXPORT_COLUMNS)
+        parts = []
+        for day in self.days():
+            if (start and day < start) or (end and day > end):
+                continue
+            parts += [p for p in _day_parts(os.path.join(self.export_dir, day))
+                      if _part_range(p)[1] <= self.manifest["high_water"]]
+        return _load_parts(parts, columns)
+
+    def user_names(self, codes):
+        """Decode user_code values back to names"""
+        return self.names[codes] if len(self.names) else np.zeros(len(codes), dtype=np.str_)
+
+    def code_of(self, name):
+        matches = np.nonzero(self.names == name)[0]
+        return int(matches[0]) if len(matches) else -1
+
+    def summary(self, start=None, end=None):
+        """Per-user attempts and successes, and attempts per hour of day, in a few vectorized passes"""
+        data = self.load(start, end, ["access_time", "user_code", "success"])
+        n = len(self.names)
+        attempts = np.bincount(data["user_code"], minlength=n)
+        successes = np.bincount(data["user_code"], weights=data["success"], minlength=n).astype(np.int64)
+        hours = (data["access_time"] - data["access_time"].astype("datetime64[D]")).astype("timedelta64[h]").astype(np.int64)
+        return {
+            'rows': len(data["user_code"]),
+            'per_user': {self.names[i]: (int(attempts[i]), int(successes[i])) for i in np.argsort(-attempts) if attempts[i]},
+            'per_hour': np.bincount(hours, minlength=24)
+        }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-o", "--output", default="log_export", help="export directory")
+    ap.add_argument("--db", default=None, help="live database (default: log_db_path from config.json)")
+    ap.add_argument("--chunk-rows", type=int, default=50000, help="rows read from SQLite per query")
+    ap.add_argument("--compact", action="store_true", help="merge the parts of finished days after exporting")
+    ap.add_argument("--summary", action="store_true", help="print per-user and per-hour counts from the export")
+    ap.add_argument("--start", default=None, help="first day for --summary (YYYY-MM-DD)")
+    ap.add_argument("--end", default=None, help="last day for --summary (YYYY-MM-DD)")
+    args = ap.parse_args()
+
+    config = load_retention_config()
+    db_path = args.db or config["log_db_path"]
+    if not os.path.exists(db_path):
+        print(f"[ERROR] {db_path} does not exist")
+        return
+
+    exporter = LogExporter(args.output, args.chunk_rows)
+    start = time.perf_counter()
+    exported = exporter.export(db_path, config["log_archive_dir"])
+    print(f"[SUCCESS] Exported {exported} rows to {args.output}/ in {time.perf_counter() - start:.1f} s "
+          f"(up to id {exporter.manifest['high_water']}, {len(exporter.manifest['names'])} distinct users)")
+    if args.compact:
+        print(f"[INFO] Compacted {exporter.compact()} days")
+
+    if args.summary:
+        reader = LogReader(args.output)
+        start = time.perf_counter()
+        summary = reader.summary(args.start, args.end)
+        print(f"\n=== EXPORT SUMMARY ({summary['rows']} rows, {(time.perf_counter() - start) * 1000:.0f} ms) ===")
+        for name, (attempts, successes) in list(summary['per_user'].items())[:20]:
+            print(f"{name}: {attempts} attempts, {successes} granted")
+        print("Attempts by hour: " + " ".join(str(int(c)) for c in summary['per_hour']))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -4,6 +4,9 @@ import os
 import sqlite3
 from datetime import datetime
 import time
+import argparse
+from access_stats import get_stats_engine
+from frame_sources import open_source
 
 class DebugFaceAccessControl:
     def __init__(self):
@@ -36,6 +39,7 @@ class DebugFaceAccessControl:
                 image_path TEXT
             )
         ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_access_time ON access_logs (access_time)')
         conn.commit()
         conn.close()
         print("[INFO] Database initialized")
@@ -168,30 +172,14 @@ class DebugFaceAccessControl:
     
     def display_stats(self):
         """Display current statistics"""
-        conn = sqlite3.connect('access_logs.db')
-        
         # Get today's stats
-        today = datetime.now().strftime("%Y-%m-%d")
-        stats = conn.execute('''
-            SELECT 
-                COUNT(*) as total,
-                SUM(success) as success,
-                AVG(confidence) as avg_conf
-            FROM access_logs 
-            WHERE DATE(access_time) = ?
-        ''', (today,)).fetchone()
-        
-        conn.close()
-        
-        total = stats[0] or 0
-        success = stats[1] or 0
-        success_rate = (success / total * 100) if total > 0 else 0
+        stats = get_stats_engine().today()
         
         print(f"\n=== STATS [Today] ===")
-        print(f"Total attempts: {total}")
-        print(f"Successful: {success}")
-        print(f"Success rate: {success_rate:.1f}%")
-        print(f"Avg confidence: {stats[2] or 0:.2f}")
+        print(f"Total attempts: {stats['total_attempts']}")
+        print(f"Successful: {stats['successful_attempts']}")
+        print(f"Success rate: {stats['success_rate']:.1f}%")
+        print(f"Avg confidence: {stats['avg_confidence']:.2f}")
         print("=" * 20)
     
     def run(self):
@@ -201,7 +189,7 @@ class DebugFaceAccessControl:
         print(f"[INFO] Process interval: every {self.config['process_interval']} frames")
         print("[DEBUG] System will show detailed detection information")
         
-        cap = cv2.VideoCapture(self.config["camera_index"])
+        cap = open_source(self.config["camera_index"], realtime=self.config.get("source_realtime", False))
         
         if not cap.isOpened():
             print("[ERROR] Cannot open camera")
@@ -226,7 +214,7 @@ class DebugFaceAccessControl:
             while True:
                 ret, frame = cap.read()
                 if not ret:
-                    print("[ERROR] Failed to grab frame")
+                    print("[ERROR] Failed to grab frame" if cap.live else "[INFO] End of source")
                     break
                 
                 # Process frame
@@ -252,12 +240,22 @@ class DebugFaceAccessControl:
             print(f"[INFO] Total access attempts: {self.access_count}")
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-s", "--source", default=None,
+                   help="camera index, stream URL, video file, image directory or 'synthetic'")
+    ap.add_argument("--realtime", action="store_true",
+                   help="pace file, directory and synthetic sources to their frame rate")
+    args = ap.parse_args()
+    
     # Create necessary directories
     os.makedirs("datasets", exist_ok=True)
     os.makedirs("unknown_faces", exist_ok=True)
     os.makedirs("output", exist_ok=True)
     
     system = DebugFaceAccessControl()
+    if args.source is not None:
+        system.config["camera_index"] = args.source
+    system.config["source_realtime"] = args.realtime
     system.run()
 
 if __name__ == "__main__":
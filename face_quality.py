@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+QUALITY_DEFAULTS = {
+    "quality_min_size": 60,
+    "quality_min_sharpness": 20.0,
+    "quality_min_brightness": 40.0,
+    "quality_max_brightness": 220.0,
+    "quality_min_contrast": 20.0,
+    "quality_min_frontalness": 0.5
+}
+
+SAMPLE_SIZE = 64  # crops are scored at a fixed size so thresholds do not depend on distance
+
+def score_faces(gray, boxes):
+    """Score all face boxes of a frame at once
+
+    Returns a dict of arrays with one entry per box: size (shorter side in
+    pixels), sharpness (variance of the Laplacian), brightness (mean),
+    contrast (standard deviation) and frontalness (left/right symmetry, 1.0
+    for a perfectly symmetric, i.e. frontal, face).
+    """
+    boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    if len(boxes) == 0:
+        empty = np.empty(0, dtype=np.float32)
+        return {"size": empty, "sharpness": empty, "brightness": empty,
+                "contrast": empty, "frontalness": empty}
+
+    crops = np.empty((len(boxes), SAMPLE_SIZE, SAMPLE_SIZE), dtype=gray.dtype)
+    for i, (x, y, w, h) in enumerate(boxes):
+        cv2.resize(gray[y:y+h, x:x+w], (SAMPLE_SIZE, SAMPLE_SIZE), dst=crops[i], interpolation=cv2.INTER_AREA)
+    samples = crops.astype(np.float32)
+
+    # 4-neighbour Laplacian over the whole stack
+    laplacian = (4 * samples[:, 1:-1, 1:-1] - samples[:, :-2, 1:-1] - samples[:, 2:, 1:-1]
+                 - samples[:, 1:-1, :-2] - samples[:, 1:-1, 2:])
+
+    # A profile view is strongly asymmetric; compare the left half with the mirrored right half
+    half = SAMPLE_SIZE // 2
+    contrast = samples.std(axis=(1, 2))
+    mirrored = samples[:, :, ::-1]
+    asymmetry = np.abs(samples[:, :, :half] - mirrored[:, :, :half]).mean(axis=(1, 2)) / np.maximum(contrast, 1.0)
+
+    return {
+        "size": np.minimum(boxes[:, 2], boxes[:, 3]).astype(np.float32),
+        "sharpness": laplacian.var(axis=(1, 2)),
+        "brightness": samples.mean(axis=(1, 2)),
+        "contrast": contrast,
+        "frontalness": np.clip(1.0 - asymmetry / 2.0, 0.0, 1.0)
+    }
+
+class FaceQualityGate:
+    """Drop blurry, tiny, badly lit or profile faces before the expensive stages"""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.thresholds = {key: config.get(key, default) for key, default in QUALITY_DEFAULTS.items()}
+        self.evaluated = 0
+        self.accepted = 0
+        self.rejects = {"size": 0, "sharpness": 0, "brightness": 0, "contrast": 0, "frontalness": 0}
+
+    def check(self, gray, boxes):
+        """Return (accepted mask, scores) for the boxes of one frame"""
+        scores = score_faces(gray, boxes)
+        t = self.thresholds
+        failures = {
+            "size": scores["size"] < t["quality_min_size"],
+            "sharpness": scores["sharpness"] < t["quality_min_sharpness"],
+            "brightness": (scores["brightness"] < t["quality_min_brightness"])
+                          | (scores["brightness"] > t["quality_max_brightness"]),
+            "contrast": scores["contrast"] < t["quality_min_contrast"],
+            "frontalness": scores["frontalness"] < t["quality_min_frontalness"]
+        }
+        accepted = np.ones(len(scores["size"]), dtype=bool)
+        for reason, failed in failures.items():
+            self.rejects[reason] += int(failed.sum())
+            accepted &= ~failed
+
+        self.evaluated += len(accepted)
+        self.accepted += int(accepted.sum())
+        return accepted, scores
+
+    def stats(self):
+        return {
+            'evaluated': self.evaluated,
+            'accepted': self.accepted,
+            'rejected': self.evaluated - self.accepted,
+            'rejects_by_reason': dict(self.rejects),
+            'thresholds': dict(self.thresholds)
+        }
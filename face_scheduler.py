@@ -0,0 +1,102 @@
+import numpy as np
+import time
+
+class FaceScheduler:
+    """Orders a frame's faces by urgency and stops starting new ones at the frame deadline
+
+    A face's priority grows with its size (closer to the camera), its
+    closeness to the door ROI and the number of frames it has already been
+    deferred, and is cut by ``identified_factor`` when its track got a
+    confident identity within ``identity_ttl`` seconds. ``schedule()``
+    yields face indices best first; a face is only started if the running
+    per-face cost estimate says it will finish before the deadline, except
+    that the first face of a frame always runs so the scheduler can never
+    starve the reader. Faces left over are deferred to the next processed
+    frame; a deferred track that disappears before its turn is dropped.
+    """
+
+    def __init__(self, budget_ms=200, door_roi=None, roi_weight=2.0, identified_factor=0.25,
+                 deferral_boost=0.5, identity_ttl=3.0):
+        self.budget = budget_ms / 1000.0
+        self.door_roi = tuple(door_roi) if door_roi else None  # x, y, w, h as fractions of the frame
+        self.roi_weight = roi_weight
+        self.identified_factor = identified_factor
+        self.deferral_boost = deferral_boost
+        self.identity_ttl = identity_ttl
+        self.face_cost = 0.0          # exponentially weighted seconds per face
+        self.deferred = {}            # track_id -> frames deferred so far
+        self.identified = {}          # track_id -> monotonic time of its last confident decision
+        self.metrics = {"frames": 0, "faces": 0, "processed": 0, "deferred": 0, "dropped": 0,
+                        "deadline_misses": 0, "max_deferrals": 0}
+
+    def deadline(self, start=None):
+        return (time.perf_counter() if start is None else start) + self.budget
+
+    def priorities(self, records, frame_shape):
+        height, width = frame_shape[:2]
+        boxes = records["bbox"].astype(np.float64)
+        # Apparent face size relative to the frame: bigger means nearer
+        score = np.sqrt(boxes[:, 2] * boxes[:, 3]) / min(width, height)
+        if self.door_roi is not None:
+            rx, ry, rw, rh = self.door_roi
+            cx = (boxes[:, 0] + boxes[:, 2] / 2) / width
+            cy = (boxes[:, 1] + boxes[:, 3] / 2) / height
+            # Distance from the face centre to the ROI rectangle, 0 inside it
+            dx = np.maximum(0, np.maximum(rx - cx, cx - (rx + rw)))
+            dy = np.maximum(0, np.maximum(ry - cy, cy - (ry + rh)))
+            score += self.roi_weight * (1.0 - np.minimum(1.0, np.hypot(dx, dy) / np.sqrt(2)))
+
+        now = time.monotonic()
+        for i, track_id in enumerate(records["track_id"].tolist()):
+            score[i] += self.deferral_boost * self.deferred.get(track_id, 0)
+            if now - self.identified.get(track_id, -np.inf) < self.identity_ttl:
+                score[i] *= self.identified_factor
+        return score
+
+    def schedule(self, records, frame_shape, deadline):
+        """Yield indices into records, most urgent first, while the frame budget lasts"""
+        track_ids = records["track_id"].tolist()
+        present = set(track_ids)
+        for track_id in [t for t in self.deferred if t not in present]:
+            # Left the scene while waiting for its turn
+            del self.deferred[track_id]
+            self.metrics["dropped"] += 1
+        for track_id in [t for t in self.identified if t not in present]:
+            del self.identified[track_id]
+
+        self.metrics["frames"] += 1
+        self.metrics["faces"] += len(track_ids)
+        order = np.argsort(-self.priorities(records, frame_shape), kind="stable").tolist() if track_ids else []
+        done = 0
+        for i in order:
+            now = time.perf_counter()
+            if done and now + self.face_cost > deadline:
+                break
+            yield i
+            cost = time.perf_counter() - now
+            self.face_cost = cost if not self.face_cost else 0.8 * self.face_cost + 0.2 * cost
+            self.deferred.pop(track_ids[i], None)
+            done += 1
+
+        self.metrics["processed"] += done
+        for i in order[done:]:
+            waited = self.deferred.get(track_ids[i], 0) + 1
+            self.deferred[track_ids[i]] = waited
+            self.metrics["deferred"] += 1
+            self.metrics["max_deferrals"] = max(self.metrics["max_deferrals"], waited)
+        if done < len(order):
+            # Only frames whose budget ran out with faces still waiting count as misses
+            self.metrics["deadline_misses"] += 1
+
+    def record_decision(self, track_id, confident):
+        """Remember confident identities so known faces yield to unresolved ones"""
+        if confident:
+            self.identified[track_id] = time.monotonic()
+        else:
+            self.identified.pop(track_id, None)
+
+    def stats(self):
+        stats = dict(self.metrics)
+        stats["pending"] = len(self.deferred)
+        stats["face_ms"] = self.face_cost * 1000
+        return stats
\ No newline at end of file
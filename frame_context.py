@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+
+UNKNOWN_NAME = "Unknown Person"
+
+DETECTION_DTYPE = np.dtype([
+    ("bbox", np.int32, (4,)),    # x, y, w, h
+    ("confidence", np.float32),
+    ("name_id", np.int32),       # index into FrameContext.names
+    ("track_id", np.int32)
+])
+
+class FrameContext:
+    """Per-stream scratch space reused for every processed frame
+
+    Gray/RGB conversions are written into preallocated buffers
+    through OpenCV's ``dst=`` parameters, computed lazily and at most once
+    per frame. Detections live in a structured NumPy array that only grows
+    when a frame has more faces than ever before, so in steady state a
+    frame allocates next to nothing.
+    """
+
+    def __init__(self, max_faces=16):
+        self.frame = None
+        self._gray = None
+        self._rgb = None
+        self._gray_ready = False
+        self._rgb_ready = False
+        self.detections = np.zeros(max_faces, dtype=DETECTION_DTYPE)
+        self.count = 0
+        self.names = [UNKNOWN_NAME]
+        self._name_ids = {UNKNOWN_NAME: 0}
+
+    def reset(self, frame):
+        """Start a new frame; buffers are reallocated only if the frame size changed"""
+        self.frame = frame
+        h, w = frame.shape[:2]
+        if self._gray is None or self._gray.shape != (h, w):
+            self._gray = np.empty((h, w), dtype=np.uint8)
+            self._rgb = np.empty((h, w, 3), dtype=np.uint8)
+        self._gray_ready = False
+        self._rgb_ready = False
+        self.count = 0
+
+    @property
+    def gray(self):
+        if not self._gray_ready:
+            cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            self._gray_ready = True
+        return self._gray
+
+    @property
+    def rgb(self):
+        if not self._rgb_ready:
+            cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB, dst=self._rgb)
+            self._rgb_ready = True
+        return self._rgb
+
+    def name_id(self, name):
+        """Intern a person name; the table only grows with new identities"""
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def set_boxes(self, boxes):
+        """Store this frame's face boxes, resetting their results to unknown"""
+        count = len(boxes)
+        if count > len(self.detections):
+            grown = np.zeros(max(count, 2 * len(self.detections)), dtype=DETECTION_DTYPE)
+            self.detections = grown
+        self.count = count
+        records = self.detections[:count]
+        if count:
+            records["bbox"] = boxes
+        records["confidence"] = 0.0
+        records["name_id"] = 0
+        records["track_id"] = -1
+        return records
+
+    @property
+    def records(self):
+        """View of the current frame's detections"""
+        return self.detections[:self.count]
+
+    def name_of(self, index):
+        return self.names[self.detections["name_id"][index]]
@@ -0,0 +1,262 @@
+import cv2
+import numpy as np
+import os
+import time
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.mpg', '.mpeg', '.wmv')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class FrameSource:
+    """Base for non-camera sources, mirroring the cv2.VideoCapture calls the frame loops use
+
+    ``grab()`` advances without decoding, ``retrieve(image)`` decodes the
+    current frame (into ``image`` when its shape matches) and ``read()`` does
+    both. With ``realtime`` the source paces itself to ``fps`` like a camera;
+    otherwise it runs as fast as the consumer reads.
+    """
+
+    live = False
+
+    def __init__(self, fps=30.0, realtime=False):
+        self.fps = fps
+        self.realtime = realtime
+        self.frames_read = 0
+        self.started = None
+
+    def _pace(self):
+        if not self.realtime or not self.fps:
+            return
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        due = self.started + self.frames_read / self.fps
+        if due > now:
+            time.sleep(due - now)
+
+    def _advance(self):
+        raise NotImplementedError
+
+    def _decode(self):
+        raise NotImplementedError
+
+    def isOpened(self):
+        return True
+
+    def grab(self):
+        self._pace()
+        if not self._advance():
+            return False
+        self.frames_read += 1
+        return True
+
+    def retrieve(self, image=None):
+        frame = self._decode()
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class CaptureSource:
+    """Camera index or stream URL; a thin wrapper so live sources share the FrameSource interface"""
+
+    live = True
+
+    def __init__(self, source):
+        self.cap = cv2.VideoCapture(source)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.realtime = True
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def grab(self):
+        return self.cap.grab()
+
+    def retrieve(self, image=None):
+        return self.cap.retrieve(image)
+
+    def read(self, image=None):
+        return self.cap.read(image)
+
+    def release(self):
+        self.cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class VideoFileSource(FrameSource):
+    """Recorded video, optionally paced to its own frame rate and looped"""
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.cap = cv2.VideoCapture(path)
+        super().__init__(self.cap.get(cv2.CAP_PROP_FPS) or 30.0, realtime)
+        self.loop = loop
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def _advance(self):
+        if self.cap.grab():
+            return True
+        if self.loop and self.frames_read:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return self.cap.grab()
+        return False
+
+    def retrieve(self, image=None):
+        return self.cap.retrieve(image)
+
+    def release(self):
+        self.cap.release()
+
+class ImageDirectorySource(FrameSource):
+    """Images in a directory, in name order, played back as frames"""
+
+    def __init__(self, path, fps=10.0, realtime=False, loop=False):
+        super().__init__(fps, realtime)
+        self.paths = sorted(os.path.join(path, f) for f in os.listdir(path)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        self.loop = loop
+        self.index = -1
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def _advance(self):
+        if self.index + 1 >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False
+            self.index = -1
+        self.index += 1
+        return True
+
+    def _decode(self):
+        return cv2.imread(self.paths[self.index])
+
+class SyntheticSource(FrameSource):
+    """Dataset faces moving over generated backgrounds, for load tests without a camera
+
+    Each frame shows up to ``max_faces`` enrolled faces that enter, drift
+    and leave, so detection, tracking and the embedding cache see realistic
+    motion. ``ground_truth`` holds (name, (x, y, w, h)) for the current
+    frame. ``frames=0`` runs forever.
+    """
+
+    def __init__(self, dataset_dir="datasets", frame_size=(1280, 720), fps=30.0, max_faces=3,
+                 frames=0, realtime=False, seed=0, samples_per_person=5):
+        super().__init__(fps, realtime)
+        self.frame_size = tuple(frame_size)
+        self.max_faces = max_faces
+        self.frames = frames
+        self.rng = np.random.default_rng(seed)
+        self.faces = self._load_faces(dataset_dir, samples_per_person)
+        if not self.faces:
+            print(f"[WARNING] No face images under {dataset_dir}/; synthetic frames will contain no faces")
+        self.backgrounds = [self._background() for _ in range(4)]
+        self.background = self.backgrounds[0]
+        self.actors = []
+        self.ground_truth = []
+
+    @staticmethod
+    def _load_faces(dataset_dir, samples_per_person):
+        faces = []
+        if not os.path.isdir(dataset_dir):
+            return faces
+        for person_name in sorted(os.listdir(dataset_dir)):
+            person_dir = os.path.join(dataset_dir, person_name)
+            if not os.path.isdir(person_dir):
+                continue
+            images = sorted(f for f in os.listdir(person_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+            for filename in images[:samples_per_person]:
+                image = cv2.imread(os.path.join(person_dir, filename))
+                if image is not None:
+                    faces.append((person_name, image))
+        return faces
+
+    def _background(self):
+        """Smooth gradient plus blurred noise, roughly the texture of an indoor scene"""
+        width, height = self.frame_size
+        ramp = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+        base = self.rng.uniform(40, 200, 3).astype(np.float32)
+        tilt = self.rng.uniform(-60, 60, 3).astype(np.float32)
+        noise = cv2.resize(self.rng.normal(0, 25, (height // 16 + 1, width // 16 + 1, 3)).astype(np.float32),
+                           (width, height), interpolation=cv2.INTER_CUBIC)
+        return np.clip(base + tilt * ramp + noise, 0, 255).astype(np.uint8)
+
+    def _spawn(self):
+        width, height = self.frame_size
+        name, image = self.faces[self.rng.integers(len(self.faces))]
+        size = int(height * self.rng.uniform(0.12, 0.3))
+        return {
+            "name": name,
+            "image": cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA),
+            "position": self.rng.uniform([0, 0], [width - size, height - size]),
+            "velocity": self.rng.normal(0, 3, 2),
+            "ttl": int(self.rng.integers(self.fps, 5 * self.fps))
+        }
+
+    def _advance(self):
+        if self.frames and self.frames_read >= self.frames:
+            return False
+        width, height = self.frame_size
+        if self.rng.random() < 0.01:
+            self.background = self.backgrounds[self.rng.integers(len(self.backgrounds))]
+        for actor in self.actors:
+            size = actor["image"].shape[0]
+            actor["position"] += actor["velocity"]
+            actor["position"] = np.clip(actor["position"], 0, [width - size, height - size])
+            actor["ttl"] -= 1
+        self.actors = [a for a in self.actors if a["ttl"] > 0]
+        if self.faces and len(self.actors) < self.max_faces and self.rng.random() < 0.05:
+            self.actors.append(self._spawn())
+        self.ground_truth = [
+            (a["name"], (int(a["position"][0]), int(a["position"][1]), a["image"].shape[1], a["image"].shape[0]))
+            for a in self.actors
+        ]
+        return True
+
+    def retrieve(self, image=None):
+        if image is None or image.shape != self.background.shape:
+            image = np.empty_like(self.background)
+        np.copyto(image, self.background)
+        for actor, (_, (x, y, w, h)) in zip(self.actors, self.ground_truth):
+            image[y:y+h, x:x+w] = actor["image"]
+        return True, image
+
+def open_source(source, realtime=False, loop=False, **options):
+    """Frame source for a camera index, stream URL, video file, image directory or "synthetic"
+
+    File, directory and synthetic sources run as fast as they are read
+    unless ``realtime`` is set. Extra keyword options go to SyntheticSource.
+    """
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, int) or "://" in source:
+        return CaptureSource(source)
+    if source == "synthetic":
+        return SyntheticSource(realtime=realtime, **options)
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, realtime=realtime, loop=loop)
+    if source.lower().endswith(VIDEO_EXTENSIONS):
+        return VideoFileSource(source, realtime=realtime, loop=loop)
+    # Anything else (device paths, GStreamer pipelines) goes straight to OpenCV
+    return CaptureSource(source)
\ No newline at end of file
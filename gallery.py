@@ -0,0 +1,546 @@
+import cv2
+import numpy as np
+import os
+import pickle
+import tempfile
+import time
+import argparse
+import threading
+from multiprocessing import shared_memory
+from shared_frames import attach_shared_memory
+from utils import get_rss_bytes
+
+PRECISIONS = ("float32", "float16", "int8")
+
+def load_gallery_data(encodings_path):
+    """Load the {"encodings", "names"} dict written by encode_faces.py"""
+    with open(encodings_path, "rb") as f:
+        return pickle.loads(f.read())
+
+def save_gallery_data(encodings_path, data):
+    """Atomically replace the encodings file: readers see the old or new file, never half of one"""
+    directory = os.path.dirname(os.path.abspath(encodings_path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(encodings_path)}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(pickle.dumps(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, encodings_path)
+
+class GalleryLock:
+    """Cross-process lock file serializing writers of one encodings file"""
+
+    def __init__(self, encodings_path, timeout=10.0, stale_after=60.0):
+        self.encodings_path = encodings_path
+        self.path = encodings_path + ".lock"
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)  # left behind by a crashed writer
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"Could not lock {self.encodings_path}")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def append_to_gallery(encodings_path, encodings, names):
+    """Append encodings to the gallery file in one transaction; returns the new row count"""
+    with GalleryLock(encodings_path):
+        if os.path.exists(encodings_path):
+            data = load_gallery_data(encodings_path)
+        else:
+            data = {"encodings": [], "names": []}
+        data["encodings"] = list(data["encodings"]) + [np.asarray(e) for e in encodings]
+        data["names"] = list(data["names"]) + list(names)
+        if "paths" in data:
+            data["paths"] = list(data["paths"]) + [None] * len(names)  # streamed, no source image
+        data.pop("compaction", None)  # summary no longer describes the rows
+        save_gallery_data(encodings_path, data)
+        return len(data["names"])
+
+def _spill_to_disk(array):
+    """Read-only memmap of array in an unlinked temporary file; only rows that are read get paged in"""
+    f = tempfile.TemporaryFile()
+    f.write(np.ascontiguousarray(array).tobytes())
+    f.flush()
+    return np.memmap(f, dtype=array.dtype, mode="r", shape=array.shape)
+
+def _widen_float16(block, out):
+    """float16 -> float32 into out; OpenCV converts with the CPU's F16C instructions, NumPy in software"""
+    if hasattr(cv2, "convertFp16"):
+        out[...] = cv2.convertFp16(block.view(np.int16))
+    else:
+        out[...] = block
+    return out
+
+class Gallery:
+    """Matcher over known encodings with optional reduced-precision coarse search.
+
+    The coarse pass scans a compact float16 or int8 copy of the gallery and
+    keeps the best ``rerank_k`` candidates; those are re-ranked with exact
+    float32 distances, so the reported distance is never an approximation.
+    With reduced precision the exact rows live in a memory-mapped temporary
+    file: re-ranking touches only ``rerank_k`` rows per query, so the OS
+    keeps just those pages in memory.
+    """
+
+    def __init__(self, encodings, names, precision="float32", rerank_k=8, block_rows=1024):
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+        self.names = list(names)
+        self.precision = precision
+        self.rerank_k = rerank_k
+        self.block_rows = block_rows
+        if self.names:
+            self.exact = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(len(self.names), -1))
+        else:
+            self.exact = np.empty((0, 128), dtype=np.float32)
+        self.scale = None
+
+        if precision == "float32":
+            self.codes = self.exact
+        elif precision == "float16":
+            self.codes = self.exact.astype(np.float16)
+        else:
+            # Symmetric per-dimension scalar quantization
+            max_abs = np.abs(self.exact).max(axis=0) if len(self.exact) else np.ones(self.exact.shape[1])
+            self.scale = (np.maximum(max_abs, 1e-12) / 127.0).astype(np.float32)
+            self.codes = np.clip(np.rint(self.exact / self.scale), -127, 127).astype(np.int8)
+
+        # Squared norms of the vectors the coarse pass actually sees
+        self.code_norms = np.empty(len(self.names), dtype=np.float32)
+        buffer = np.empty((block_rows, self.exact.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.names), block_rows):
+            block = self._widen(start, start + block_rows, buffer)
+            if self.scale is not None:
+                block = block * self.scale
+            self.code_norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+
+        if precision != "float32" and len(self.names):
+            self.exact = _spill_to_disk(self.exact)
+
+    @classmethod
+    def from_file(cls, encodings_path, precision="float32", rerank_k=8):
+        data = load_gallery_data(encodings_path)
+        return cls(data["encodings"], data["names"], precision, rerank_k)
+
+    @classmethod
+    def from_shared(cls, spec):
+        """Gallery over read-only views of a SharedGallery block; nothing is copied"""
+        gallery = cls.__new__(cls)
+        gallery.names = list(spec["names"])
+        gallery.precision = spec["precision"]
+        gallery.rerank_k = spec["rerank_k"]
+        gallery.block_rows = spec["block_rows"]
+        gallery.shm = attach_shared_memory(spec["name"])
+        gallery.scale = None
+        for field, dtype, shape, offset in spec["layout"]:
+            array = np.ndarray(shape, dtype=dtype, buffer=gallery.shm.buf, offset=offset)
+            array.flags.writeable = False
+            setattr(gallery, field, array)
+        if gallery.precision == "float32":
+            gallery.codes = gallery.exact
+        return gallery
+
+    def __len__(self):
+        return len(self.names)
+
+    def _widen(self, start, stop, buffer):
+        """Codes of rows start:stop as float32 in buffer, still in units of ``scale`` for int8"""
+        block = self.codes[start:stop]
+        if self.precision == "float32":
+            return block
+        out = buffer[:len(block)]
+        if self.precision == "float16":
+            return _widen_float16(block, out)
+        out[...] = block
+        return out
+
+    def coarse_distances(self, queries):
+        """Squared distances from each query to every gallery row, block by block"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.exact.shape[1])
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        # q . (scale * c) == (scale * q) . c, so int8 codes are only cast, never rescaled
+        scaled = queries * self.scale if self.scale is not None else queries
+        distances = np.empty((len(queries), len(self.names)), dtype=np.float32)
+        # Blocks are widened into one buffer small enough to stay in cache, so
+        # the scan reads each compact code from memory once and allocates nothing
+        buffer = np.empty((self.block_rows, self.exact.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.names), self.block_rows):
+            block = self._widen(start, start + self.block_rows, buffer)
+            stop = start + len(block)
+            distances[:, start:stop] = query_norms[:, None] + self.code_norms[None, start:stop] - 2.0 * (scaled @ block.T)
+        return distances
+
+    def search(self, queries, k=1, rerank=True):
+        """Return (indices, distances) of the k nearest gallery rows per query"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.exact.shape[1])
+        k = min(k, len(self.names))
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+
+        coarse = self.coarse_distances(queries)
+        candidates = k if (self.precision == "float32" or not rerank) else min(len(self.names), max(k, self.rerank_k))
+        if candidates < len(self.names):
+            top = np.argpartition(coarse, candidates - 1, axis=1)[:, :candidates]
+        else:
+            top = np.broadcast_to(np.arange(len(self.names)), (len(queries), len(self.names)))
+
+        if self.precision == "float32" or not rerank:
+            distances = np.sqrt(np.maximum(np.take_along_axis(coarse, top, axis=1), 0))
+        else:
+            # Exact float32 re-ranking of the shortlisted rows only
+            diff = self.exact[top] - queries[:, None, :]
+            distances = np.sqrt(np.einsum("qkd,qkd->qk", diff, diff))
+
+        order = np.argsort(distances, axis=1)[:, :k]
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(distances, order, axis=1)
+
+    def match(self, encoding, tolerance=0.6):
+        """Return (name, distance) of the nearest known face, or ("Unknown Person", distance)"""
+        if not self.names:
+            return "Unknown Person", float("inf")
+        indices, distances = self.search(encoding, k=1)
+        distance = float(distances[0, 0])
+        if distance > tolerance:
+            return "Unknown Person", distance
+        return self.names[indices[0, 0]], distance
+
+    def close(self):
+        """Release a shared-memory attachment; galleries built in-process hold nothing to release"""
+        shm = getattr(self, "shm", None)
+        if shm is not None:
+            self.exact = self.codes = self.code_norms = self.scale = None
+            self.shm = None
+            shm.close()
+
+    def memory_report(self):
+        """Bytes this gallery keeps in memory, against a float32 gallery and the pickled float64 layout"""
+        dim = self.exact.shape[1]
+        coarse = self.codes.nbytes + self.code_norms.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+        mapped = isinstance(self.exact, np.memmap)
+        # float32 galleries scan the exact rows themselves; memory-mapped rows are paged in on demand
+        exact = 0 if self.codes is self.exact or mapped else self.exact.nbytes
+        float32_bytes = len(self.names) * (dim * 4 + 4)
+        total = coarse + exact
+        return {
+            'rows': len(self.names),
+            'float64_bytes': len(self.names) * dim * 8,
+            'float32_bytes': float32_bytes,
+            'coarse_bytes': coarse,
+            'exact_bytes': exact,
+            'mapped_bytes': self.exact.nbytes if mapped else 0,
+            'total_bytes': total,
+            'saving': (1 - total / float32_bytes) * 100 if float32_bytes else 0
+        }
+
+class SharedGallery:
+    """A gallery's arrays published once in shared memory for worker processes
+
+    Workers call ``Gallery.from_shared(spec)`` and search read-only views of
+    the block, so N processes hold one copy of the encodings instead of N.
+    The owner unlinks the block with ``close()``; workers that are still
+    attached keep their mapping until they drop it.
+    """
+
+    FIELDS = ("exact", "codes", "code_norms", "scale")
+
+    def __init__(self, gallery):
+        arrays = [(field, getattr(gallery, field)) for field in self.FIELDS
+                  if getattr(gallery, field) is not None
+                  and not (field == "codes" and gallery.precision == "float32")]
+        layout = []
+        offset = 0
+        for field, array in arrays:
+            offset = (offset + 63) // 64 * 64
+            layout.append((field, array.dtype.str, array.shape, offset))
+            offset += array.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (field, dtype, shape, start), (_, array) in zip(layout, arrays):
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=start)[...] = array
+        self.nbytes = offset
+        self.spec = {"name": self.shm.name, "names": list(gallery.names), "precision": gallery.precision,
+                     "rerank_k": gallery.rerank_k, "block_rows": gallery.block_rows, "layout": layout}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+class GalleryReloader:
+    """Rebuild the gallery in the background when its file changes, swap it in between frames
+
+    The watcher thread only ever fills ``pending``; the frame loop calls
+    ``swap()`` at a frame boundary, so matching keeps using the old gallery
+    until the new one is fully built and never sees a half-loaded state.
+    """
+
+    def __init__(self, encodings_path, build, current=None, poll_interval=2.0):
+        self.encodings_path = encodings_path
+        self.build = build
+        self.current = current
+        self.pending = None
+        self.lock = threading.Lock()
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self.last_signature = self._signature()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.encodings_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _watch(self):
+        while not self.stopped.wait(self.poll_interval):
+            signature = self._signature()
+            if signature is None or signature == self.last_signature:
+                continue
+            rss_before = get_rss_bytes()
+            start = time.perf_counter()
+            try:
+                gallery = self.build(self.encodings_path)
+            except Exception as e:
+                print(f"[WARNING] Gallery reload failed, keeping the current one: {e}")
+                continue
+            finally:
+                # Don't retry a broken file until it changes again
+                self.last_signature = signature
+            load_ms = (time.perf_counter() - start) * 1000
+            old_report = self.current.memory_report() if self.current else None
+            old_bytes = old_report['total_bytes'] if old_report else 0
+            new_report = gallery.memory_report()
+            new_bytes = new_report['total_bytes']
+            print(f"[INFO] Gallery rebuilt: {len(gallery)} rows in {load_ms:.0f} ms, "
+                  f"gallery memory {(new_bytes - old_bytes) / 1024:+.0f} KB, "
+                  f"process RSS {(get_rss_bytes() - rss_before) / 1024:+.0f} KB")
+            with self.lock:
+                replaced, self.pending = self.pending, gallery
+            if replaced is not None:
+                # Built but never swapped in; release its shared memory or shard processes
+                replaced.close()
+
+    def swap(self):
+        """Adopt a newly built gallery if one is ready; call between frames"""
+        with self.lock:
+            gallery, self.pending = self.pending, None
+        if gallery is not None:
+            self.current = gallery
+            self.reloads += 1
+        return self.current
+
+    def stop(self):
+        """Stop watching and close a gallery that was built but never swapped in"""
+        self.stopped.set()
+        self.thread.join()
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending is not None:
+            pending.close()
+
+def _k_medoids(distances, k, max_iter=20):
+    """Indices of k medoids for one person's pairwise distance matrix"""
+    # Farthest-point seeding from the overall medoid spreads the prototypes
+    # across poses and lighting instead of clustering them at the mean
+    medoids = [int(np.argmin(distances.sum(axis=1)))]
+    while len(medoids) < k:
+        nearest = distances[:, medoids].min(axis=1)
+        if nearest.max() == 0:
+            break  # fewer distinct encodings than k, e.g. duplicate photos
+        medoids.append(int(np.argmax(nearest)))
+
+    for _ in range(max_iter):
+        assignment = np.argmin(distances[:, medoids], axis=1)
+        updated = []
+        for cluster, medoid in enumerate(medoids):
+            members = np.flatnonzero(assignment == cluster)
+            if len(members) == 0:
+                updated.append(medoid)  # a tie sent all its rows to an identical medoid
+                continue
+            within = distances[np.ix_(members, members)].sum(axis=1)
+            updated.append(int(members[np.argmin(within)]))
+        updated = list(dict.fromkeys(updated))
+        if updated == medoids:
+            break
+        medoids = updated
+    return medoids
+
+def compact_gallery(encodings, names, prototypes=5, max_radius=0.15):
+    """Reduce each person's encodings to k-medoid prototypes plus outliers
+
+    Every dropped encoding lies within ``max_radius`` of a kept row, so the
+    nearest-neighbour distance to a person can grow by at most that much and
+    the recognition tolerance keeps its meaning. Encodings farther than that
+    from their prototype are kept as-is to preserve the person's spread.
+
+    Duplicate encodings collapse to one prototype:
+
+    >>> rows = np.vstack([np.zeros((10, 128)), np.eye(128)[:2]])
+    >>> compact_gallery(rows, ["a"] * 12, prototypes=5)["names"]
+    ['a', 'a', 'a']
+    """
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(len(names), -1)
+    names = list(names)
+    kept_encodings = []
+    kept_names = []
+    largest_radius = 0.0
+    spread = {}
+
+    for person in sorted(set(names)):
+        rows = np.array([i for i, name in enumerate(names) if name == person])
+        person_encodings = encodings[rows]
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b, without an n x n x 128 difference array
+        norms = np.einsum("ij,ij->i", person_encodings, person_encodings)
+        squared = norms[:, None] + norms[None, :] - 2.0 * (person_encodings @ person_encodings.T)
+        distances = np.sqrt(np.maximum(squared, 0))
+        distances[distances < 1e-6] = 0  # rounding noise between duplicate photos
+        spread[person] = float(distances.max())
+
+        if len(rows) <= prototypes:
+            keep = list(range(len(rows)))
+        else:
+            keep = _k_medoids(distances, prototypes)
+            nearest = distances[:, keep].min(axis=1)
+            keep += [i for i in np.flatnonzero(nearest > max_radius) if i not in keep]
+
+        largest_radius = max(largest_radius, float(distances[:, keep].min(axis=1).max()))
+        kept_encodings.extend(person_encodings[keep])
+        kept_names.extend([person] * len(keep))
+
+    return {
+        "encodings": kept_encodings,
+        "names": kept_names,
+        "compaction": {
+            "prototypes": prototypes,
+            "source_rows": len(names),
+            "max_radius": largest_radius,
+            "spread": spread
+        }
+    }
+
+def evaluate_precision(encodings, names, precision, rerank_k=8, queries=None, noise=0.02, sample=1000, seed=0):
+    """Compare a reduced-precision gallery with the exact float32 one"""
+    exact = Gallery(encodings, names, "float32")
+    reduced = Gallery(encodings, names, precision, rerank_k)
+    if queries is None:
+        # Perturbed gallery rows stand in for fresh captures of enrolled people
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(exact), size=min(sample, len(exact)), replace=False)
+        queries = exact.exact[rows] + rng.normal(0, noise, (len(rows), exact.exact.shape[1])).astype(np.float32)
+
+    timings = {}
+    results = {}
+    for label, gallery, rerank in (("exact", exact, True), ("coarse", reduced, False), ("reranked", reduced, True)):
+        start = time.perf_counter()
+        results[label] = gallery.search(queries, k=1, rerank=rerank)
+        timings[label] = time.perf_counter() - start
+
+    # Live systems match one face at a time, where the scan is bound by memory traffic
+    single = {}
+    for label, gallery in (("exact", exact), ("reduced", reduced)):
+        start = time.perf_counter()
+        for query in queries[:100]:
+            gallery.search(query, k=1)
+        single[label] = (time.perf_counter() - start) / min(100, len(queries))
+
+    truth_idx, truth_dist = results["exact"]
+    report = reduced.memory_report()
+    report.update({
+        'precision': precision,
+        'queries': len(queries),
+        'coarse_top1_agreement': float(np.mean(results["coarse"][0][:, 0] == truth_idx[:, 0]) * 100),
+        'reranked_top1_agreement': float(np.mean(results["reranked"][0][:, 0] == truth_idx[:, 0]) * 100),
+        'coarse_max_distance_error': float(np.max(np.abs(results["coarse"][1][:, 0] - truth_dist[:, 0]))),
+        'exact_seconds': timings["exact"],
+        'reranked_seconds': timings["reranked"],
+        'exact_match_seconds': single["exact"],
+        'reduced_match_seconds': single["reduced"]
+    })
+    return report
+
+def compact_encodings(data, output_path, prototypes, max_radius=0.15, noise=0.02, sample=1000, seed=0):
+    """Compact a gallery, check recognition against the full one and save it"""
+    compacted = compact_gallery(data["encodings"], data["names"], prototypes, max_radius)
+    full = Gallery(data["encodings"], data["names"])
+    small = Gallery(compacted["encodings"], compacted["names"])
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(full), size=min(sample, len(full)), replace=False)
+    queries = full.exact[rows] + rng.normal(0, noise, (len(rows), full.exact.shape[1])).astype(np.float32)
+    full_names = [full.names[i] for i in full.search(queries)[0][:, 0]]
+    small_names = [small.names[i] for i in small.search(queries)[0][:, 0]]
+    agreement = np.mean([a == b for a, b in zip(full_names, small_names)]) * 100
+
+    # Atomic, since the output may be the encodings file a running system reloads
+    save_gallery_data(output_path, compacted)
+
+    info = compacted["compaction"]
+    print(f"[SUCCESS] Compacted {info['source_rows']} encodings to {len(compacted['names'])} "
+          f"({info['source_rows'] / max(1, len(compacted['names'])):.1f}x fewer rows)")
+    print(f"[INFO] Max distance from a dropped encoding to its prototype: {info['max_radius']:.3f}")
+    print(f"[INFO] Top-1 identity agreement with the full gallery: {agreement:.2f}%")
+    print(f"[INFO] Compacted encodings saved to: {output_path}")
+    return compacted
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-e", "--encodings", default="encodings.pickle",
+                   help="path to serialized db of facial encodings")
+    ap.add_argument("-p", "--precision", choices=PRECISIONS, default="int8",
+                   help="coarse search precision to evaluate")
+    ap.add_argument("-k", "--rerank-k", type=int, default=8,
+                   help="number of coarse candidates re-ranked exactly")
+    ap.add_argument("-c", "--compact", type=int, default=0,
+                   help="reduce each person to this many prototypes and write --output")
+    ap.add_argument("-r", "--max-radius", type=float, default=0.15,
+                   help="keep encodings farther than this from every prototype")
+    ap.add_argument("-o", "--output", default="encodings_compact.pickle",
+                   help="where to write the compacted encodings")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.encodings):
+        print(f"[ERROR] Encodings file '{args.encodings}' does not exist")
+        return
+
+    data = load_gallery_data(args.encodings)
+    if args.compact:
+        compact_encodings(data, args.output, args.compact, args.max_radius)
+        return
+
+    report = evaluate_precision(data["encodings"], data["names"], args.precision, args.rerank_k)
+
+    print(f"\n=== GALLERY [{report['precision']}] ===")
+    print(f"Rows: {report['rows']}")
+    print(f"Memory: {report['total_bytes'] / 1024:.1f} KB (float32 gallery: {report['float32_bytes'] / 1024:.1f} KB, "
+          f"{report['saving']:.1f}% saved; pickled float64: {report['float64_bytes'] / 1024:.1f} KB)")
+    if report['mapped_bytes']:
+        print(f"Exact rows for re-ranking: {report['mapped_bytes'] / 1024:.1f} KB memory-mapped, paged in on demand")
+    print(f"Top-1 agreement, coarse only: {report['coarse_top1_agreement']:.2f}%")
+    print(f"Top-1 agreement, re-ranked: {report['reranked_top1_agreement']:.2f}%")
+    print(f"Max coarse distance error: {report['coarse_max_distance_error']:.4f}")
+    print(f"Search time: exact {report['exact_seconds'] * 1000:.1f} ms, "
+          f"re-ranked {report['reranked_seconds'] * 1000:.1f} ms for {report['queries']} queries")
+    print(f"Single-face match: exact {report['exact_match_seconds'] * 1000:.2f} ms, "
+          f"{report['precision']} {report['reduced_match_seconds'] * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import numpy as np
+import os
+import json
+import time
+import zlib
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from gallery import Gallery, load_gallery_data, save_gallery_data
+
+SHARD_MANIFEST = "manifest.json"
+
+def shard_of(name, shards):
+    """Stable shard for a person: all of their encodings live together, and adding people moves no one"""
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+def split_gallery(encodings_path, shards, shard_dir=None):
+    """Write the encodings file as ``shards`` smaller files plus a manifest; returns the manifest path
+
+    This is the only step that reads the whole gallery at once; run it
+    where memory allows and copy the shard directory to the serving hosts.
+    """
+    shard_dir = shard_dir or encodings_path + ".shards"
+    os.makedirs(shard_dir, exist_ok=True)
+    st = os.stat(encodings_path)
+    data = load_gallery_data(encodings_path)
+    names = list(data["names"])
+    encodings = np.asarray(data["encodings"], dtype=np.float32).reshape(len(names), -1)
+    paths = data.get("paths")
+    assignment = np.array([shard_of(name, shards) for name in names], dtype=np.int64)
+
+    files, rows = [], []
+    for shard in range(shards):
+        members = np.nonzero(assignment == shard)[0]
+        shard_data = {"encodings": encodings[members], "names": [names[i] for i in members]}
+        if paths:
+            shard_data["paths"] = [paths[i] for i in members]
+        filename = f"shard_{shard:03d}.pickle"
+        save_gallery_data(os.path.join(shard_dir, filename), shard_data)
+        files.append(filename)
+        rows.append(len(members))
+
+    manifest = {"source": os.path.abspath(encodings_path), "source_signature": [st.st_mtime_ns, st.st_size],
+                "shards": shards, "files": files, "rows": rows}
+    manifest_path = os.path.join(shard_dir, SHARD_MANIFEST)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, manifest_path)
+    print(f"[INFO] Split {len(names)} encodings into {shards} shards under {shard_dir}/ "
+          f"(rows per shard {min(rows)}-{max(rows)})")
+    return manifest_path
+
+def ensure_shards(encodings_path, shards, shard_dir=None):
+    """Manifest path for an up-to-date split of encodings_path, re-splitting only if it changed"""
+    shard_dir = shard_dir or encodings_path + ".shards"
+    manifest_path = os.path.join(shard_dir, SHARD_MANIFEST)
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        st = os.stat(encodings_path)
+        if manifest["shards"] == shards and manifest["source_signature"] == [st.st_mtime_ns, st.st_size]:
+            return manifest_path
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return split_gallery(encodings_path, shards, shard_dir)
+
+def _shard_worker(path, precision, rerank_k, conn):
+    """Serve k-nearest searches over one shard: ("search", seq, queries, k) in, ("result", ...) out"""
+    try:
+        gallery = Gallery.from_file(path, precision, rerank_k)
+        conn.send(("ready", gallery.names, gallery.memory_report(), gallery.exact.shape[1]))
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            _, seq, queries, k = message
+            start = time.perf_counter()
+            indices, distances = gallery.search(queries, k)
+            conn.send(("result", seq, indices, distances, time.perf_counter() - start))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        conn.close()
+
+class ShardedGallery:
+    """Gallery matching scattered over shard worker processes, with the Gallery search/match interface
+
+    Each worker loads only its shard file, so no process ever holds the
+    whole gallery, and the shards are searched on separate cores at once.
+    A query batch goes to every shard; each returns its local top-k, which
+    are merged into the global top-k by distance. Shards that miss
+    ``timeout_ms`` are left out of that answer and counted, so one slow or
+    crashed shard costs recall for a moment rather than a stalled frame.
+    Crashed workers are restarted in the background.
+
+    A shard is only a Connection to talk to, so a shard served from
+    another host over ``multiprocessing.connection`` fits the same loop.
+    """
+
+    def __init__(self, manifest_path, precision="float32", rerank_k=8, timeout_ms=50.0, start_timeout=300.0):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        shard_dir = os.path.dirname(os.path.abspath(manifest_path))
+        self.paths = [os.path.join(shard_dir, filename) for filename in manifest["files"]]
+        self.precision = precision
+        self.rerank_k = rerank_k
+        self.timeout = timeout_ms / 1000.0
+        methods = multiprocessing.get_all_start_methods()
+        # Never fork a process that may already be running reloader and dispatcher threads
+        self.mp = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.shards = [self._new_shard(path) for path in self.paths]
+
+        # Wait for every shard once, so the global index layout is known
+        deadline = time.monotonic() + start_timeout
+        for shard in self.shards:
+            try:
+                if not shard["conn"].poll(max(0.0, deadline - time.monotonic())):
+                    raise TimeoutError(f"Gallery shard {shard['path']} did not load within {start_timeout:.0f} s")
+                self._handle(shard, shard["conn"].recv())
+            except EOFError:
+                self.close()
+                raise RuntimeError(f"Gallery shard worker for {shard['path']} exited while loading")
+            except TimeoutError:
+                self.close()
+                raise
+        self.names = []
+        self.offsets = []
+        for shard in self.shards:
+            self.offsets.append(len(self.names))
+            self.names.extend(shard["names"])
+        self.offsets = np.array(self.offsets, dtype=np.int64)
+
+    def _new_shard(self, path, previous=None):
+        parent_conn, child_conn = self.mp.Pipe()
+        process = self.mp.Process(target=_shard_worker, args=(path, self.precision, self.rerank_k, child_conn),
+                                  name=f"gallery-{os.path.basename(path)}", daemon=True)
+        process.start()
+        child_conn.close()
+        shard = previous if previous is not None else {
+            "path": path, "names": None, "memory": None, "timeouts": 0, "restarts": 0,
+            "latencies": deque(maxlen=1000), "search_seconds": deque(maxlen=1000)
+        }
+        shard.update(process=process, conn=parent_conn, ready=False)
+        return shard
+
+    def _restart(self, shard):
+        try:
+            shard["conn"].close()
+        except OSError:
+            pass
+        if shard["process"].is_alive():
+            shard["process"].kill()
+        shard["process"].join(1)
+        shard["restarts"] += 1
+        print(f"[WARNING] Gallery shard {os.path.basename(shard['path'])} died; restarting")
+        self._new_shard(shard["path"], shard)
+
+    def _handle(self, shard, message):
+        """Process one worker message; returns it if it is a search result"""
+        if message[0] == "ready":
+            _, names, memory, self.dimensions = message
+            if shard["names"] is not None and names != shard["names"]:
+                # The file was re-split under us; its rows would land on the wrong global indices
+                print(f"[ERROR] Gallery shard {shard['path']} changed on disk; it stays out until the gallery is reloaded")
+                return None
+            shard.update(names=names, memory=memory, ready=True)
+            return None
+        return message
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, queries, k=1, rerank=True):
+        """Return (indices, distances) of the k nearest rows across all shards, like Gallery.search
+
+        Indices refer to ``self.names``, which lists the shards' rows shard
+        by shard rather than in the order of the encodings file.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dimensions)
+        k = min(k, len(self.names))
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            sent = []
+            for number, shard in enumerate(self.shards):
+                if not shard["ready"] and shard["conn"].poll():
+                    # A restarted worker finished loading
+                    self._handle(shard, shard["conn"].recv())
+                if not shard["ready"]:
+                    continue
+                try:
+                    shard["conn"].send(("search", seq, queries, k))
+                    sent.append((number, shard, time.perf_counter()))
+                except (OSError, EOFError):
+                    self._restart(shard)
+
+            deadline = time.perf_counter() + self.timeout
+            indices, distances = [], []
+            for number, shard, started in sent:
+                result = self._gather(shard, seq, deadline)
+                if result is None:
+                    continue
+                local_indices, local_distances, search_seconds = result
+                shard["latencies"].append(time.perf_counter() - started)
+                shard["search_seconds"].append(search_seconds)
+                indices.append(local_indices + self.offsets[number])
+                distances.append(local_distances)
+
+        if not indices:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        indices = np.concatenate(indices, axis=1)
+        distances = np.concatenate(distances, axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(distances, order, axis=1)
+
+    def _gather(self, shard, seq, deadline):
+        conn = shard["conn"]
+        try:
+            while conn.poll(max(0.0, deadline - time.perf_counter())):
+                message = self._handle(shard, conn.recv())
+                # Answers to earlier requests that timed out arrive late; skip them
+                if message is not None and message[1] == seq:
+                    return message[2:]
+        except (OSError, EOFError):
+            self._restart(shard)
+            return None
+        shard["timeouts"] += 1
+        return None
+
+    def match(self, encoding, tolerance=0.6):
+        """Return (name, distance) of the nearest known face, or ("Unknown Person", distance)"""
+        if not self.names:
+            return "Unknown Person", float("inf")
+        indices, distances = self.search(encoding, k=1)
+        if indices.shape[1] == 0:
+            return "Unknown Person", float("inf")
+        distance = float(distances[0, 0])
+        if distance > tolerance:
+            return "Unknown Person", distance
+        return self.names[indices[0, 0]], distance
+
+    def memory_report(self):
+        """Gallery.memory_report summed over shards; the bytes live in the worker processes"""
+        reports = [shard["memory"] for shard in self.shards if shard["memory"]]
+        report = {key: sum(r[key] for r in reports)
+                  for key in ('rows', 'float64_bytes', 'float32_bytes', 'coarse_bytes', 'exact_bytes', 'mapped_bytes', 'total_bytes')}
+        report['saving'] = (1 - report['total_bytes'] / report['float32_bytes']) * 100 if report['float32_bytes'] else 0
+        report['shards'] = len(self.shards)
+        return report
+
+    def stats(self):
+        """Per-shard round-trip and in-worker search latency, timeouts and restarts"""
+        def pick(values, q):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0
+
+        return [{
+            'shard': os.path.basename(shard['path']),
+            'rows': len(shard['names'] or []),
+            'ready': shard['ready'],
+            'p50_ms': pick(shard['latencies'], 0.5),
+            'p99_ms': pick(shard['latencies'], 0.99),
+            'search_p50_ms': pick(shard['search_seconds'], 0.5),
+            'timeouts': shard['timeouts'],
+            'restarts': shard['restarts']
+        } for shard in self.shards]
+
+    def close(self):
+        for shard in self.shards:
+            try:
+                shard["conn"].send(None)
+            except (OSError, EOFError):
+                pass
+        for shard in self.shards:
+            shard["process"].join(2)
+            if shard["process"].is_alive():
+                shard["process"].kill()
+            shard["conn"].close()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-e", "--encodings", default="encodings.pickle",
+                   help="path to serialized db of facial encodings")
+    ap.add_argument("-n", "--shards", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--shard-dir", default=None, help="where to write the shards (default: <encodings>.shards)")
+    ap.add_argument("--synthetic", type=int, default=0,
+                   help="benchmark on this many random encodings instead of --encodings")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=1, help="queries per search call")
+    ap.add_argument("--timeout-ms", type=float, default=1000.0)
+    ap.add_argument("-p", "--precision", default="float32")
+    args = ap.parse_args()
+
+    encodings_path = args.encodings
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        encodings_path = os.path.join(tempfile.mkdtemp(prefix="shards_"), "synthetic.pickle")
+        encodings = rng.normal(0, 0.1, (args.synthetic, 128)).astype(np.float32)
+        save_gallery_data(encodings_path, {"encodings": encodings, "names": [f"person_{i // 4}" for i in range(args.synthetic)]})
+    elif not os.path.exists(encodings_path):
+        print(f"[ERROR] Encodings file '{encodings_path}' does not exist")
+        return
+
+    manifest_path = ensure_shards(encodings_path, args.shards, args.shard_dir)
+    start = time.perf_counter()
+    sharded = ShardedGallery(manifest_path, args.precision, timeout_ms=args.timeout_ms)
+    print(f"[INFO] {len(sharded.shards)} shard workers ready in {time.perf_counter() - start:.1f} s, "
+          f"{len(sharded)} encodings")
+
+    single = Gallery.from_file(encodings_path, args.precision)
+    rng = np.random.default_rng(1)
+    queries = single.exact[rng.integers(len(single), size=args.queries)] + rng.normal(0, 0.02, (args.queries, 128)).astype(np.float32)
+
+    def timed(search):
+        start = time.perf_counter()
+        found = [search(queries[i:i + args.batch]) for i in range(0, args.queries, args.batch)]
+        return (time.perf_counter() - start) / len(found) * 1000, np.concatenate([f[1][:, 0] for f in found])
+
+    single_ms, single_best = timed(lambda q: single.search(q, k=5))
+    sharded_ms, sharded_best = timed(lambda q: sharded.search(q, k=5))
+    print(f"Single process: {single_ms:.2f} ms per call")
+    print(f"Sharded:        {sharded_ms:.2f} ms per call ({single_ms / sharded_ms:.2f}x)")
+    print(f"Top-1 distance agreement: {np.mean(np.isclose(single_best, sharded_best, atol=1e-5)) * 100:.2f}%")
+    for shard in sharded.stats():
+        print(f"  {shard['shard']}: {shard['rows']} rows, round trip p50 {shard['p50_ms']:.2f} ms / "
+              f"p99 {shard['p99_ms']:.2f} ms, search p50 {shard['search_p50_ms']:.2f} ms, "
+              f"{shard['timeouts']} timeouts, {shard['restarts']} restarts")
+    sharded.close()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
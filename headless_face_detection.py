@@ -2,39 +2,166 @@ import cv2
 import numpy as np
 import os
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 import time
-import requests  # For optional web notifications
+import glob
+import argparse
+import multiprocessing
+import queue
+from shared_frames import SharedFrameRing
+from embedding_cache import EmbeddingCache, FaceTracker, crop_fingerprint
+from gallery import Gallery, GalleryReloader
+from face_quality import FaceQualityGate
+from notifications import WebhookDispatcher
+from access_stats import get_stats_engine
+from frame_context import FrameContext, UNKNOWN_NAME
+from tiled_detection import TiledDetector
+from frame_sources import open_source, VIDEO_EXTENSIONS, IMAGE_EXTENSIONS
+from clip_recorder import ClipRecorder
+from face_scheduler import FaceScheduler
+from gallery_shards import ShardedGallery, ensure_shards
+
+try:
+    import face_recognition
+except ImportError:  # dlib is optional; without it we run detection only
+    face_recognition = None
 
 class HeadlessFaceAccessControl:
-    def __init__(self):
-        self.config = self.load_config()
-        self.init_database()
+    def __init__(self, config=None, use_database=True, gallery=None, record_clips=None):
+        self.config = config or self.load_config()
+        if use_database:
+            self.init_database()
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         self.known_faces = {}
         self.access_count = 0
+        self.saved_faces = 0
         self.load_known_faces()
+        self.frame_context = FrameContext()
+        self.known_name_ids = np.array([self.frame_context.name_id(name) for name in self.known_faces],
+                                       dtype=np.int32)
+        self.gallery = None
+        self.gallery_reloader = None
+        if gallery is not None:
+            # Shared by a supervisor process, which also handles reloads
+            self.gallery = gallery
+        else:
+            self.load_encodings()
+        self.quality_gate = None
+        if self.config.get("quality_gate", True):
+            self.quality_gate = FaceQualityGate(self.config)
+            print(f"[INFO] Quality gate thresholds: {self.quality_gate.thresholds}")
+        self.notifier = None
+        if use_database and self.config.get("webhook_url"):
+            self.notifier = WebhookDispatcher(
+                self.config["webhook_url"],
+                window_seconds=self.config.get("webhook_window_seconds", 1.0),
+                max_queue=self.config.get("webhook_max_queue", 1000),
+                overflow=self.config.get("webhook_overflow", "drop_oldest")
+            )
+        self.tiled_detector = None
+        if self.config.get("tiled_detection", False):
+            self.tiled_detector = TiledDetector(
+                scale_factor=self.config["detection_scale"],
+                min_neighbors=self.config["min_neighbors"],
+                tile_size=self.config.get("detection_tile_size", 0),
+                overlap=self.config.get("detection_tile_overlap", 0),
+                workers=self.config.get("detection_threads", 0)
+            )
+        self.clip_recorder = None
+        # Pool workers leave clips to the process that owns the camera
+        if record_clips is None:
+            record_clips = use_database
+        if record_clips and self.config.get("clip_recording", False):
+            self.clip_recorder = ClipRecorder(
+                output_dir=self.config.get("clip_dir", "clips"),
+                pre_roll=self.config.get("clip_pre_roll", 5.0),
+                post_roll=self.config.get("clip_post_roll", 3.0),
+                fps=self.config.get("clip_fps", 10),
+                max_memory_mb=self.config.get("clip_max_memory_mb", 64),
+                jpeg_quality=self.config.get("clip_jpeg_quality", 80),
+                max_width=self.config.get("clip_max_width", 1280)
+            )
+        self.face_scheduler = None
+        if self.config.get("face_deadline_ms", 200) > 0:
+            self.face_scheduler = FaceScheduler(
+                budget_ms=self.config.get("face_deadline_ms", 200),
+                door_roi=self.config.get("door_roi"),
+                roi_weight=self.config.get("schedule_roi_weight", 2.0),
+                identified_factor=self.config.get("schedule_identified_factor", 0.25)
+            )
+        self.tracker = FaceTracker()
+        self.embedding_cache = EmbeddingCache(
+            max_memory_mb=self.config.get("embedding_cache_max_mb", 16),
+            ttl_seconds=self.config.get("embedding_cache_ttl", 2.0),
+            max_hamming=self.config.get("embedding_cache_max_hamming", 6)
+        )
         
-    def load_config(self):
+    @staticmethod
+    def load_config():
         try:
             with open('config.json', 'r') as f:
                 return json.load(f)
         except FileNotFoundError:
             return {
                 "camera_index": 0,
-                "confidence_threshold": 70,
+                "confidence_threshold": 40,  # percent; recognition confidence is 1 - distance
                 "unknown_faces_dir": "unknown_faces",
                 "save_unknown_faces": True,
                 "log_to_database": True,
                 "detection_scale": 1.1,
                 "min_neighbors": 5,
                 "process_interval": 10,  # Process every 10th frame
-                "save_detected_faces": True
+                "save_detected_faces": True,
+                "encodings_path": "encodings.pickle",
+                "recognition_tolerance": 0.6,
+                "gallery_precision": "float32",
+                "gallery_rerank_k": 8,
+                "gallery_hot_reload": True,
+                "gallery_reload_interval": 2.0,
+                "embedding_cache_max_mb": 16,
+                "embedding_cache_ttl": 2.0,
+                "embedding_cache_max_hamming": 6,
+                "quality_gate": True,
+                "quality_min_size": 60,
+                "quality_min_sharpness": 20.0,
+                "quality_min_brightness": 40.0,
+                "quality_max_brightness": 220.0,
+                "quality_min_contrast": 20.0,
+                "quality_min_frontalness": 0.5,
+                "webhook_url": "",
+                "webhook_window_seconds": 1.0,
+                "webhook_max_queue": 1000,
+                "webhook_overflow": "drop_oldest",
+                "tiled_detection": False,
+                "tiled_min_width": 1920,  # Only tile frames at least this wide
+                "detection_tile_size": 0,  # 0 picks one tile per thread
+                "detection_tile_overlap": 0,  # 0 uses 4x the minimum face size
+                "detection_threads": 0,  # 0 uses every core
+                "source_realtime": False,
+                "source_loop": False,
+                "clip_recording": False,
+                "clip_dir": "clips",
+                "clip_pre_roll": 5.0,  # Seconds kept in memory before an event
+                "clip_post_roll": 3.0,
+                "clip_fps": 10,
+                "clip_max_memory_mb": 64,
+                "clip_jpeg_quality": 80,
+                "clip_max_width": 1280,
+                "face_deadline_ms": 200,  # Per-frame budget for face work; 0 handles every face
+                "door_roi": None,  # [x, y, w, h] as fractions of the frame
+                "schedule_roi_weight": 2.0,
+                "schedule_identified_factor": 0.25,
+                "gallery_shards": 0,  # >0 splits the gallery over this many matcher processes
+                "gallery_shard_dir": "",  # default: <encodings_path>.shards
+                "gallery_shard_timeout_ms": 50
             }
     
-    def init_database(self):
+    @staticmethod
+    def init_database():
         conn = sqlite3.connect('access_logs.db')
+        # WAL lets dashboards and log archiving run without blocking inserts
+        conn.execute('PRAGMA journal_mode=WAL')
         conn.execute('''
             CREATE TABLE IF NOT EXISTS access_logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,6 +172,7 @@ class HeadlessFaceAccessControl:
                 image_path TEXT
             )
         ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_access_time ON access_logs (access_time)')
         conn.commit()
         conn.close()
         print("[INFO] Database initialized")
@@ -66,6 +194,94 @@ class HeadlessFaceAccessControl:
         if self.known_faces:
             print(f"[INFO] Total known persons: {len(self.known_faces)}")
     
+    def build_gallery(self, encodings_path):
+        shards = self.config.get("gallery_shards", 0)
+        if shards > 0:
+            # Re-split only when the encodings file changed since the last split
+            return ShardedGallery(
+                ensure_shards(encodings_path, shards, self.config.get("gallery_shard_dir") or None),
+                precision=self.config.get("gallery_precision", "float32"),
+                rerank_k=self.config.get("gallery_rerank_k", 8),
+                timeout_ms=self.config.get("gallery_shard_timeout_ms", 50)
+            )
+        return Gallery.from_file(
+            encodings_path,
+            precision=self.config.get("gallery_precision", "float32"),
+            rerank_k=self.config.get("gallery_rerank_k", 8)
+        )
+    
+    def load_encodings(self):
+        """Load gallery encodings produced by encode_faces.py for real recognition"""
+        encodings_path = self.config.get("encodings_path", "encodings.pickle")
+        if face_recognition is None:
+            return
+        
+        if os.path.exists(encodings_path):
+            self.gallery = self.build_gallery(encodings_path)
+            memory = self.gallery.memory_report()
+            print(f"[INFO] Loaded {len(self.gallery)} encodings for {len(set(self.gallery.names))} persons "
+                  f"({self.gallery.precision}, {memory['total_bytes'] / 1024:.0f} KB in memory)")
+        
+        tolerance = self.config.get("recognition_tolerance", 0.6)
+        if self.config["confidence_threshold"] / 100.0 > 1.0 - tolerance + 1e-9:
+            # Confidence is 1 - distance, so matches between the two limits are named but denied
+            print(f"[WARNING] confidence_threshold {self.config['confidence_threshold']} only grants matches closer "
+                  f"than {1.0 - self.config['confidence_threshold'] / 100.0:.2f}, although recognition_tolerance "
+                  f"is {tolerance}; set it to {(1.0 - tolerance) * 100:.0f} or run calibrate_threshold.py")
+        
+        if self.config.get("gallery_hot_reload", True):
+            # Pick up enrollments without restarting; also covers a gallery created later
+            self.gallery_reloader = GalleryReloader(
+                encodings_path, self.build_gallery, self.gallery,
+                poll_interval=self.config.get("gallery_reload_interval", 2.0)
+            )
+    
+    def refresh_gallery(self):
+        """Switch to a freshly reloaded gallery, if any; called between frames"""
+        if self.gallery_reloader is None:
+            return
+        gallery = self.gallery_reloader.swap()
+        if gallery is not self.gallery:
+            previous = self.gallery
+            self.use_gallery(gallery)
+            if previous is not None:
+                # Stops the old shard workers; a no-op for in-process galleries
+                previous.close()
+    
+    def use_gallery(self, gallery):
+        self.gallery = gallery
+        # Cached match results refer to the old gallery
+        self.embedding_cache.clear()
+        print(f"[INFO] Switched to reloaded gallery ({len(gallery)} encodings)")
+    
+    def reset_tracking(self):
+        """Start over on an unrelated input: no track or cached encoding carries over"""
+        self.tracker.reset()
+        self.embedding_cache.clear()
+    
+    def match_encoding(self, encoding):
+        """Return (name, confidence) of the nearest gallery encoding"""
+        name, distance = self.gallery.match(encoding, self.config.get("recognition_tolerance", 0.6))
+        return name, max(0.0, 1.0 - distance)
+    
+    def recognize_faces(self, ctx, indices=None):
+        """Encode and match faces (all, or those at indices), reusing cached results for near-identical crops"""
+        records = ctx.records
+        for i in range(ctx.count) if indices is None else indices:
+            record = records[i]
+            x, y, w, h = (int(v) for v in record["bbox"])
+            track_id = int(record["track_id"])
+            fingerprint = crop_fingerprint(ctx.gray[y:y+h, x:x+w])
+            entry = self.embedding_cache.lookup(track_id, fingerprint)
+            if entry is None:
+                # ctx.rgb converts the frame at most once, and only on a cache miss
+                encoding = face_recognition.face_encodings(ctx.rgb, [(y, x + w, y + h, x)])[0]
+                entry = self.embedding_cache.store(track_id, fingerprint, encoding,
+                                                   self.match_encoding(encoding))
+            name, confidence = entry.match
+            record["name_id"] = ctx.name_id(name)
+            record["confidence"] = confidence
+    
     def log_access_attempt(self, user_name, success, confidence, image_path=None):
         conn = sqlite3.connect('access_logs.db')
         conn.execute(
@@ -75,6 +291,11 @@ class HeadlessFaceAccessControl:
         conn.commit()
         conn.close()
         
+        if self.notifier is not None:
+            # Queued for the background dispatcher; never blocks the frame loop
+            self.notifier.notify({"user_name": user_name, "success": bool(success),
+                                  "confidence": float(confidence), "image_path": image_path})
+        
         # Print to console
         status = "GRANTED" if success else "DENIED"
         timestamp = datetime.now().strftime("%H:%M:%S")
@@ -87,62 +308,90 @@ class HeadlessFaceAccessControl:
         face_img = frame[y:y+h, x:x+w]
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-        filename = f"{self.config['unknown_faces_dir']}/{prefix}_{timestamp}.jpg"
+        self.saved_faces += 1
+        # pid and counter keep names unique across batch workers and within one millisecond
+        filename = f"{self.config['unknown_faces_dir']}/{prefix}_{timestamp}_{os.getpid()}_{self.saved_faces}.jpg"
         cv2.imwrite(filename, face_img)
         return filename
     
-    def detect_faces(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    def detect_faces(self, frame, identify=True):
+        """Detect faces and, with identify, name them all; results are left in the returned FrameContext"""
+        ctx = self.frame_context
+        ctx.reset(frame)
         
         # Detect faces
-        faces = self.face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=self.config["detection_scale"], 
-            minNeighbors=self.config["min_neighbors"],
-            minSize=(30, 30)
-        )
+        if self.tiled_detector is not None and frame.shape[1] >= self.config.get("tiled_min_width", 1920):
+            faces = self.tiled_detector.detect(ctx.gray)
+        else:
+            faces = self.face_cascade.detectMultiScale(
+                ctx.gray, 
+                scaleFactor=self.config["detection_scale"], 
+                minNeighbors=self.config["min_neighbors"],
+                minSize=(30, 30)
+            )
         
-        results = []
-        for (x, y, w, h) in faces:
-            # Calculate face area for confidence estimation
-            face_area = w * h
-            confidence = min(1.0, face_area / 10000)  # Normalize confidence based on face size
-            
-            # Simple recognition simulation
-            if self.known_faces:
-                # Simulate recognizing a known person
-                known_names = list(self.known_faces.keys())
-                # Use face position to "determine" person (for demo)
-                person_index = x % len(known_names)
-                name = known_names[person_index]
-                confidence = 0.8 + (confidence * 0.2)  # Boost confidence for "known" persons
-            else:
-                name = "Unknown Person"
-            
-            results.append({
-                "name": name,
-                "confidence": confidence,
-                "bbox": (x, y, w, h)
-            })
+        if self.quality_gate is not None and len(faces) > 0:
+            # Low-quality hits skip encoding, crop writes and logging; the
+            # same person gets another chance on the next processed frame
+            accepted, _ = self.quality_gate.check(ctx.gray, faces)
+            faces = faces[accepted]
+        
+        records = ctx.set_boxes(faces)
+        if ctx.count == 0:
+            return ctx
         
-        return results
+        records["track_id"] = self.tracker.assign(records["bbox"])
+        if identify:
+            self.identify_faces(ctx)
+        return ctx
     
-    def process_frame(self, frame, frame_count):
-        """Process a single frame for face detection"""
-        if frame_count % self.config["process_interval"] != 0:
+    def identify_faces(self, ctx, indices=None):
+        """Fill in name and confidence for the frame's faces, or only those at indices"""
+        if self.gallery is not None and len(self.gallery) > 0:
+            self.recognize_faces(ctx, indices)
             return
         
-        # Detect faces
-        results = self.detect_faces(frame)
+        records = ctx.records
+        indices = np.arange(ctx.count) if indices is None else np.asarray(indices, dtype=np.int64)
+        bbox = records["bbox"][indices]
+        
+        # Calculate face area for confidence estimation
+        face_area = bbox[:, 2] * bbox[:, 3]
+        confidence = np.minimum(1.0, face_area / 10000)  # Normalize confidence based on face size
+        
+        # Simple recognition simulation
+        if len(self.known_name_ids):
+            # Use face position to "determine" person (for demo)
+            records["name_id"][indices] = self.known_name_ids[bbox[:, 0] % len(self.known_name_ids)]
+            records["confidence"][indices] = 0.8 + (confidence * 0.2)  # Boost confidence for "known" persons
+        else:
+            records["confidence"][indices] = confidence
+    
+    def evaluate_faces(self, frame, on_decision=None):
+        """Detect faces and decide access for each one, without logging
         
-        # Process results
-        for result in results:
-            name = result["name"]
-            confidence = result["confidence"]
-            bbox = result["bbox"]
+        With the face scheduler, faces are named and decided most urgent
+        first until the frame deadline, which starts once detection is done;
+        the rest wait for a later frame. on_decision, if given, gets each
+        decision as soon as it is made.
+        """
+        scheduler = self.face_scheduler
+        self.refresh_gallery()
+        ctx = self.detect_faces(frame, identify=scheduler is None)
+        if scheduler is None:
+            order = range(ctx.count)
+        else:
+            order = scheduler.schedule(ctx.records, frame.shape, scheduler.deadline())
+        decisions = []
+        for i in order:
+            if scheduler is not None:
+                self.identify_faces(ctx, [i])
+            name = ctx.name_of(i)
+            confidence = float(ctx.detections["confidence"][i])
+            bbox = tuple(int(v) for v in ctx.detections["bbox"][i])
             
             # Determine access status
-            is_known = name != "Unknown Person"
+            is_known = name != UNKNOWN_NAME
             success = is_known and confidence > (self.config["confidence_threshold"] / 100.0)
             
             # Save face image
@@ -151,6 +400,33 @@ class HeadlessFaceAccessControl:
                 prefix = "known" if is_known else "unknown"
                 image_path = self.save_detected_face(frame, bbox, prefix)
             
+            decision = (name, success, confidence, bbox, image_path)
+            if scheduler is not None:
+                scheduler.record_decision(int(ctx.detections["track_id"][i]), success)
+            if on_decision is not None:
+                on_decision([decision])
+            decisions.append(decision)
+        
+        return decisions
+    
+    def process_frame(self, frame, frame_count):
+        """Process a single frame for face detection"""
+        if self.clip_recorder is not None:
+            self.clip_recorder.add_frame(frame)
+        
+        if frame_count % self.config["process_interval"] != 0:
+            return
+        
+        # Logging per decision keeps the log row inside the scheduler's frame budget
+        self.evaluate_faces(frame, on_decision=self.log_decisions)
+    
+    def log_decisions(self, decisions):
+        for name, success, confidence, bbox, image_path in decisions:
+            if self.clip_recorder is not None and not success:
+                # Denied and unknown faces get a clip with pre- and post-roll
+                clip_path = self.clip_recorder.trigger(name)
+                image_path = image_path or clip_path
+            
             # Log access attempt
             self.log_access_attempt(name, success, confidence, image_path)
             
@@ -158,38 +434,54 @@ class HeadlessFaceAccessControl:
     
     def display_stats(self):
         """Display current statistics"""
-        conn = sqlite3.connect('access_logs.db')
-        
         # Get today's stats
-        today = datetime.now().strftime("%Y-%m-%d")
-        stats = conn.execute('''
-            SELECT 
-                COUNT(*) as total,
-                SUM(success) as success,
-                AVG(confidence) as avg_conf
-            FROM access_logs 
-            WHERE DATE(access_time) = ?
-        ''', (today,)).fetchone()
-        
-        conn.close()
-        
-        total = stats[0] or 0
-        success = stats[1] or 0
-        success_rate = (success / total * 100) if total > 0 else 0
+        stats = get_stats_engine().today()
         
         print(f"\n=== STATS [Today] ===")
-        print(f"Total attempts: {total}")
-        print(f"Successful: {success}")
-        print(f"Success rate: {success_rate:.1f}%")
-        print(f"Avg confidence: {stats[2] or 0:.2f}")
+        print(f"Total attempts: {stats['total_attempts']}")
+        print(f"Successful: {stats['successful_attempts']}")
+        print(f"Success rate: {stats['success_rate']:.1f}%")
+        print(f"Avg confidence: {stats['avg_confidence']:.2f}")
+        if self.quality_gate is not None:
+            quality = self.quality_gate.stats()
+            reasons = ", ".join(f"{k} {v}" for k, v in quality['rejects_by_reason'].items())
+            print(f"Quality gate: {quality['accepted']}/{quality['evaluated']} accepted (rejects: {reasons})")
+        if self.notifier is not None:
+            hook = self.notifier.stats()
+            print(f"Webhook: {hook['sent_events']} sent, {hook['failed_events']} failed, "
+                  f"{hook['dropped']} dropped, p99 {hook['p99_ms']:.0f} ms")
+        if self.gallery is not None:
+            cache = self.embedding_cache.stats()
+            print(f"Embedding cache: {cache['hit_rate']:.1f}% hits, {cache['entries']} entries, "
+                  f"{cache['evictions']} evicted, {cache['memory_bytes'] / 1024:.0f} KB")
+        if self.face_scheduler is not None and self.face_scheduler.metrics["frames"]:
+            schedule = self.face_scheduler.stats()
+            print(f"Face scheduler: {schedule['processed']}/{schedule['faces']} faces handled, "
+                  f"{schedule['deferred']} deferred, {schedule['dropped']} dropped, "
+                  f"{schedule['deadline_misses']} frames ran out of budget, {schedule['face_ms']:.1f} ms per face")
+        if isinstance(self.gallery, ShardedGallery):
+            shards = self.gallery.stats()
+            print(f"Gallery shards: {len(shards)}, slowest p99 {max(s['p99_ms'] for s in shards):.1f} ms, "
+                  f"{sum(s['timeouts'] for s in shards)} timeouts, {sum(s['restarts'] for s in shards)} restarts")
+        if self.clip_recorder is not None:
+            clips = self.clip_recorder.stats()
+            print(f"Clips: {clips['written']} written, {clips['dropped']} dropped; pre-roll "
+                  f"{clips['buffered_frames']} frames / {clips['buffered_bytes'] / 1024:.0f} KB, "
+                  f"{clips['encode_ms']:.1f} ms per frame")
         print("=" * 20)
     
+    def open_source(self):
+        """Camera, stream, video file, image directory or "synthetic", from camera_index"""
+        return open_source(self.config["camera_index"],
+                           realtime=self.config.get("source_realtime", False),
+                           loop=self.config.get("source_loop", False))
+    
     def run(self):
         print("[INFO] Starting Headless Face Access Control System")
         print("[INFO] Press Ctrl+C to stop the system")
         print(f"[INFO] Known persons: {len(self.known_faces)}")
         
-        cap = cv2.VideoCapture(self.config["camera_index"])
+        cap = self.open_source()
         
         if not cap.isOpened():
             print("[ERROR] Cannot open camera")
@@ -203,7 +495,7 @@ class HeadlessFaceAccessControl:
             while True:
                 ret, frame = cap.read()
                 if not ret:
-                    print("[ERROR] Failed to grab frame")
+                    print("[ERROR] Failed to grab frame" if cap.live else "[INFO] End of source")
                     break
                 
                 # Process frame
@@ -225,17 +517,417 @@ class HeadlessFaceAccessControl:
         finally:
             cap.release()
             self.display_stats()
+            if self.notifier is not None:
+                self.notifier.close()
+            if self.clip_recorder is not None:
+                self.clip_recorder.close()
+            if self.gallery_reloader is not None:
+                self.gallery_reloader.stop()
+            if self.gallery is not None:
+                self.gallery.close()
             print(f"[INFO] System stopped. Processed {frame_count} frames.")
             print(f"[INFO] Total access attempts: {self.access_count}")
+    
+    def _collect_results(self, result_queue, in_flight, timeout=None):
+        """Log every decision waiting in result_queue; with timeout, wait that long for the first"""
+        while True:
+            try:
+                if timeout is None:
+                    seq, decisions = result_queue.get_nowait()
+                else:
+                    seq, decisions = result_queue.get(timeout=timeout)
+                    timeout = None
+            except queue.Empty:
+                return
+            in_flight.pop(seq, None)
+            self.log_decisions(decisions)
+    
+    def run_parallel(self, workers):
+        """Live mode that spreads one camera stream across worker processes
+
+        Frames are decoded straight into a shared-memory ring; workers get
+        only sequence numbers and send back their access decisions.
+        """
+        print(f"[INFO] Starting Headless Face Access Control System with {workers} workers")
+        print("[INFO] Press Ctrl+C to stop the system")
+        
+        cap = self.open_source()
+        ret, frame = cap.read() if cap.isOpened() else (False, None)
+        if not ret:
+            print("[ERROR] Cannot open camera")
+            return
+        
+        ring = SharedFrameRing(frame.shape, slots=max(4, workers * 2))
+        work_queue = multiprocessing.Queue()
+        result_queue = multiprocessing.Queue()
+        # Daemonic workers cannot start shard processes of their own
+        worker_config = dict(self.config, gallery_shards=0)
+        if isinstance(self.gallery, ShardedGallery):
+            print("[WARNING] Parallel workers load unsharded galleries; this instance's shard processes stay idle")
+        start_worker = lambda: multiprocessing.Process(
+            target=_shared_frame_worker, daemon=True,
+            args=(ring.spec, worker_config, work_queue, result_queue))
+        processes = [start_worker() for _ in range(workers)]
+        for process in processes:
+            process.start()
+        
+        frame_count = 0
+        in_flight = {}  # seq -> time it was queued
+        dropped = 0
+        lost = 0
+        last_stat_time = time.time()
+        last_health_check = time.time()
+        stat_interval = 30
+        
+        try:
+            while True:
+                # Collect finished frames without blocking capture
+                self._collect_results(result_queue, in_flight)
+                
+                current_time = time.time()
+                if current_time - last_health_check > 1.0:
+                    last_health_check = current_time
+                    for i, process in enumerate(processes):
+                        if process.exitcode is not None:
+                            print(f"[WARNING] Detection worker exited with code {process.exitcode}; restarting")
+                            processes[i] = start_worker()
+                            processes[i].start()
+                    # A frame whose worker died never gets a result; stop waiting for it
+                    for seq in [seq for seq, queued in in_flight.items() if current_time - queued > 10.0]:
+                        del in_flight[seq]
+                        lost += 1
+                
+                due = frame_count % self.config["process_interval"] == 0
+                if not due or len(in_flight) >= ring.slots - 1:
+                    # Not analyzed, or every slot is in flight: skip decoding entirely
+                    dropped += due
+                    if not cap.grab():
+                        print("[ERROR] Failed to grab frame" if cap.live else "[INFO] End of source")
+                        break
+                    frame_count += 1
+                    continue
+                
+                seq, view = ring.acquire()
+                ret, frame = cap.read(view)
+                if not ret:
+                    print("[ERROR] Failed to grab frame" if cap.live else "[INFO] End of source")
+                    break
+                if frame.ctypes.data != view.ctypes.data:
+                    np.copyto(view, frame)
+                ring.commit(seq)
+                work_queue.put(seq)
+                in_flight[seq] = time.time()
+                if self.clip_recorder is not None:
+                    # Only decoded frames reach the recorder, so clips run at the analysis rate
+                    self.clip_recorder.add_frame(frame)
+                frame_count += 1
+                
+                current_time = time.time()
+                if current_time - last_stat_time > stat_interval:
+                    self.display_stats()
+                    print(f"[INFO] Frames dropped (workers busy): {dropped}, lost to worker exits: {lost}")
+                    last_stat_time = current_time
+        
+        except KeyboardInterrupt:
+            print("\n[INFO] Stopping system...")
+        
+        finally:
+            for _ in processes:
+                work_queue.put(None)
+            # Keep draining while workers finish, or a full result pipe would block their exit
+            deadline = time.time() + 5
+            while any(process.is_alive() for process in processes) and time.time() < deadline:
+                self._collect_results(result_queue, in_flight, timeout=0.1)
+            self._collect_results(result_queue, in_flight)
+            if in_flight:
+                print(f"[WARNING] {len(in_flight)} frames were still being analyzed at shutdown")
+            for process in processes:
+                process.join(timeout=1)
+            cap.release()
+            ring.close()
+            self.display_stats()
+            if self.notifier is not None:
+                self.notifier.close()
+            if self.clip_recorder is not None:
+                self.clip_recorder.close()
+            if self.gallery_reloader is not None:
+                self.gallery_reloader.stop()
+            if self.gallery is not None:
+                self.gallery.close()
+            print(f"[INFO] System stopped. Processed {frame_count} frames, dropped {dropped}, lost {lost}.")
+            print(f"[INFO] Total access attempts: {self.access_count}")
+
+def _shared_frame_worker(ring_spec, config, work_queue, result_queue):
+    """Detection worker reading frames from the shared ring by sequence number"""
+    cv2.setNumThreads(1)
+    ring = SharedFrameRing.attach(ring_spec)
+    system = HeadlessFaceAccessControl(config=config, use_database=False)
+    try:
+        while True:
+            seq = work_queue.get()
+            if seq is None:
+                break
+            frame = ring.read(seq)
+            decisions = system.evaluate_faces(frame) if frame is not None else []
+            if not ring.is_current(seq):
+                # Slot was recycled while we were reading it; results are unreliable
+                decisions = []
+            result_queue.put((seq, decisions))
+    finally:
+        ring.close()
+
+# ---------------------------------------------------------------------------
+# Offline batch mode: scan recorded footage and image archives
+# ---------------------------------------------------------------------------
+
+_batch_system = None
+
+def expand_inputs(inputs):
+    """Expand files, glob patterns and directories into a sorted list of media files"""
+    media_paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for filename in files:
+                    if filename.lower().endswith(VIDEO_EXTENSIONS + IMAGE_EXTENSIONS):
+                        media_paths.add(os.path.join(root, filename))
+        else:
+            for path in glob.glob(item) or [item]:
+                if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS + IMAGE_EXTENSIONS):
+                    media_paths.add(path)
+    return sorted(media_paths)
+
+def plan_batch_jobs(media_paths, segment_seconds=60, images_per_job=200):
+    """Split videos into time segments and images into chunks, one job per pool task"""
+    jobs = []
+    images = []
+    total_seconds = 0.0
+    for path in media_paths:
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            images.append(path)
+            continue
+        
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"[WARNING] Cannot open video: {path}")
+            continue
+        frame_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        cap.release()
+        
+        if frame_total <= 0:
+            # Unknown length (some containers): scan the whole file in one job
+            jobs.append(("video", path, 0, None, fps))
+            continue
+        
+        total_seconds += frame_total / fps
+        segment_frames = max(1, int(segment_seconds * fps))
+        for start in range(0, frame_total, segment_frames):
+            jobs.append(("video", path, start, min(frame_total, start + segment_frames), fps))
+    
+    for i in range(0, len(images), images_per_job):
+        jobs.append(("images", images[i:i + images_per_job], 0, None, 0.0))
+    
+    return jobs, total_seconds
+
+def _init_batch_worker(config):
+    """Build one detector per worker process; the pool parallelizes, not OpenCV"""
+    global _batch_system
+    cv2.setNumThreads(1)
+    _batch_system = HeadlessFaceAccessControl(config=config, use_database=False)
+
+def _decisions_to_rows(source, frame_index, seconds, decisions):
+    rows = []
+    for name, success, confidence, bbox, image_path in decisions:
+        x, y, w, h = (int(v) for v in bbox)
+        rows.append((source, frame_index, seconds, name, bool(success), float(confidence),
+                     x, y, w, h, image_path))
+    return rows
+
+def _run_batch_job(job):
+    """Process one video segment or image chunk and return result rows"""
+    kind, target, start, end, fps = job
+    interval = max(1, _batch_system.config["process_interval"])
+    rows = []
+    frames_read = 0
+    
+    # Jobs are unrelated inputs, and so are the photos of an image chunk;
+    # only consecutive frames of one video may share tracks and cached encodings
+    _batch_system.reset_tracking()
+    if kind == "images":
+        for path in target:
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            frames_read += 1
+            _batch_system.reset_tracking()
+            rows.extend(_decisions_to_rows(path, 0, 0.0, _batch_system.evaluate_faces(frame)))
+        return rows, frames_read
+    
+    cap = cv2.VideoCapture(target)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    frame_index = start
+    try:
+        while end is None or frame_index < end:
+            # grab() demuxes without decoding; only frames we analyze are retrieved
+            if not cap.grab():
+                break
+            if frame_index % interval == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    frames_read += 1
+                    decisions = _batch_system.evaluate_faces(frame)
+                    rows.extend(_decisions_to_rows(target, frame_index, frame_index / fps, decisions))
+            frame_index += 1
+    finally:
+        cap.release()
+    
+    return rows, frames_read
+
+def media_start_time(path):
+    """Epoch seconds at which a recording started, taking the file's mtime as its end"""
+    start = os.path.getmtime(path)
+    if not path.lower().endswith(IMAGE_EXTENSIONS):
+        cap = cv2.VideoCapture(path)
+        frame_total = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        cap.release()
+        start -= max(0.0, frame_total) / fps
+    return start
+
+def write_batch_results(conn, rows, results_db=True, media_starts=None):
+    """Insert one job's rows in a single transaction
+
+    Rows going to access_logs carry the time the frame was recorded, in
+    the UTC format of CURRENT_TIMESTAMP, so old footage does not show up
+    as live activity. ``media_starts`` caches start times per source.
+    """
+    if results_db:
+        conn.executemany(
+            '''INSERT INTO batch_results (source_path, frame_index, video_seconds, user_name,
+               success, confidence, x, y, w, h, image_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            rows
+        )
+    else:
+        media_starts = {} if media_starts is None else media_starts
+        for source in {r[0] for r in rows} - media_starts.keys():
+            media_starts[source] = media_start_time(source)
+        conn.executemany(
+            'INSERT INTO access_logs (access_time, user_name, success, confidence, image_path) VALUES (?, ?, ?, ?, ?)',
+            [(datetime.fromtimestamp(media_starts[r[0]] + r[2], timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+              r[3], r[4], r[5], r[10] or f"{r[0]}@{r[2]:.2f}s") for r in rows]
+        )
+    conn.commit()
+
+def open_results_database(results_db):
+    conn = sqlite3.connect(results_db)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS batch_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_path TEXT,
+            frame_index INTEGER,
+            video_seconds REAL,
+            user_name TEXT,
+            success BOOLEAN,
+            confidence REAL,
+            x INTEGER, y INTEGER, w INTEGER, h INTEGER,
+            image_path TEXT,
+            processed_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    return conn
+
+def run_batch(inputs, workers=None, segment_seconds=60, process_interval=None, results_db=None):
+    """Scan video files, globs or directories with a process pool"""
+    config = HeadlessFaceAccessControl.load_config()
+    if process_interval:
+        config["process_interval"] = process_interval
+    # Offline scans have no frame deadline; every face is analyzed
+    config["face_deadline_ms"] = 0
+    # Pool workers are daemonic and cannot start shard processes
+    config["gallery_shards"] = 0
+    
+    media_paths = expand_inputs(inputs)
+    if not media_paths:
+        print("[ERROR] No video or image files found for the given inputs")
+        return False
+    
+    jobs, total_seconds = plan_batch_jobs(media_paths, segment_seconds)
+    workers = workers or os.cpu_count() or 1
+    print(f"[INFO] Batch mode: {len(media_paths)} files, {len(jobs)} jobs, {workers} workers")
+    
+    if results_db:
+        conn = open_results_database(results_db)
+    else:
+        HeadlessFaceAccessControl.init_database()
+        conn = sqlite3.connect('access_logs.db')
+    
+    start_time = time.time()
+    total_rows = 0
+    total_frames = 0
+    media_starts = {}
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_batch_worker, initargs=(config,)) as pool:
+            for i, (rows, frames_read) in enumerate(pool.imap_unordered(_run_batch_job, jobs)):
+                if rows:
+                    write_batch_results(conn, rows, results_db=bool(results_db), media_starts=media_starts)
+                total_rows += len(rows)
+                total_frames += frames_read
+                print(f"[INFO] Job {i + 1}/{len(jobs)} done: {len(rows)} faces")
+    finally:
+        conn.close()
+    
+    elapsed = time.time() - start_time
+    print(f"[SUCCESS] Analyzed {total_frames} frames, logged {total_rows} faces in {elapsed:.1f}s")
+    if total_seconds and elapsed > 0:
+        print(f"[INFO] Footage duration {total_seconds:.0f}s -> {total_seconds / elapsed:.1f}x real time")
+    return True
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--input", nargs="+",
+                   help="offline mode: video files, glob patterns or directories to scan")
+    ap.add_argument("-w", "--workers", type=int, default=None,
+                   help="number of worker processes (default: all cores)")
+    ap.add_argument("--segment-seconds", type=float, default=60,
+                   help="split videos into segments of this many seconds")
+    ap.add_argument("--every", type=int, default=None,
+                   help="analyze every Nth frame (default: process_interval from config)")
+    ap.add_argument("--results-db", default=None,
+                   help="write batch results to this database instead of access_logs.db")
+    ap.add_argument("-p", "--parallel", type=int, default=0,
+                   help="live mode: share camera frames with this many detection workers")
+    ap.add_argument("-s", "--source", default=None,
+                   help="live mode: camera index, stream URL, video file, image directory or 'synthetic'")
+    ap.add_argument("--realtime", action="store_true",
+                   help="pace file, directory and synthetic sources to their frame rate")
+    args = ap.parse_args()
+    
     # Create necessary directories
     os.makedirs("datasets", exist_ok=True)
     os.makedirs("unknown_faces", exist_ok=True)
     os.makedirs("output", exist_ok=True)
     
-    system = HeadlessFaceAccessControl()
-    system.run()
+    if args.input:
+        run_batch(args.input, args.workers, args.segment_seconds, args.every, args.results_db)
+        return
+    
+    config = HeadlessFaceAccessControl.load_config()
+    if args.source is not None:
+        config["camera_index"] = args.source
+    if args.realtime:
+        config["source_realtime"] = True
+    if args.parallel > 1 and config.get("gallery_shards", 0) > 0:
+        # Workers match against their own in-process gallery; shards here would sit idle
+        print("[WARNING] gallery_shards is ignored with --parallel")
+        config["gallery_shards"] = 0
+    system = HeadlessFaceAccessControl(config)
+    if args.parallel > 1:
+        system.run_parallel(args.parallel)
+    else:
+        system.run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
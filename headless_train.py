@@ -1,7 +1,8 @@
 import cv2
 import os
-import time
 from datetime import datetime
+import argparse
+from enrollment import AsyncImageWriter, DiversitySelector, stream_enroll
 
 def headless_face_collection():
     """Collect face images without GUI display"""
@@ -20,52 +21,76 @@ def headless_face_collection():
         print("Error: Cannot open camera")
         return
     
-    count = 0
-    target_count = 50
-    print(f"\nCollecting {target_count} images for {person_name}...")
+    target_count = 20
+    min_count = 8
+    idle_timeout = 3.0  # stop once nothing new has turned up for this long
+    selector = DiversitySelector(max_samples=target_count, min_samples=min_count, idle_timeout=idle_timeout)
+    writer = AsyncImageWriter()
+    print(f"\nCollecting up to {target_count} images for {person_name}...")
     print("Making different expressions and angles...")
     print("Press Ctrl+C to stop early")
     
-    last_capture_time = 0
-    capture_interval = 0.5  # Capture every 0.5 seconds
+    count = 0
     
     try:
-        while count < target_count:
+        while not selector.full:
             ret, frame = cap.read()
             if not ret:
                 break
             
-            current_time = time.time()
+            if selector.idle:
+                print("No new poses or lighting for a while, finishing")
+                break
             
-            # Only process if enough time has passed since last capture
-            if current_time - last_capture_time > capture_interval:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-                
-                if len(faces) > 0:
-                    # Save all detected faces
-                    for i, (x, y, w, h) in enumerate(faces):
-                        if count >= target_count:
-                            break
-                            
-                        face_img = frame[y:y+h, x:x+w]
-                        filename = f"{person_dir}/face_{count:03d}.jpg"
-                        cv2.imwrite(filename, face_img)
-                        count += 1
-                        last_capture_time = current_time
-                        
-                        print(f"Captured: {count}/{target_count} - {filename}")
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+            if len(faces) == 0:
+                continue
             
-            # Small delay to reduce CPU usage
-            time.sleep(0.1)
+            # Enroll only the most prominent face in view
+            x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+            action, index = selector.consider(gray, (x, y, w, h))
+            if action is None:
+                continue
+            
+            # Replacements reuse the file name so the sharper image wins
+            filename = f"{person_dir}/face_{index:03d}.jpg"
+            writer.write(filename, frame[y:y+h, x:x+w])
+            if action == "add":
+                count += 1
+                print(f"Captured: {count}/{target_count} - {filename}")
+            else:
+                print(f"Replaced with sharper image: {filename}")
             
     except KeyboardInterrupt:
         print("\nStopping collection...")
     
     finally:
         cap.release()
+        writer.close()
         print(f"\nCompleted! Collected {count} face images for {person_name}")
+        if 0 < count < min_count:
+            print(f"Warning: fewer than {min_count} images; recognition may be unreliable")
         print(f"Images saved in: {person_dir}")
 
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--direct", action="store_true",
+                   help="encode faces from the camera straight into the gallery")
+    ap.add_argument("-e", "--encodings", default="encodings.pickle",
+                   help="gallery file to append to in direct mode")
+    ap.add_argument("--archive", action="store_true",
+                   help="direct mode: also keep the face images in datasets/<name>/")
+    args = ap.parse_args()
+    
+    if not args.direct:
+        headless_face_collection()
+        return
+    
+    print("=== Direct Enrollment ===")
+    person_name = input("Enter person's name: ").strip()
+    archive_dir = f"datasets/{person_name}" if args.archive else None
+    stream_enroll(person_name, encodings_path=args.encodings, archive_dir=archive_dir)
+
 if __name__ == "__main__":
-    headless_face_collection()
\ No newline at end of file
+    main()
\ No newline at end of file
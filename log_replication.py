@@ -0,0 +1,394 @@
+import sqlite3
+import os
+import gzip
+import json
+import random
+import socket
+import threading
+import argparse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from log_retention import list_partitions, load_retention_config, _readable_partition, _read_only_uri
+
+REPLICATION_DEFAULTS = {
+    "log_db_path": "access_logs.db",
+    "replication_url": "",                       # aggregator base URL, e.g. http://central:8766
+    "replication_site": "",                      # defaults to the host name
+    "replication_state_path": "replication_state.json",
+    "replication_batch_rows": 1000,
+    "replication_interval": 5.0,                 # seconds between polls once caught up
+    "replication_max_backoff": 300.0
+}
+
+COLUMNS = ("id", "user_name", "access_time", "success", "confidence", "image_path")
+
+CENTRAL_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS central_access_logs (
+        site TEXT NOT NULL,
+        site_id INTEGER NOT NULL,
+        user_name TEXT,
+        access_time TIMESTAMP,
+        success BOOLEAN,
+        confidence REAL,
+        image_path TEXT,
+        received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (site, site_id)
+    ) WITHOUT ROWID
+'''
+
+def load_replication_config(config_path='config.json'):
+    config = dict(REPLICATION_DEFAULTS)
+    try:
+        with open(config_path, 'r') as f:
+            config.update({k: v for k, v in json.load(f).items() if k in REPLICATION_DEFAULTS})
+    except FileNotFoundError:
+        pass
+    config["replication_site"] = config["replication_site"] or socket.gethostname()
+    return config
+
+class LogReplicator:
+    """Push new access_logs rows from this site to the central aggregator
+
+    Rows are read in id order above a high-water mark, gzip-compressed and
+    POSTed in batches. The mark only advances once the aggregator has
+    committed a batch, and it is saved atomically, so an interrupted sync
+    resumes where it stopped. The aggregator ignores (site, id) pairs it
+    already holds, so a batch sent twice is harmless. Nothing is queued
+    in memory: during an outage the site database itself is the buffer,
+    and the replicator backs off (honouring Retry-After) until the
+    aggregator accepts writes again, then sends back-to-back batches until
+    it has caught up.
+    """
+
+    def __init__(self, url, site, db_path="access_logs.db", state_path="replication_state.json",
+                 batch_rows=1000, interval=5.0, max_backoff=300.0, timeout=30.0, session=None):
+        self.url = url.rstrip("/")
+        self.site = site
+        self.db_path = db_path
+        self.state_path = state_path
+        self.batch_rows = batch_rows
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.high_water = self._load_state()
+        self.newest = 0  # largest id in the live database at the last read
+        self.partition_max_ids = {}  # archived partition path -> (mtime, largest id)
+        self.stopping = threading.Event()
+        self.metrics = {"batches": 0, "rows": 0, "raw_bytes": 0, "sent_bytes": 0,
+                        "retries": 0, "throttled": 0, "lag_rows": 0}
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if state.get("site") == self.site and state.get("url") == self.url:
+                return int(state["high_water"])
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        return 0
+
+    def _save_state(self):
+        state = {"site": self.site, "url": self.url, "high_water": self.high_water,
+                 "updated": datetime.now().isoformat(timespec="seconds")}
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def resume(self):
+        """Take the aggregator's high-water mark for this site when it is reachable
+
+        The aggregator knows exactly what it committed, so this also covers
+        a lost state file, or a central database restored from an older
+        backup (rows after its mark are sent again).
+        """
+        try:
+            response = self.session.get(f"{self.url}/sites/{self.site}", timeout=self.timeout)
+            if response.ok:
+                self.high_water = int(response.json()["high_water"])
+                self._save_state()
+                return True
+        except (requests.RequestException, ValueError, KeyError):
+            pass
+        print(f"[WARNING] Aggregator unreachable; resuming from local mark {self.high_water}")
+        return False
+
+    def _select(self, path):
+        conn = sqlite3.connect(_read_only_uri(path), uri=True)
+        try:
+            return conn.execute(f'SELECT {", ".join(COLUMNS)} FROM access_logs WHERE id > ? ORDER BY id LIMIT ?',
+                                (self.high_water, self.batch_rows)).fetchall()
+        finally:
+            conn.close()
+
+    def _partition_max_id(self, path, cache_dir):
+        """Largest id in an archived partition, remembered until the file changes"""
+        mtime = os.path.getmtime(path)
+        known = self.partition_max_ids.get(path)
+        if known is None or known[0] != mtime:
+            conn = sqlite3.connect(_read_only_uri(_readable_partition(path, cache_dir)), uri=True)
+            try:
+                known = (mtime, conn.execute('SELECT MAX(id) FROM access_logs').fetchone()[0] or 0)
+            finally:
+                conn.close()
+            self.partition_max_ids[path] = known
+        return known[1]
+
+    def read_batch(self):
+        """Rows above the high-water mark, oldest first, without blocking the live writer"""
+        conn = sqlite3.connect(_read_only_uri(self.db_path), uri=True)
+        try:
+            oldest, newest = conn.execute('SELECT MIN(id), MAX(id) FROM access_logs').fetchone()
+        finally:
+            conn.close()
+        self.newest = newest or 0
+        rows = self._select(self.db_path)
+        if oldest is None or oldest > self.high_water + 1:
+            # Rows past the mark may have been moved to log_retention's monthly
+            # partitions before they were replicated, possibly all of them;
+            # send those first. Partitions wholly at or below the mark are
+            # skipped, so an id gap left by an expired month costs no reads.
+            retention = load_retention_config()
+            cache_dir = os.path.join(retention["log_archive_dir"], ".cache")
+            partitions = list_partitions(retention["log_archive_dir"])
+            current = set(partitions.values())
+            self.partition_max_ids = {p: v for p, v in self.partition_max_ids.items() if p in current}
+            for month, path in sorted(partitions.items()):
+                max_id = self._partition_max_id(path, cache_dir)
+                self.newest = max(self.newest, max_id)
+                if max_id > self.high_water:
+                    rows += self._select(_readable_partition(path, cache_dir))
+            rows = sorted(rows)[:self.batch_rows]
+        self.metrics["lag_rows"] = max(0, self.newest - self.high_water)
+        return rows
+
+    def push(self, rows):
+        """POST one batch; returns (committed, seconds to wait before retrying)"""
+        body = json.dumps({"site": self.site, "columns": COLUMNS, "rows": rows}).encode()
+        payload = gzip.compress(body, compresslevel=6)
+        try:
+            response = self.session.post(
+                f"{self.url}/replicate", data=payload, timeout=self.timeout,
+                headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+            )
+        except requests.RequestException:
+            return False, None
+        if response.status_code in (429, 503):
+            self.metrics["throttled"] += 1
+            try:
+                return False, float(response.headers.get("Retry-After", 0)) or None
+            except ValueError:
+                return False, None
+        if not response.ok:
+            print(f"[ERROR] Aggregator rejected batch after id {self.high_water}: "
+                  f"{response.status_code} {response.text[:200]}")
+            return False, None
+        self.metrics["raw_bytes"] += len(body)
+        self.metrics["sent_bytes"] += len(payload)
+        return True, None
+
+    def _advance(self, rows):
+        """Move the mark past a committed batch; lag is measured against the newest id last read"""
+        self.high_water = rows[-1][0]
+        self._save_state()
+        self.metrics["batches"] += 1
+        self.metrics["rows"] += len(rows)
+        self.metrics["lag_rows"] = max(0, self.newest - self.high_water)
+
+    def sync_once(self):
+        """Send batches until caught up or a push fails; returns rows sent"""
+        sent = 0
+        while not self.stopping.is_set():
+            rows = self.read_batch()
+            if not rows:
+                break
+            committed, _ = self.push(rows)
+            if not committed:
+                self.metrics["retries"] += 1
+                break
+            self._advance(rows)
+            sent += len(rows)
+            if len(rows) < self.batch_rows:
+                break
+        return sent
+
+    def run(self):
+        """Replicate until stop(); waits ``interval`` when idle and backs off on failures"""
+        self.resume()
+        failures = 0
+        while not self.stopping.is_set():
+            rows = self.read_batch()
+            if not rows:
+                self.stopping.wait(self.interval)
+                continue
+            committed, retry_after = self.push(rows)
+            if committed:
+                failures = 0
+                self._advance(rows)
+                # Catching up: the next batch goes out immediately
+                continue
+            failures += 1
+            self.metrics["retries"] += 1
+            delay = retry_after or min(self.max_backoff, self.interval * (2 ** min(failures, 16)))
+            self.stopping.wait(delay * random.uniform(0.8, 1.2))
+
+    def stop(self):
+        self.stopping.set()
+
+    def stats(self):
+        stats = dict(self.metrics)
+        stats["high_water"] = self.high_water
+        stats["compression"] = stats["raw_bytes"] / stats["sent_bytes"] if stats["sent_bytes"] else 0
+        return stats
+
+class AggregatorStore:
+    """Central SQLite database of rows from every site, keyed by (site, site id)"""
+
+    def __init__(self, db_path="central_logs.db"):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(CENTRAL_SCHEMA)
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_central_time ON central_access_logs (access_time)')
+        self.conn.commit()
+        self.lock = threading.Lock()
+
+    def insert(self, site, columns, rows):
+        """Insert one batch in a transaction; returns (new rows, the site's high-water mark)"""
+        index = [list(columns).index(c) for c in COLUMNS]
+        values = [(site,) + tuple(row[i] for i in index) for row in rows]
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO central_access_logs '
+                '(site, site_id, user_name, access_time, success, confidence, image_path) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', values
+            )
+            inserted = self.conn.total_changes - before
+        return inserted, self.high_water(site)
+
+    def high_water(self, site):
+        with self.lock:
+            return self.conn.execute('SELECT COALESCE(MAX(site_id), 0) FROM central_access_logs WHERE site = ?',
+                                     (site,)).fetchone()[0]
+
+    def sites(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT site, COUNT(*), MAX(site_id), MAX(received_at) '
+                                     'FROM central_access_logs GROUP BY site').fetchall()
+        return {site: {"rows": count, "high_water": high, "last_received": last}
+                for site, count, high, last in rows}
+
+    def close(self):
+        self.conn.close()
+
+def make_handler(store, slots):
+    class AggregatorHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/sites":
+                self._reply(200, store.sites())
+            elif self.path.startswith("/sites/"):
+                self._reply(200, {"high_water": store.high_water(self.path[len("/sites/"):])})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path != "/replicate":
+                self._reply(404, {"error": "not found"})
+                return
+            # Backpressure: sites hold their rows and retry later instead of piling up here
+            if not slots.acquire(blocking=False):
+                self._reply(503, {"error": "aggregator busy"}, {"Retry-After": "2"})
+                return
+            try:
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                batch = json.loads(body)
+                inserted, high_water = store.insert(batch["site"], batch["columns"], batch["rows"])
+                self._reply(200, {"inserted": inserted, "high_water": high_water})
+            except (ValueError, KeyError, TypeError, IndexError, OSError,
+                    sqlite3.InterfaceError, sqlite3.ProgrammingError) as e:
+                # Malformed batch, e.g. a body that is not an object or rows with the wrong shape
+                self._reply(400, {"error": str(e)})
+            except sqlite3.OperationalError as e:
+                self._reply(503, {"error": str(e)}, {"Retry-After": "5"})
+            finally:
+                slots.release()
+
+    return AggregatorHandler
+
+def serve(store, host="127.0.0.1", port=8766, max_concurrency=4):
+    server = ThreadingHTTPServer((host, port), make_handler(store, threading.BoundedSemaphore(max_concurrency)))
+    server.daemon_threads = True
+    return server
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--serve", action="store_true", help="run the central aggregator instead of pushing")
+    ap.add_argument("--db", default="central_logs.db", help="aggregator database")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--max-concurrency", type=int, default=4,
+                   help="batches written at once before the aggregator answers 503")
+    ap.add_argument("--url", default=None, help="aggregator URL (default: replication_url from config.json)")
+    ap.add_argument("--site", default=None, help="site name (default: replication_site or the host name)")
+    ap.add_argument("--once", action="store_true", help="push until caught up, then exit")
+    args = ap.parse_args()
+
+    if args.serve:
+        store = AggregatorStore(args.db)
+        server = serve(store, args.host, args.port, args.max_concurrency)
+        print(f"[INFO] Aggregator listening on http://{args.host}:{server.server_address[1]}, writing {args.db}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n[INFO] Stopping aggregator...")
+        finally:
+            store.close()
+        return
+
+    config = load_replication_config()
+    url = args.url or config["replication_url"]
+    if not url:
+        print("[ERROR] No aggregator URL; pass --url or set replication_url in config.json")
+        return
+    if not os.path.exists(config["log_db_path"]):
+        print(f"[ERROR] {config['log_db_path']} does not exist")
+        return
+
+    replicator = LogReplicator(url, args.site or config["replication_site"], config["log_db_path"],
+                               config["replication_state_path"], config["replication_batch_rows"],
+                               config["replication_interval"], config["replication_max_backoff"])
+    print(f"[INFO] Replicating {config['log_db_path']} as site '{replicator.site}' to {replicator.url}")
+    if args.once:
+        replicator.resume()
+        sent = replicator.sync_once()
+    else:
+        try:
+            replicator.run()
+        except KeyboardInterrupt:
+            print("\n[INFO] Stopping replication...")
+        sent = replicator.metrics["rows"]
+    stats = replicator.stats()
+    print(f"[SUCCESS] Sent {sent} rows in {stats['batches']} batches up to id {stats['high_water']} "
+          f"({stats['compression']:.1f}x compression, {stats['lag_rows']} rows behind)")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
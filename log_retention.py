@@ -0,0 +1,270 @@
+import sqlite3
+import os
+import gzip
+import shutil
+import json
+import time
+import argparse
+import urllib.parse
+from datetime import datetime, timedelta
+
+RETENTION_DEFAULTS = {
+    "log_db_path": "access_logs.db",
+    "log_archive_dir": "log_archive",
+    "log_hot_days": 31,                 # rows newer than this stay in access_logs.db
+    "log_compress_after_months": 3,     # gzip monthly partitions older than this
+    "log_retention_months": 24,         # delete partitions older than this (0 keeps forever)
+    "log_move_batch_rows": 500          # rows moved per write transaction
+}
+
+MAX_ATTACHED_PARTITIONS = 9  # SQLite's default limit is 10 attached databases
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS access_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_name TEXT,
+        access_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        success BOOLEAN,
+        confidence REAL,
+        image_path TEXT
+    )
+'''
+
+def load_retention_config(config_path='config.json'):
+    config = dict(RETENTION_DEFAULTS)
+    try:
+        with open(config_path, 'r') as f:
+            config.update({k: v for k, v in json.load(f).items() if k in RETENTION_DEFAULTS})
+    except FileNotFoundError:
+        pass
+    return config
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+def next_month(dt):
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+def months_between(start, stop):
+    """Month starts from start's month up to (excluding) stop's month"""
+    month = month_start(start)
+    while month < month_start(stop):
+        yield month
+        month = next_month(month)
+
+def partition_path(archive_dir, month):
+    return os.path.join(archive_dir, f"access_logs_{month:%Y_%m}.db")
+
+def list_partitions(archive_dir):
+    """Return {month: path} for every archived partition, compressed or not"""
+    partitions = {}
+    if not os.path.isdir(archive_dir):
+        return partitions
+    for filename in os.listdir(archive_dir):
+        if filename.startswith("access_logs_") and filename.endswith((".db", ".db.gz")):
+            stamp = filename[len("access_logs_"):].split(".")[0]
+            try:
+                partitions[datetime.strptime(stamp, "%Y_%m")] = os.path.join(archive_dir, filename)
+            except ValueError:
+                continue
+    return partitions
+
+def _open_partition(archive_dir, month):
+    """Open a month's partition for writing, decompressing it first if needed"""
+    path = partition_path(archive_dir, month)
+    if os.path.exists(path + ".gz") and not os.path.exists(path):
+        with gzip.open(path + ".gz", "rb") as src, open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path + ".gz")
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_access_time ON access_logs (access_time)')
+    conn.commit()
+    conn.close()
+    return path
+
+def archive_old_logs(config, now=None):
+    """Move whole months older than the hot window out of the live database
+
+    Rows move in small id-ordered batches, each in its own short
+    transaction, so the live writer is only ever blocked for one batch.
+    Copies use INSERT OR IGNORE, so an interrupted run is simply resumed.
+    """
+    now = now or datetime.now()
+    cutoff = month_start(now - timedelta(days=config["log_hot_days"]))
+    db_path = config["log_db_path"]
+    if not os.path.exists(db_path):
+        return 0
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')  # readers and the archiver never block inserts
+    oldest = conn.execute('SELECT MIN(access_time) FROM access_logs').fetchone()[0]
+    if oldest is None:
+        conn.close()
+        return 0
+
+    os.makedirs(config["log_archive_dir"], exist_ok=True)
+    moved = 0
+    oldest = datetime.strptime(oldest[:19], "%Y-%m-%d %H:%M:%S")
+    for month in months_between(oldest, cutoff):
+        path = _open_partition(config["log_archive_dir"], month)
+        conn.execute('ATTACH DATABASE ? AS part', (path,))
+        bounds = (month.strftime("%Y-%m-%d %H:%M:%S"), next_month(month).strftime("%Y-%m-%d %H:%M:%S"))
+        while True:
+            ids = [row[0] for row in conn.execute(
+                'SELECT id FROM main.access_logs WHERE access_time >= ? AND access_time < ? ORDER BY id LIMIT ?',
+                bounds + (config["log_move_batch_rows"],)
+            )]
+            if not ids:
+                break
+            placeholders = ",".join("?" * len(ids))
+            with conn:
+                conn.execute(f'INSERT OR IGNORE INTO part.access_logs SELECT * FROM main.access_logs WHERE id IN ({placeholders})', ids)
+                conn.execute(f'DELETE FROM main.access_logs WHERE id IN ({placeholders})', ids)
+            moved += len(ids)
+        conn.execute('DETACH DATABASE part')
+        print(f"[INFO] Archived {month:%Y-%m} to {path}")
+
+    conn.close()
+    # Freed pages are reused by new inserts, so the live file stops growing
+    # without a VACUUM that would lock out the writer
+    return moved
+
+def compress_partitions(config, now=None):
+    """VACUUM and gzip partitions past the compression window; partitions are offline, so this never blocks inserts"""
+    now = now or datetime.now()
+    threshold = month_start(now)
+    for _ in range(config["log_compress_after_months"]):
+        threshold = month_start(threshold - timedelta(days=1))
+
+    compressed = 0
+    for month, path in sorted(list_partitions(config["log_archive_dir"]).items()):
+        if month >= threshold or path.endswith(".gz"):
+            continue
+        conn = sqlite3.connect(path)
+        conn.execute('VACUUM')
+        conn.close()
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+        compressed += 1
+        print(f"[INFO] Compressed partition {month:%Y-%m}")
+    return compressed
+
+def expire_partitions(config, now=None):
+    """Delete partitions older than the retention window"""
+    if not config["log_retention_months"]:
+        return 0
+    now = now or datetime.now()
+    threshold = month_start(now)
+    for _ in range(config["log_retention_months"]):
+        threshold = month_start(threshold - timedelta(days=1))
+
+    expired = 0
+    for month, path in list_partitions(config["log_archive_dir"]).items():
+        if month < threshold:
+            os.remove(path)
+            cached = os.path.join(config["log_archive_dir"], ".cache", os.path.basename(partition_path("", month)))
+            if os.path.exists(cached):
+                os.remove(cached)
+            expired += 1
+            print(f"[INFO] Deleted expired partition {month:%Y-%m}")
+    return expired
+
+def run_retention(config=None, now=None):
+    config = config or load_retention_config()
+    moved = archive_old_logs(config, now)
+    compressed = compress_partitions(config, now)
+    expired = expire_partitions(config, now)
+    print(f"[SUCCESS] Moved {moved} rows, compressed {compressed} and deleted {expired} partitions")
+
+def _readable_partition(path, cache_dir):
+    """Path of an uncompressed copy of a partition, decompressing .gz into a cache"""
+    if not path.endswith(".gz"):
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    cached = os.path.join(cache_dir, os.path.basename(path)[:-3])
+    if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(path):
+        with gzip.open(path, "rb") as src, open(cached, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    return cached
+
+def partitions_since(since=None, config=None):
+    """(month, path) of the archived partitions that can hold rows at or after ``since``"""
+    config = config or load_retention_config()
+    first_month = month_start(since) if since else None
+    return [(month, path) for month, path in sorted(list_partitions(config["log_archive_dir"]).items())
+            if not first_month or month >= first_month]
+
+def _read_only_uri(path):
+    return "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro"
+
+def _create_view(conn, partitions, config, readonly, include_main=True):
+    selects = ['SELECT * FROM main.access_logs'] if include_main else []
+    for month, path in partitions:
+        alias = f"part_{month:%Y_%m}"
+        path = _readable_partition(path, os.path.join(config["log_archive_dir"], ".cache"))
+        conn.execute(f'ATTACH DATABASE ? AS {alias}', (_read_only_uri(path) if readonly else path,))
+        selects.append(f'SELECT * FROM {alias}.access_logs')
+    conn.execute('DROP VIEW IF EXISTS temp.all_access_logs')
+    conn.execute(f'CREATE TEMP VIEW all_access_logs AS {" UNION ALL ".join(selects)}')
+
+def open_access_logs(since=None, config=None, readonly=False):
+    """Connection with a TEMP view ``all_access_logs`` spanning the live DB and archived months
+
+    Only partitions that can hold rows at or after ``since`` are attached,
+    so short dashboard windows touch the live database alone. A read-only
+    connection can be shared across threads and never takes a write lock.
+    SQLite attaches at most MAX_ATTACHED_PARTITIONS databases; longer spans
+    need ``open_access_log_groups``.
+    """
+    config = config or load_retention_config()
+    partitions = partitions_since(since, config)
+    if len(partitions) > MAX_ATTACHED_PARTITIONS:
+        raise ValueError(f"Query spans {len(partitions)} archived months; use open_access_log_groups")
+    if readonly:
+        conn = sqlite3.connect(_read_only_uri(config["log_db_path"]), uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(config["log_db_path"])
+        conn.execute(SCHEMA)
+    _create_view(conn, partitions, config, readonly)
+    return conn
+
+def _open_group(config, partitions, include_main):
+    if include_main:
+        conn = sqlite3.connect(_read_only_uri(config["log_db_path"]), uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+    _create_view(conn, partitions, config, readonly=True, include_main=include_main)
+    return conn
+
+def open_access_log_groups(since=None, config=None):
+    """Read-only connections whose ``all_access_logs`` views together cover every row since ``since``
+
+    The first holds the live DB and the newest archived months; older
+    months follow in groups of MAX_ATTACHED_PARTITIONS. Run the same query
+    on each connection and merge the results.
+    """
+    config = config or load_retention_config()
+    partitions = partitions_since(since, config)
+    newest = partitions[-MAX_ATTACHED_PARTITIONS:] if partitions else []
+    older = partitions[:len(partitions) - len(newest)]
+    conns = [_open_group(config, newest, include_main=True)]
+    for start in range(0, len(older), MAX_ATTACHED_PARTITIONS):
+        conns.append(_open_group(config, older[start:start + MAX_ATTACHED_PARTITIONS], include_main=False))
+    return conns
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--loop", type=float, default=0,
+                   help="keep running, repeating every this many hours")
+    args = ap.parse_args()
+
+    while True:
+        run_retention()
+        if not args.loop:
+            break
+        time.sleep(args.loop * 3600)
+
+if __name__ == "__main__":
+    main()
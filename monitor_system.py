@@ -1,46 +1,21 @@
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
 import os
+from access_stats import get_stats_engine
 
 def get_detailed_stats():
-    conn = sqlite3.connect('access_logs.db')
-    
-    # Today's stats
-    today = datetime.now().strftime("%Y-%m-%d")
-    today_stats = conn.execute('''
-        SELECT 
-            COUNT(*) as total,
-            SUM(success) as success,
-            AVG(confidence) as avg_conf
-        FROM access_logs 
-        WHERE DATE(access_time) = ?
-    ''', (today,)).fetchone()
-    
-    # Last hour stats
-    one_hour_ago = datetime.now() - timedelta(hours=1)
-    hour_stats = conn.execute('''
-        SELECT COUNT(*) 
-        FROM access_logs 
-        WHERE access_time > ?
-    ''', (one_hour_ago,)).fetchone()
-    
-    # Recent activity (last 10 entries)
-    recent = conn.execute('''
-        SELECT user_name, success, confidence, access_time
-        FROM access_logs 
-        ORDER BY access_time DESC 
-        LIMIT 10
-    ''').fetchall()
-    
-    conn.close()
+    engine = get_stats_engine()
+    today_stats = engine.today()
+    hour_stats = engine.last_hours(1)
     
     return {
-        'today_total': today_stats[0] or 0,
-        'today_success': today_stats[1] or 0,
-        'today_avg_conf': today_stats[2] or 0,
-        'last_hour': hour_stats[0] or 0,
-        'recent_activity': recent
+        'today_total': today_stats['total_attempts'],
+        'today_success': today_stats['successful_attempts'],
+        'today_avg_conf': today_stats['avg_confidence'],
+        'today_unknown': today_stats['unknown_faces'],
+        'per_user': today_stats['per_user'],
+        'last_hour': hour_stats['total_attempts'],
+        'recent_activity': engine.recent_activity(10)
     }
 
 def monitor_system():
@@ -68,6 +43,7 @@ def monitor_system():
             print(f"   Failed: {stats['today_total'] - stats['today_success']}")
             print(f"   Success Rate: {success_rate:.1f}%")
             print(f"   Avg Confidence: {stats['today_avg_conf']:.2f}")
+            print(f"   Unknown Faces: {stats['today_unknown']}")
             print(f"   Last Hour Activity: {stats['last_hour']} attempts")
             
             print(f"\n🕒 RECENT ACTIVITY (Last 10):")
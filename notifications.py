@@ -0,0 +1,186 @@
+import json
+import random
+import threading
+import time
+import argparse
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from requests.adapters import HTTPAdapter
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+class WebhookDispatcher:
+    """Send access events to a webhook from a background thread
+
+    ``notify()`` never blocks the frame loop: events go into a bounded
+    queue, and when it is full the overflow policy drops either the oldest
+    or the incoming event. Every ``window_seconds`` the dispatcher coalesces
+    repeated events (same user and outcome) and POSTs one JSON batch over a
+    pooled keep-alive session. Failed batches are retried with exponential
+    backoff.
+    """
+
+    def __init__(self, url, window_seconds=1.0, max_batch=100, max_queue=1000, overflow="drop_oldest",
+                 max_retries=3, backoff_base=0.5, timeout=2.0, session=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        self.url = url
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session = session
+
+        self.events = deque()
+        self.condition = threading.Condition()
+        self.closing = False
+        self.metrics = {"queued": 0, "dropped": 0, "coalesced": 0, "sent_events": 0,
+                        "sent_batches": 0, "retries": 0, "failed_batches": 0, "failed_events": 0}
+        self.latencies = deque(maxlen=1000)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def notify(self, event):
+        """Queue an event dict; returns False if it was dropped"""
+        event = dict(event)
+        event.setdefault("time", datetime.now().isoformat(timespec="seconds"))
+        with self.condition:
+            if len(self.events) >= self.max_queue:
+                self.metrics["dropped"] += 1
+                if self.overflow == "drop_newest":
+                    return False
+                self.events.popleft()
+            self.events.append(event)
+            self.metrics["queued"] += 1
+            self.condition.notify()
+        return True
+
+    @staticmethod
+    def coalesce(events):
+        """Merge events with the same user and outcome into one with a count"""
+        merged = {}
+        for event in events:
+            key = (event.get("user_name"), event.get("success"))
+            if key in merged:
+                existing = merged[key]
+                existing["count"] += 1
+                existing["last_time"] = event["time"]
+                existing["confidence"] = max(existing.get("confidence") or 0, event.get("confidence") or 0)
+            else:
+                merged[key] = dict(event, count=1, first_time=event["time"], last_time=event["time"])
+        return list(merged.values())
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.events and not self.closing:
+                    self.condition.wait()
+                if not self.events and self.closing:
+                    return
+            # Let the window fill so bursts go out as one request
+            if not self.closing:
+                time.sleep(self.window_seconds)
+            with self.condition:
+                events = [self.events.popleft() for _ in range(min(self.max_batch, len(self.events)))]
+            batch = self.coalesce(events)
+            self.metrics["coalesced"] += len(events) - len(batch)
+            self._send(batch, len(events))
+
+    def _send(self, batch, event_count):
+        payload = {"events": batch}
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code < 500 and response.status_code != 429:
+                    self.latencies.append(time.perf_counter() - start)
+                    if response.ok:
+                        self.metrics["sent_batches"] += 1
+                        self.metrics["sent_events"] += event_count
+                        return True
+                    break  # 4xx other than 429 will not succeed on retry
+            except requests.RequestException:
+                pass
+            if attempt < self.max_retries:
+                self.metrics["retries"] += 1
+                delay = self.backoff_base * (2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+        self.metrics["failed_batches"] += 1
+        self.metrics["failed_events"] += event_count
+        return False
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0
+        stats = dict(self.metrics)
+        stats.update({'pending': len(self.events), 'p50_ms': pick(0.5), 'p99_ms': pick(0.99)})
+        return stats
+
+    def close(self, timeout=10.0):
+        """Flush what is queued and stop the dispatcher thread"""
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join(timeout)
+        self.session.close()
+
+def run_stub_server(port=0, fail_rate=0.0):
+    """Local webhook receiver that records batches and fails a fraction of them with 503"""
+    received = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status = 503 if random.random() < fail_rate else 200
+            if status == 200:
+                received.append(json.loads(body))
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=2000, help="synthetic events to send to the stub")
+    ap.add_argument("--fail-rate", type=float, default=0.2, help="fraction of stub responses that are 503")
+    ap.add_argument("--window", type=float, default=0.2, help="coalescing window in seconds")
+    args = ap.parse_args()
+
+    server, received = run_stub_server(fail_rate=args.fail_rate)
+    url = f"http://127.0.0.1:{server.server_address[1]}/hook"
+    dispatcher = WebhookDispatcher(url, window_seconds=args.window, backoff_base=0.05)
+
+    start = time.perf_counter()
+    for i in range(args.events):
+        dispatcher.notify({"user_name": f"user_{i % 5}", "success": i % 3 != 0, "confidence": 0.9})
+    enqueue_ms = (time.perf_counter() - start) * 1000
+    dispatcher.close()
+    server.shutdown()
+
+    stats = dispatcher.stats()
+    delivered = sum(e["count"] for batch in received for e in batch["events"])
+    print(f"[INFO] Enqueued {args.events} events in {enqueue_ms:.1f} ms")
+    print(f"[INFO] Stub received {len(received)} batches covering {delivered} events")
+    print(f"[INFO] Dispatcher stats: {stats}")
+
+if __name__ == "__main__":
+    main()
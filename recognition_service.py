@@ -0,0 +1,315 @@
+import cv2
+import numpy as np
+import json
+import os
+import queue
+import threading
+import time
+import argparse
+import http.client
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gallery import Gallery, GalleryReloader
+
+try:
+    import dlib
+    import face_recognition
+    import face_recognition.api as face_api
+except ImportError:  # /match still works without dlib
+    dlib = None
+    face_recognition = None
+
+ENCODING_DIM = 128
+
+class ServiceBusy(Exception):
+    pass
+
+class MicroBatcher:
+    """Collect concurrent requests into batches for one vectorized call
+
+    A batch is dispatched as soon as it holds ``max_batch_size`` items or
+    the oldest item has waited ``max_wait_ms``, whichever comes first.
+    """
+
+    def __init__(self, process_batch, max_batch_size=16, max_wait_ms=5.0, max_pending=256):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.batches = 0
+        self.items = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item, timeout=10.0):
+        """Queue one item and block until its batch has been processed"""
+        future = Future()
+        try:
+            self.pending.put_nowait((item, future))
+        except queue.Full:
+            raise ServiceBusy("too many pending requests")
+        return future.result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0,
+            'pending': self.pending.qsize()
+        }
+
+class NoFaceFound(ValueError):
+    pass
+
+_detectors = threading.local()
+
+def find_face(image):
+    """(x, y, w, h) of the largest face in a BGR image; detection runs in the request's own thread"""
+    cascade = getattr(_detectors, "cascade", None)
+    if cascade is None:
+        # One classifier per handler thread; OpenCV does not promise detectMultiScale is thread-safe
+        cascade = _detectors.cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    if len(faces) == 0:
+        raise NoFaceFound("no face found in image")
+    return tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+
+def encode_faces_batch(items):
+    """128-d encodings for (rgb image, face box) pairs, computed in a single dlib call where supported"""
+    rgb_images = [rgb for rgb, _ in items]
+    shapes = []
+    for rgb, (x, y, w, h) in items:
+        detections = dlib.full_object_detections()
+        detections.append(face_api.pose_predictor_5_point(rgb, dlib.rectangle(x, y, x + w - 1, y + h - 1)))
+        shapes.append(detections)
+    try:
+        descriptors = face_api.face_encoder.compute_face_descriptor(rgb_images, shapes, 1)
+        return [np.array(d[0]) for d in descriptors]
+    except (TypeError, RuntimeError):
+        # Older dlib builds have no batched overload
+        return [np.array(face_api.face_encoder.compute_face_descriptor(rgb, s[0], 1))
+                for rgb, s in zip(rgb_images, shapes)]
+
+class RecognitionService:
+    """Encoding and gallery matching behind two micro-batched entry points"""
+
+    def __init__(self, encodings_path="encodings.pickle", tolerance=0.6, max_batch_size=16,
+                 max_wait_ms=5.0, max_pending=256, precision="float32"):
+        self.tolerance = tolerance
+        build = lambda path: Gallery.from_file(path, precision=precision)
+        self.reloader = GalleryReloader(encodings_path, build,
+                                        build(encodings_path) if os.path.exists(encodings_path) else None)
+        self.match_batcher = MicroBatcher(self._match_batch, max_batch_size, max_wait_ms, max_pending)
+        self.image_batcher = MicroBatcher(self._recognize_batch, max_batch_size, max_wait_ms, max_pending)
+
+    def _match_batch(self, encodings):
+        gallery = self.reloader.swap()
+        if gallery is None or len(gallery) == 0:
+            return [{"name": "Unknown Person", "distance": None, "confidence": 0.0} for _ in encodings]
+        indices, distances = gallery.search(np.array(encodings), k=1)
+        results = []
+        for index, distance in zip(indices[:, 0], distances[:, 0]):
+            name = gallery.names[index] if distance <= self.tolerance else "Unknown Person"
+            results.append({"name": name, "distance": float(distance),
+                            "confidence": max(0.0, 1.0 - float(distance))})
+        return results
+
+    def _recognize_batch(self, items):
+        results = self._match_batch(encode_faces_batch(items))
+        for result, (_, box) in zip(results, items):
+            result["face"] = list(box)
+        return results
+
+    def match(self, encoding):
+        # Checked here so a malformed request fails alone instead of its whole batch
+        try:
+            encoding = np.asarray(encoding, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError(f"encoding must be a list of {ENCODING_DIM} numbers")
+        if encoding.shape != (ENCODING_DIM,) or not np.isfinite(encoding).all():
+            raise ValueError(f"encoding must be {ENCODING_DIM} finite numbers")
+        return self.match_batcher.submit(encoding)
+
+    def recognize(self, image_bytes):
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("could not decode image")
+        # Detected per request, so an image without a face fails alone instead of its batch
+        box = find_face(image)
+        return self.image_batcher.submit((cv2.cvtColor(image, cv2.COLOR_BGR2RGB), box))
+
+def make_handler(service, slots):
+    class RecognitionHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive connections
+        # Headers and body go out in separate writes; with Nagle on, the body waits for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass  # one line per request would dominate at high rates
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._reply(200, {"match": service.match_batcher.stats(),
+                                  "recognize": service.image_batcher.stats()})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not slots.acquire(blocking=False):
+                self._reply(503, {"error": "server busy"})
+                return
+            try:
+                if self.path == "/match":
+                    self._reply(200, service.match(json.loads(body)["encoding"]))
+                elif self.path == "/recognize":
+                    if face_recognition is None:
+                        self._reply(501, {"error": "face_recognition is not installed"})
+                    else:
+                        self._reply(200, service.recognize(body))
+                else:
+                    self._reply(404, {"error": "not found"})
+            except ServiceBusy as e:
+                self._reply(503, {"error": str(e)})
+            except NoFaceFound as e:
+                self._reply(422, {"error": str(e)})
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(400, {"error": str(e)})
+            except FutureTimeout:
+                self._reply(504, {"error": "timed out waiting for the batch"})
+            except Exception as e:
+                # Every request gets an answer, even when its batch failed
+                print(f"[ERROR] {self.path} failed: {e}")
+                self._reply(500, {"error": "internal error"})
+            finally:
+                slots.release()
+
+    return RecognitionHandler
+
+def serve(service, host="127.0.0.1", port=8765, max_concurrency=64):
+    server = ThreadingHTTPServer((host, port), make_handler(service, threading.BoundedSemaphore(max_concurrency)))
+    server.daemon_threads = True
+    return server
+
+def run_load(host, port, path, payload, clients=16, requests_per_client=200, content_type="application/json"):
+    """Drive the service from concurrent keep-alive clients and report latency percentiles"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(host, port)
+        local = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            conn.request("POST", path, body=payload, headers={"Content-Type": content_type})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                local.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-e", "--encodings", default="encodings.pickle",
+                   help="path to serialized db of facial encodings")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--max-batch", type=int, default=16, help="largest batch per encode/match call")
+    ap.add_argument("--max-wait-ms", type=float, default=5.0, help="longest time a request waits for its batch")
+    ap.add_argument("--max-concurrency", type=int, default=64, help="requests handled at once before 503")
+    ap.add_argument("--bench", action="store_true",
+                   help="start the service on loopback and run the built-in load generator against it")
+    ap.add_argument("--bench-image", default=None,
+                   help="face image to POST to /recognize (default: random encodings to /match)")
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=200, help="requests per client")
+    args = ap.parse_args()
+
+    service = RecognitionService(args.encodings, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+    server = serve(service, port=args.port, max_concurrency=args.max_concurrency)
+    print(f"[INFO] Recognition service listening on http://127.0.0.1:{server.server_address[1]}")
+
+    if not args.bench:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n[INFO] Stopping service...")
+        return
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if args.bench_image:
+        with open(args.bench_image, "rb") as f:
+            path, payload, content_type = "/recognize", f.read(), "application/octet-stream"
+    else:
+        encoding = np.random.default_rng(0).normal(0, 0.1, 128).tolist()
+        path, payload, content_type = "/match", json.dumps({"encoding": encoding}).encode(), "application/json"
+
+    report = run_load("127.0.0.1", server.server_address[1], path, payload,
+                      args.clients, args.requests, content_type)
+    stats = service.image_batcher.stats() if args.bench_image else service.match_batcher.stats()
+    server.shutdown()
+
+    print(f"\n=== LOAD TEST [{path}] ===")
+    print(f"Requests: {report['requests']} ({report['errors']} errors)")
+    print(f"Throughput: {report['throughput']:.0f} req/s")
+    print(f"Latency p50: {report['p50_ms']:.2f} ms, p99: {report['p99_ms']:.2f} ms")
+    print(f"Mean batch size: {stats['mean_batch_size']:.1f}")
+
+if __name__ == "__main__":
+    main()
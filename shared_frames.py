@@ -0,0 +1,100 @@
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+def attach_shared_memory(name):
+    """Open an existing block without letting this process's exit unlink it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers attached blocks with the resource
+        # tracker, which would unlink them when a worker exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class SharedFrameRing:
+    """Ring of preallocated frame slots in shared memory.
+
+    A capture process writes each frame once into the next slot and hands
+    workers only the slot's sequence number. Workers attach to the same
+    block by name and read NumPy views of the slot without copying.
+    """
+
+    def __init__(self, frame_shape, slots=8, dtype=np.uint8, name=None):
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+
+        header_bytes = 8 * (slots + 1)
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + frame_bytes * slots)
+        else:
+            self.shm = attach_shared_memory(name)
+
+        # header[0] is the last committed sequence number, header[1 + i] the
+        # sequence currently held by slot i (-1 while it is being written)
+        self.header = np.ndarray((slots + 1,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((slots,) + self.frame_shape, dtype=self.dtype,
+                                 buffer=self.shm.buf, offset=header_bytes)
+        if self.owner:
+            self.header[:] = -1
+            self.next_seq = 0
+
+    @property
+    def spec(self):
+        """Picklable description used by workers to attach to this ring"""
+        return {"name": self.shm.name, "frame_shape": self.frame_shape,
+                "slots": self.slots, "dtype": self.dtype.str}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec["frame_shape"], spec["slots"], spec["dtype"], name=spec["name"])
+
+    def acquire(self):
+        """Reserve the next slot and return (seq, writable view)
+
+        Pass the view to ``cap.read(view)`` so the decoder writes straight
+        into shared memory, then call ``commit(seq)``.
+        """
+        seq = self.next_seq
+        self.next_seq += 1
+        slot = seq % self.slots
+        self.header[1 + slot] = -1
+        return seq, self.frames[slot]
+
+    def commit(self, seq):
+        self.header[1 + seq % self.slots] = seq
+        self.header[0] = seq
+
+    def write(self, frame):
+        """Copy a frame that was not decoded in place into the next slot"""
+        seq, view = self.acquire()
+        np.copyto(view, frame)
+        self.commit(seq)
+        return seq
+
+    def is_current(self, seq):
+        """True while the slot still holds frame ``seq``"""
+        return self.header[1 + seq % self.slots] == seq
+
+    def read(self, seq):
+        """Return a read-only view of frame ``seq``, or None if it was overwritten"""
+        if not self.is_current(seq):
+            return None
+        view = self.frames[seq % self.slots].view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def latest_seq(self):
+        return int(self.header[0])
+
+    def close(self):
+        # Drop our views before closing, otherwise the buffer stays exported
+        self.header = None
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,314 @@
+import numpy as np
+import os
+import sys
+import csv
+import time
+import tempfile
+import argparse
+import contextlib
+import tracemalloc
+from frame_sources import SyntheticSource
+from headless_face_detection import HeadlessFaceAccessControl
+from utils import get_rss_bytes
+
+# Methods of HeadlessFaceAccessControl timed as pipeline stages
+TIMED_METHODS = ("detect_faces", "identify_faces", "recognize_faces", "save_detected_face", "log_access_attempt")
+# Latency drift is judged relative to at least this p50, so microsecond stages do not fail on jitter
+LATENCY_FLOOR_MS = 0.1
+
+def count_open_fds():
+    """Open file descriptors of this process, or None where they cannot be listed"""
+    for path in ('/proc/self/fd', '/dev/fd'):
+        try:
+            # The listing itself holds one descriptor open
+            return len(os.listdir(path)) - 1
+        except OSError:
+            continue
+    return None
+
+def directory_usage(path):
+    """(files, bytes) directly inside path"""
+    files, size = 0, 0
+    if not os.path.isdir(path):
+        return files, size
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                files += 1
+                size += entry.stat().st_size
+    return files, size
+
+class StageTimer:
+    """Latencies per pipeline stage, collected between two ``summary()`` calls"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, obj, method):
+        """Time every call of obj.method; the instance attribute shadows the class method"""
+        original = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(method, time.perf_counter() - start)
+
+        setattr(obj, method, timed)
+
+    def summary(self):
+        """{stage: (p50 ms, p95 ms, calls)} since the last call"""
+        result = {}
+        for stage, samples in self.samples.items():
+            if samples:
+                ms = np.array(samples) * 1000
+                result[stage] = (float(np.percentile(ms, 50)), float(np.percentile(ms, 95)), len(samples))
+        self.samples = {}
+        return result
+
+def top_allocations(snapshot, baseline, limit=10):
+    """Source lines whose traced memory grew most since the baseline snapshot"""
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+    diff = snapshot.filter_traces(filters).compare_to(baseline.filter_traces(filters), 'lineno')
+    return [stat for stat in diff if stat.size_diff > 0][:limit]
+
+def fit_slope(xs, ys):
+    """Least-squares (slope, intercept) of ys over xs, ignoring missing values"""
+    points = [(x, y) for x, y in zip(xs, ys) if y is not None]
+    if len(points) < 3 or points[-1][0] <= points[0][0]:
+        return None
+    x, y = np.array(points, dtype=np.float64).T
+    slope, intercept = np.polyfit(x, y, 1)
+    return float(slope), float(intercept)
+
+def check_drift(samples, limits, latency_limit):
+    """(metric, slope, limit, unit) for each metric whose slope per simulated hour exceeds its limit
+
+    Memory and descriptor limits are absolute; latency limits are a
+    percentage of the stage's fitted starting p50, so one setting fits fast
+    and slow hardware alike.
+    """
+    hours = [s["sim_hours"] for s in samples]
+    failures = []
+    for metric, (limit, unit) in limits.items():
+        fit = fit_slope(hours, [s.get(metric) for s in samples])
+        if fit is not None and fit[0] > limit:
+            failures.append((metric, fit[0], limit, unit))
+    stages = sorted({k for s in samples for k in s if k.endswith("_p50_ms")})
+    for metric in stages:
+        fit = fit_slope(hours, [s.get(metric) for s in samples])
+        if fit is None:
+            continue
+        relative = fit[0] / max(fit[1], LATENCY_FLOOR_MS) * 100
+        if relative > latency_limit:
+            failures.append((metric, relative, latency_limit, "%/h"))
+    return failures
+
+def take_sample(system, timer, started, frame_count, fps):
+    sample = {
+        "elapsed_s": round(time.monotonic() - started, 1),
+        "frames": frame_count,
+        "sim_hours": frame_count / fps / 3600,
+        "rss_mb": get_rss_bytes() / 1024 / 1024,
+        "fds": count_open_fds(),
+        "traced_mb": tracemalloc.get_traced_memory()[0] / 1024 / 1024 if tracemalloc.is_tracing() else None,
+        "access_attempts": system.access_count
+    }
+    files, size = directory_usage(system.config["unknown_faces_dir"])
+    sample["unknown_faces_files"] = files
+    sample["unknown_faces_mb"] = size / 1024 / 1024
+    sample["database_mb"] = sum(os.path.getsize(p) for p in ("access_logs.db", "access_logs.db-wal")
+                                if os.path.exists(p)) / 1024 / 1024
+    for stage, (p50, p95, calls) in timer.summary().items():
+        sample[f"{stage}_p50_ms"] = p50
+        sample[f"{stage}_p95_ms"] = p95
+        sample[f"{stage}_calls"] = calls
+    return sample
+
+def print_sample(sample):
+    traced = f", traced {sample['traced_mb']:.1f} MB" if sample["traced_mb"] is not None else ""
+    print(f"[INFO] {sample['elapsed_s']:.0f}s, {sample['frames']} frames ({sample['sim_hours']:.2f} simulated h): "
+          f"RSS {sample['rss_mb']:.1f} MB{traced}, {sample['fds']} fds, "
+          f"frame p50 {sample.get('frame_p50_ms', 0):.2f} ms / p95 {sample.get('frame_p95_ms', 0):.2f} ms, "
+          f"{sample['unknown_faces_files']} saved crops")
+
+def write_samples_csv(path, samples):
+    columns = []
+    for sample in samples:
+        columns += [k for k in sample if k not in columns]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(samples)
+
+def run_soak(system, source, duration, sample_interval, warmup, speed=0, top=10, quiet=True):
+    """Feed source frames through process_frame, sampling resources and stage latency
+
+    Returns the samples taken after ``warmup`` seconds and the tracemalloc
+    growth since the first of them.
+    """
+    timer = StageTimer()
+    for method in TIMED_METHODS:
+        timer.wrap(system, method)
+    if system.clip_recorder is not None:
+        timer.wrap(system.clip_recorder, "add_frame")
+
+    frame_count = 0
+    samples = []
+    baseline = None
+    growth = []
+    started = time.monotonic()
+    next_sample = started + sample_interval
+    # log_access_attempt prints every decision; at accelerated rates that is mostly terminal time
+    devnull = open(os.devnull, "w")
+    output = contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext()
+    try:
+        while time.monotonic() - started < duration:
+            start = time.perf_counter()
+            ret, frame = source.read()
+            timer.record("read", time.perf_counter() - start)
+            if not ret:
+                print("[INFO] End of source")
+                break
+
+            start = time.perf_counter()
+            with output:
+                system.process_frame(frame, frame_count)
+            analyzed = frame_count % system.config["process_interval"] == 0
+            timer.record("frame" if analyzed else "skipped_frame", time.perf_counter() - start)
+            frame_count += 1
+
+            if speed:
+                # Pace to speed x the source frame rate
+                due = started + frame_count / (source.fps * speed)
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            now = time.monotonic()
+            if now < next_sample:
+                continue
+            next_sample = now + sample_interval
+            sample = take_sample(system, timer, started, frame_count, source.fps)
+            print_sample(sample)
+            if sample["elapsed_s"] < warmup:
+                continue
+            samples.append(sample)
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                if baseline is None:
+                    baseline = snapshot
+                else:
+                    growth = top_allocations(snapshot, baseline, top)
+                    for stat in growth[:3]:
+                        print(f"       +{stat.size_diff / 1024:.0f} KB {stat.traceback}")
+    except KeyboardInterrupt:
+        print("\n[INFO] Stopping soak test early...")
+    finally:
+        devnull.close()
+    return samples, growth, frame_count
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--duration", type=float, default=2.0, help="hours to run")
+    ap.add_argument("--speed", type=float, default=0,
+                   help="pace to this multiple of the source frame rate (default: as fast as possible)")
+    ap.add_argument("--fps", type=float, default=30.0,
+                   help="frame rate being simulated; slopes are per simulated hour at this rate")
+    ap.add_argument("--frame-size", default="1280x720")
+    ap.add_argument("--max-faces", type=int, default=3)
+    ap.add_argument("--dataset", default="datasets", help="faces shown by the synthetic source")
+    ap.add_argument("--sample-interval", type=float, default=60, help="seconds between samples")
+    ap.add_argument("--warmup", type=float, default=300,
+                   help="seconds before samples count towards drift (caches and pools fill up first)")
+    ap.add_argument("--workdir", default=None,
+                   help="directory for the soak run's database and crops (default: a new temp dir)")
+    ap.add_argument("--max-rss-slope", type=float, default=8.0, help="MB per simulated hour")
+    ap.add_argument("--max-traced-slope", type=float, default=4.0, help="MB per simulated hour")
+    ap.add_argument("--max-fd-slope", type=float, default=0.5, help="descriptors per simulated hour")
+    ap.add_argument("--max-latency-slope", type=float, default=10.0,
+                   help="percent of the starting p50 per simulated hour, for every stage")
+    ap.add_argument("--no-tracemalloc", action="store_true",
+                   help="skip allocation tracing (it slows allocation-heavy code noticeably)")
+    ap.add_argument("--top", type=int, default=10, help="growing allocation sites to report")
+    ap.add_argument("--csv", default=None, help="write all samples to this CSV file")
+    ap.add_argument("-v", "--verbose", action="store_true", help="show the pipeline's own output")
+    args = ap.parse_args()
+
+    width, height = (int(v) for v in args.frame_size.lower().split("x"))
+    dataset_dir = os.path.abspath(args.dataset)
+    csv_path = os.path.abspath(args.csv) if args.csv else None
+    config = HeadlessFaceAccessControl.load_config()
+    config["encodings_path"] = os.path.abspath(config.get("encodings_path", "encodings.pickle"))
+    # Never post thousands of synthetic events to a real endpoint
+    config["webhook_url"] = ""
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="soak_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    if os.path.isdir(dataset_dir) and not os.path.exists("datasets"):
+        try:
+            os.symlink(dataset_dir, "datasets", target_is_directory=True)
+        except OSError:
+            print("[WARNING] Could not link datasets/ into the work directory; running detection only")
+    print(f"[INFO] Soak test working in {workdir}")
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    source = SyntheticSource(dataset_dir, frame_size=(width, height), fps=args.fps, max_faces=args.max_faces)
+    system = HeadlessFaceAccessControl(config)
+    duration = args.duration * 3600
+    print(f"[INFO] Running for {args.duration:g} h at "
+          f"{f'{args.speed:g}x' if args.speed else 'full'} speed, sampling every {args.sample_interval:g} s")
+
+    try:
+        samples, growth, frame_count = run_soak(system, source, duration, args.sample_interval, args.warmup,
+                                                args.speed, args.top, quiet=not args.verbose)
+    finally:
+        source.release()
+        if system.clip_recorder is not None:
+            system.clip_recorder.close()
+        if system.tiled_detector is not None:
+            system.tiled_detector.close()
+
+    if csv_path:
+        write_samples_csv(csv_path, samples)
+        print(f"[INFO] Samples written to {csv_path}")
+
+    print("\n=== SOAK RESULT ===")
+    print(f"Frames: {frame_count} ({frame_count / args.fps / 3600:.2f} simulated h), "
+          f"access attempts: {system.access_count}")
+    if growth:
+        print("Largest allocation growth since warm-up:")
+        for stat in growth:
+            print(f"  +{stat.size_diff / 1024:.0f} KB ({stat.count_diff:+d} blocks) {stat.traceback}")
+    if len(samples) < 3:
+        print("[ERROR] Fewer than 3 samples after warm-up; run longer or sample more often")
+        sys.exit(2)
+
+    limits = {
+        "rss_mb": (args.max_rss_slope, "MB/h"),
+        "traced_mb": (args.max_traced_slope, "MB/h"),
+        "fds": (args.max_fd_slope, "fds/h")
+    }
+    hours = [s["sim_hours"] for s in samples]
+    for metric in ("rss_mb", "traced_mb", "fds", "unknown_faces_mb", "database_mb", "frame_p50_ms"):
+        values = [s.get(metric) for s in samples]
+        fit = fit_slope(hours, values)
+        if fit is not None:
+            latest = next(v for v in reversed(values) if v is not None)
+            print(f"{metric}: {latest:.2f} now, {fit[0]:+.3f} per simulated hour")
+
+    failures = check_drift(samples, limits, args.max_latency_slope)
+    for metric, slope, limit, unit in failures:
+        print(f"[ERROR] {metric} drifts {slope:+.3f} {unit} (limit {limit:g} {unit})")
+    if failures:
+        sys.exit(1)
+    print("[SUCCESS] No metric drifted beyond its limit")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
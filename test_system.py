@@ -1,13 +1,15 @@
 import cv2
 import os
 import time
+import argparse
+from frame_sources import open_source
 
-def test_camera_and_detection():
+def test_camera_and_detection(source=0):
     """Simple test to verify camera and face detection work"""
     print("=== Testing Camera and Face Detection ===")
     
-    # Test camera
-    cap = cv2.VideoCapture(0)
+    # Test camera (or a video file, image directory or synthetic source)
+    cap = open_source(source)
     if not cap.isOpened():
         print("❌ ERROR: Cannot open camera")
         return False
@@ -34,7 +36,8 @@ def test_camera_and_detection():
             cap.release()
             return True
         
-        time.sleep(0.5)
+        if cap.live:
+            time.sleep(0.5)
     
     cap.release()
     print("❌ No faces detected in test frames")
@@ -51,7 +54,12 @@ def check_directories():
             print(f"❌ {dir_name}/ directory missing")
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-s", "--source", default=0,
+                   help="camera index, stream URL, video file, image directory or 'synthetic'")
+    args = ap.parse_args()
+    
     print("System Diagnostic Check\n")
     check_directories()
     print("\nTesting camera and face detection...")
-    test_camera_and_detection()
\ No newline at end of file
+    test_camera_and_detection(args.source)
\ No newline at end of file
@@ -0,0 +1,185 @@
+import cv2
+import numpy as np
+import math
+import os
+import threading
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+def plan_tiles(width, height, tile_size, overlap):
+    """(x, y, w, h) tiles covering the frame, neighbours sharing ``overlap`` pixels"""
+    stride = max(1, tile_size - overlap)
+    xs = list(range(0, max(1, width - overlap), stride))
+    ys = list(range(0, max(1, height - overlap), stride))
+    tiles = []
+    for y in ys:
+        for x in xs:
+            tiles.append((x, y, min(tile_size, width - x), min(tile_size, height - y)))
+    return tiles
+
+def auto_tile_size(width, height, overlap, workers):
+    """Tile side giving about one tile per worker, never smaller than three overlaps"""
+    cols = max(1, round(math.sqrt(workers * width / height)))
+    rows = max(1, math.ceil(workers / cols))
+    side = max(math.ceil(width / cols), math.ceil(height / rows)) + overlap
+    return max(side, 3 * overlap)
+
+def _overlaps(boxes, i, rest):
+    """Intersection areas between box ``i`` and the boxes in ``rest``"""
+    w = np.minimum(boxes[i, 0] + boxes[i, 2], boxes[rest, 0] + boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0])
+    h = np.minimum(boxes[i, 1] + boxes[i, 3], boxes[rest, 1] + boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1])
+    return np.clip(w, 0, None) * np.clip(h, 0, None)
+
+def non_max_suppression(boxes, scores, iou_threshold=0.3, containment=0.7):
+    """Greedy NMS over (x, y, w, h) boxes, highest score first
+
+    Afterwards any box lying mostly inside a larger kept box is dropped,
+    which removes the partial faces cascades report at tile edges.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    boxes = boxes.astype(np.float64)
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter = _overlaps(boxes, i, rest)
+        order = rest[inter / (areas[i] + areas[rest] - inter) <= iou_threshold]
+
+    keep = sorted(keep, key=lambda i: -areas[i])
+    final = []
+    for n, i in enumerate(keep):
+        larger = np.array(keep[:n], dtype=np.int64)
+        if n == 0 or np.all(_overlaps(boxes, i, larger) / areas[i] <= containment):
+            final.append(i)
+    return np.array(sorted(final), dtype=np.int64)
+
+class TiledDetector:
+    """Haar cascade detection split over overlapping tiles in a thread pool
+
+    OpenCV releases the GIL inside ``detectMultiScale``, so tiles run on all
+    cores. Tiles only look for faces up to ``overlap`` pixels, which is what
+    guarantees every such face lies wholly inside some tile; faces larger
+    than the overlap are found by one extra pass over the frame downscaled
+    so they appear at ``min_size``. Results are merged with NMS, using the
+    cascade's neighbour counts as scores.
+    """
+
+    def __init__(self, cascade_path=CASCADE_PATH, scale_factor=1.1, min_neighbors=5, min_size=(30, 30),
+                 tile_size=0, overlap=0, workers=0):
+        self.cascade_path = cascade_path
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = tuple(min_size)
+        self.workers = workers or os.cpu_count() or 1
+        # Default overlap: faces up to 4x the minimum size are handled by the tiles
+        self.overlap = overlap or 4 * max(self.min_size)
+        self.tile_size = tile_size
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tile")
+        self._plans = {}
+
+    def _cascade(self):
+        # CascadeClassifier is not safe to share between threads
+        cascade = getattr(self.local, "cascade", None)
+        if cascade is None:
+            cascade = self.local.cascade = cv2.CascadeClassifier(self.cascade_path)
+        return cascade
+
+    def _plan(self, width, height):
+        plan = self._plans.get((width, height))
+        if plan is None:
+            tile_size = self.tile_size or auto_tile_size(width, height, self.overlap, self.workers)
+            plan = self._plans[(width, height)] = plan_tiles(width, height, tile_size, self.overlap)
+        return plan
+
+    def _detect_tile(self, gray, tile):
+        x, y, w, h = tile
+        boxes, neighbours = self._cascade().detectMultiScale2(
+            gray[y:y+h, x:x+w],
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=self.min_size,
+            maxSize=(self.overlap, self.overlap)
+        )
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        boxes[:, 0] += x
+        boxes[:, 1] += y
+        return boxes, np.asarray(neighbours, dtype=np.float64).reshape(-1)
+
+    def _detect_large(self, gray):
+        # Faces above the overlap size, searched at a scale where they start at min_size
+        scale = max(self.min_size) / self.overlap
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        boxes, neighbours = self._cascade().detectMultiScale2(
+            small,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=self.min_size
+        )
+        boxes = np.round(np.asarray(boxes, dtype=np.float64).reshape(-1, 4) / scale).astype(np.int32)
+        return boxes, np.asarray(neighbours, dtype=np.float64).reshape(-1)
+
+    def detect(self, gray):
+        """Face boxes as an (N, 4) int32 array of x, y, w, h"""
+        height, width = gray.shape[:2]
+        futures = [self.pool.submit(self._detect_large, gray)]
+        futures += [self.pool.submit(self._detect_tile, gray, tile) for tile in self._plan(width, height)]
+        results = [future.result() for future in futures]
+        boxes = np.concatenate([r[0] for r in results])
+        scores = np.concatenate([r[1] for r in results])
+        return boxes[non_max_suppression(boxes, scores)]
+
+    def describe(self, width, height):
+        plan = self._plan(width, height)
+        return {'tiles': len(plan), 'tile_size': max(max(t[2], t[3]) for t in plan),
+                'overlap': self.overlap, 'workers': self.workers}
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--image", default=None, help="frame to benchmark (default: synthetic 4K noise)")
+    ap.add_argument("--workers", type=int, default=0, help="detection threads (default: all cores)")
+    ap.add_argument("--tile-size", type=int, default=0, help="tile side in pixels (default: automatic)")
+    ap.add_argument("--overlap", type=int, default=0, help="tile overlap in pixels (default: 4x min face size)")
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    if args.image:
+        frame = cv2.imread(args.image)
+        if frame is None:
+            print(f"[ERROR] Could not read {args.image}")
+            return
+    else:
+        frame = np.random.default_rng(0).integers(0, 256, (2160, 3840, 3), dtype=np.uint8)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    cascade = cv2.CascadeClassifier(CASCADE_PATH)
+    detector = TiledDetector(tile_size=args.tile_size, overlap=args.overlap, workers=args.workers)
+    print(f"[INFO] Frame {gray.shape[1]}x{gray.shape[0]}, plan: {detector.describe(gray.shape[1], gray.shape[0])}")
+
+    def timed(detect):
+        detect()  # warm-up
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            found = detect()
+        return (time.perf_counter() - start) / args.runs * 1000, len(found)
+
+    single_ms, single_faces = timed(lambda: cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                                                     minSize=(30, 30)))
+    tiled_ms, tiled_faces = timed(lambda: detector.detect(gray))
+    detector.close()
+
+    print(f"Single pass: {single_ms:.1f} ms/frame, {single_faces} faces")
+    print(f"Tiled:       {tiled_ms:.1f} ms/frame, {tiled_faces} faces ({single_ms / tiled_ms:.2f}x)")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -2,6 +2,7 @@ import cv2
 import os
 import numpy as np
 import pickle
+from enrollment import AsyncImageWriter, DiversitySelector
 
 def collect_training_images():
     """Collect face images for training"""
@@ -17,16 +18,23 @@ def collect_training_images():
     # Initialize camera
     cap = cv2.VideoCapture(0)
     count = 0
-    max_images = 50  # Collect 50 images
+    max_images = 50  # Upper bound; similar-looking frames are skipped
+    idle_timeout = 3.0
+    selector = DiversitySelector(max_samples=max_images, idle_timeout=idle_timeout)
+    writer = AsyncImageWriter()
     
-    print(f"[INFO] Collecting {max_images} images for {person_name}")
+    print(f"[INFO] Collecting up to {max_images} images for {person_name}")
     print("[INFO] Look at the camera and move your head slightly")
     print("[INFO] Press 'q' to stop early")
     
-    while count < max_images:
+    while not selector.full:
         ret, frame = cap.read()
         if not ret:
             break
+        
+        if selector.idle:
+            print("[INFO] No new poses or lighting for a while, finishing")
+            break
             
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
@@ -34,24 +42,21 @@ def collect_training_images():
         faces = face_cascade.detectMultiScale(gray, 1.3, 5)
         
         for (x, y, w, h) in faces:
-            # Save face
-            face_img = gray[y:y+h, x:x+w]
-            
-            # Resize to consistent size
-            face_img = cv2.resize(face_img, (200, 200))
-            
-            # Save image
-            filename = f"{person_dir}/{count}.jpg"
-            cv2.imwrite(filename, face_img)
-            count += 1
+            # Save face only if it differs from what we already have
+            action, index = selector.consider(gray, (x, y, w, h))
+            if action is not None:
+                # Resize to consistent size
+                face_img = cv2.resize(gray[y:y+h, x:x+w], (200, 200))
+                
+                # Save image in the background; replacements overwrite the duplicate
+                writer.write(f"{person_dir}/{index}.jpg", face_img)
+                if action == "add":
+                    count += 1
             
             # Draw rectangle
             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
             cv2.putText(frame, f"Captured: {count}/{max_images}", (10, 30), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            
-            # Small delay
-            cv2.waitKey(100)
         
         cv2.imshow("Collecting Training Data", frame)
         
@@ -59,8 +64,11 @@ def collect_training_images():
             break
     
     cap.release()
+    writer.close()
     cv2.destroyAllWindows()
     print(f"[INFO] Collected {count} images for {person_name}")
+    if 0 < count and not selector.enough:
+        print(f"[WARNING] Fewer than {selector.min_samples} images; recognition may be unreliable")
 
 def train_recognizer():
     """Train the face recognizer with collected data"""
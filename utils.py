@@ -1,7 +1,6 @@
-import sqlite3
-from datetime import datetime, timedelta
 import json
 import os
+from access_stats import get_stats_engine
 
 def setup_directories():
     """Create all necessary directories"""
@@ -12,36 +11,8 @@ def setup_directories():
 
 def get_access_stats(hours=24):
     """Get access statistics for the last N hours"""
-    conn = sqlite3.connect('access_logs.db')
-    
-    time_threshold = datetime.now() - timedelta(hours=hours)
-    
-    stats = conn.execute('''
-        SELECT 
-            COUNT(*) as total_attempts,
-            SUM(success) as successful_attempts,
-            AVG(confidence) as avg_confidence
-        FROM access_logs 
-        WHERE access_time > ?
-    ''', (time_threshold,)).fetchone()
-    
-    # Get unknown face count
-    unknown_count = conn.execute('''
-        SELECT COUNT(*) FROM access_logs 
-        WHERE user_name = 'Unknown' 
-        AND access_time > ?
-    ''', (time_threshold,)).fetchone()
-    
-    conn.close()
-    
-    return {
-        'total_attempts': stats[0] or 0,
-        'successful_attempts': stats[1] or 0,
-        'failed_attempts': (stats[0] or 0) - (stats[1] or 0),
-        'unknown_faces': unknown_count[0] or 0,
-        'success_rate': (stats[1] / stats[0] * 100) if stats[0] else 0,
-        'avg_confidence': stats[2] or 0
-    }
+    stats = get_stats_engine().last_hours(hours)
+    return {key: value for key, value in stats.items() if key != 'per_user'}
 
 def list_known_persons():
     """List all known persons in the dataset"""
@@ -55,4 +26,15 @@ def list_known_persons():
                              if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
             persons.append({"name": item, "image_count": image_count})
     
-    return persons
\ No newline at end of file
+    return persons
+
+def get_rss_bytes():
+    """Resident set size of this process in bytes (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024